@@ -0,0 +1,90 @@
+"""
+Dispatch latency of dynamic APIs at 10, 1k and 10k registered routes.
+
+Compares the dispatch table used by main.py (dict for literal paths + segment
+trie for path templates) with a linear scan over Starlette routes, which is
+how routes registered directly on the FastAPI app are matched.
+
+Run from the repository root:
+    python benchmarks/dispatch_benchmark.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from starlette.routing import Match, Route
+
+import main
+
+ROUTE_COUNTS = [10, 1000, 10000]
+LOOKUPS = 20000
+
+
+async def handler(request):
+    return None
+
+
+def build_routes(count):
+    """Half literal paths, half templates - like a fleet of per-resource APIs"""
+    routes = []
+    for i in range(count):
+        if i % 2:
+            routes.append(("GET", f"/api/service{i}/items/{{item_id}}"))
+        else:
+            routes.append(("POST", f"/api/service{i}/sync"))
+    return routes
+
+
+def sample_paths(routes, count):
+    paths = []
+    for method, path in random.choices(routes, k=count):
+        paths.append((method, path.replace("{item_id}", str(random.randint(1, 10 ** 6)))))
+    return paths
+
+
+def bench_index(routes, paths):
+    literal = {}
+    index = main.RouteIndex()
+    for method, path in routes:
+        if main.is_path_template(path):
+            index.add(method, path, handler)
+        else:
+            literal[(method, path)] = handler
+
+    start = time.perf_counter()
+    for method, path in paths:
+        if literal.get((method, path)) is None:
+            assert index.match(method, path) is not None
+    return (time.perf_counter() - start) / len(paths) * 1e6
+
+
+def bench_linear_scan(routes, paths):
+    starlette_routes = [Route(path, handler, methods=[method]) for method, path in routes]
+
+    start = time.perf_counter()
+    for method, path in paths:
+        scope = {"type": "http", "method": method, "path": path}
+        for route in starlette_routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                break
+    return (time.perf_counter() - start) / len(paths) * 1e6
+
+
+def run():
+    random.seed(0)
+    print(f"{'routes':>8} {'index (us/lookup)':>20} {'linear scan (us/lookup)':>25}")
+    for count in ROUTE_COUNTS:
+        routes = build_routes(count)
+        paths = sample_paths(routes, LOOKUPS)
+        # The linear scan is slow at 10k routes - fewer lookups keep the run short
+        scan_paths = paths[:max(200, LOOKUPS * 10 // count)]
+        print(f"{count:>8} {bench_index(routes, paths):>20.2f} {bench_linear_scan(routes, scan_paths):>25.2f}")
+
+
+if __name__ == "__main__":
+    run()
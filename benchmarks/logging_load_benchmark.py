@@ -0,0 +1,103 @@
+"""
+Throughput and latency of a print-heavy dynamic API under concurrent clients.
+
+Every call writes a log entry and streams its prints into it, so this
+measures the request path together with the background log writer. Creates
+a temporary API on a running server, calls it from CLIENTS threads for
+DURATION seconds, prints requests/s, latency percentiles and the
+log_writer stats, then deletes the API.
+
+Start the server, then run from the repository root:
+    python benchmarks/logging_load_benchmark.py
+
+Settings (environment): BENCH_URL (default http://localhost:8000),
+BENCH_USERNAME / BENCH_PASSWORD (default: the admin account in main.py),
+BENCH_CLIENTS (20), BENCH_DURATION (10 seconds), BENCH_PRINTS (20 per call).
+"""
+import concurrent.futures
+import os
+import sys
+import time
+import uuid
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+
+URL = os.environ.get("BENCH_URL", "http://localhost:8000").rstrip("/")
+USERNAME = os.environ.get("BENCH_USERNAME", main.ADMIN_USERNAME)
+PASSWORD = os.environ.get("BENCH_PASSWORD", main.ADMIN_PASSWORD)
+CLIENTS = int(os.environ.get("BENCH_CLIENTS", "20"))
+DURATION = float(os.environ.get("BENCH_DURATION", "10"))
+PRINTS = int(os.environ.get("BENCH_PRINTS", "20"))
+
+API_CODE = f"""
+for i in range({PRINTS}):
+    print("line", i)
+result = {{"printed": {PRINTS}}}
+"""
+
+
+def login() -> requests.Session:
+    session = requests.Session()
+    response = session.post(f"{URL}/login", data={"username": USERNAME, "password": PASSWORD}, allow_redirects=False)
+    if "session_id" not in session.cookies:
+        sys.exit(f"Login to {URL} failed ({response.status_code})")
+    return session
+
+
+def create_api(session: requests.Session) -> dict:
+    path = f"/benchmark/logging-{uuid.uuid4().hex[:8]}"
+    response = session.post(f"{URL}/api/manage/create", json={
+        "name": f"benchmark {path}",
+        "path": path,
+        "method": "GET",
+        "python_code": API_CODE,
+    })
+    response.raise_for_status()
+    return response.json()["api"]
+
+
+def client(path: str, deadline: float, cookies) -> tuple:
+    latencies = []
+    errors = 0
+    with requests.Session() as session:
+        session.cookies.update(cookies)
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                ok = session.get(f"{URL}{path}", timeout=30).status_code == 200
+            except requests.RequestException:
+                ok = False
+            latencies.append((time.perf_counter() - start) * 1000)
+            errors += not ok
+    return latencies, errors
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run():
+    session = login()
+    api = create_api(session)
+    try:
+        # One call first, so setup and compilation are not measured
+        session.get(f"{URL}{api['path']}").raise_for_status()
+        deadline = time.monotonic() + DURATION
+        with concurrent.futures.ThreadPoolExecutor(CLIENTS) as pool:
+            results = list(pool.map(lambda _: client(api["path"], deadline, session.cookies), range(CLIENTS)))
+        latencies = sorted(latency for result in results for latency in result[0])
+        errors = sum(result[1] for result in results)
+        print(f"clients={CLIENTS} duration={DURATION:.0f}s prints/call={PRINTS}")
+        print(f"requests: {len(latencies)} ({len(latencies) / DURATION:.1f}/s), errors: {errors}")
+        print(f"latency ms: p50={percentile(latencies, 0.5):.1f} p99={percentile(latencies, 0.99):.1f} max={latencies[-1]:.1f}")
+        print(f"log_writer: {session.get(f'{URL}/api/manage/stats').json()['log_writer']}")
+    finally:
+        session.delete(f"{URL}/api/manage/{api['id']}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,86 @@
+"""
+CPU cost of serializing a large dynamic API result.
+
+Compares the previous response path (json.dumps for the log preview, then
+JSONResponse encoding the result again) with encoding once via
+main.encode_json - both with the standard library and, when installed,
+orjson.
+
+Run from the repository root:
+    python benchmarks/serialization_benchmark.py
+"""
+import datetime
+import decimal
+import json
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.responses import JSONResponse
+
+import main
+
+ROWS = 200000
+REPEATS = 3
+
+
+def plain_rows(count):
+    return [
+        {"id": i, "site": f"site-{i % 97}", "utilization": i * 0.37, "active": i % 3 == 0}
+        for i in range(count)
+    ]
+
+
+def typed_rows(count):
+    start = datetime.datetime(2024, 1, 1)
+    return [
+        {
+            "id": uuid.UUID(int=i),
+            "recorded_at": start + datetime.timedelta(minutes=i),
+            "amount": decimal.Decimal(i) / 100,
+        }
+        for i in range(count)
+    ]
+
+
+def previous_path(result):
+    log_preview = json.dumps({"result": result, "error": None}, default=str)[:1000]
+    body = JSONResponse(content={"result": result}).body
+    return log_preview, body
+
+
+def single_encode(result):
+    body = main.encode_json({"result": result})
+    return body[:1000].decode("utf-8", errors="ignore"), body
+
+
+def cpu_ms(fn, result):
+    best = None
+    for _ in range(REPEATS):
+        start = time.process_time()
+        fn(result)
+        elapsed = (time.process_time() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run():
+    orjson = main.orjson
+    for label, result in (("plain rows", plain_rows(ROWS)), ("datetime/Decimal/UUID rows", typed_rows(ROWS))):
+        print(f"{label} ({ROWS} rows), best of {REPEATS}, CPU ms:")
+        if label == "plain rows":
+            # JSONResponse cannot encode datetime/Decimal/UUID, so the old path only handles plain rows
+            print(f"  {'previous (dumps for log + JSONResponse)':<45} {cpu_ms(previous_path, result):>10.1f}")
+        main.orjson = None
+        print(f"  {'encode once (json)':<45} {cpu_ms(single_encode, result):>10.1f}")
+        main.orjson = orjson
+        if orjson is not None:
+            print(f"  {'encode once (orjson)':<45} {cpu_ms(single_encode, result):>10.1f}")
+
+
+if __name__ == "__main__":
+    run()
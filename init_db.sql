@@ -9,11 +9,15 @@ CREATE TABLE IF NOT EXISTS apis (
     python_code TEXT NOT NULL,
     description TEXT,
     enabled BOOLEAN DEFAULT TRUE,
+    settings JSONB DEFAULT '{}'::jsonb, -- per-API runtime settings (concurrency limits, ...)
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     UNIQUE(path, method)
 );
 
+-- Upgrade existing databases (also applied on startup)
+ALTER TABLE apis ADD COLUMN IF NOT EXISTS settings JSONB DEFAULT '{}'::jsonb;
+
 -- Logs table
 CREATE TABLE IF NOT EXISTS api_logs (
     id VARCHAR(255) PRIMARY KEY,
@@ -29,9 +33,23 @@ CREATE TABLE IF NOT EXISTS api_logs (
     stdout TEXT,
     prints TEXT,
     response_time_ms FLOAT,
+    coalesced_from VARCHAR(255), -- log id of the execution this request shared (single-flight)
+    response_bytes BIGINT, -- size of streamed responses (response_body only keeps a prefix)
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+ALTER TABLE api_logs ADD COLUMN IF NOT EXISTS coalesced_from VARCHAR(255);
+ALTER TABLE api_logs ADD COLUMN IF NOT EXISTS response_bytes BIGINT;
+
+-- Execution output of log entries, appended as numbered chunks (never rewritten)
+CREATE TABLE IF NOT EXISTS api_log_chunks (
+    log_id VARCHAR(255) NOT NULL,
+    seq INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (log_id, seq)
+);
+
 -- Sessions table
 CREATE TABLE IF NOT EXISTS sessions (
     session_id VARCHAR(255) PRIMARY KEY,
@@ -40,12 +58,38 @@ CREATE TABLE IF NOT EXISTS sessions (
     expires_at TIMESTAMP
 );
 
+-- Change notifications: every worker LISTENs on this channel and applies only the changed rows
+CREATE OR REPLACE FUNCTION notify_row_change() RETURNS trigger AS $$
+DECLARE
+    row_data JSONB;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row_data := to_jsonb(OLD);
+    ELSE
+        row_data := to_jsonb(NEW);
+    END IF;
+    PERFORM pg_notify('api_manager_changes', json_build_object(
+        'table', TG_TABLE_NAME, 'op', TG_OP, 'id', row_data ->> TG_ARGV[0]
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS apis_notify_change ON apis;
+CREATE TRIGGER apis_notify_change AFTER INSERT OR UPDATE OR DELETE ON apis
+    FOR EACH ROW EXECUTE FUNCTION notify_row_change('id');
+DROP TRIGGER IF EXISTS sessions_notify_change ON sessions;
+CREATE TRIGGER sessions_notify_change AFTER INSERT OR UPDATE OR DELETE ON sessions
+    FOR EACH ROW EXECUTE FUNCTION notify_row_change('session_id');
+
 -- Create indexes for better performance
 CREATE INDEX IF NOT EXISTS idx_apis_path_method ON apis(path, method);
 CREATE INDEX IF NOT EXISTS idx_apis_enabled ON apis(enabled);
 CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON api_logs(timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_logs_timestamp_id ON api_logs(timestamp DESC, id DESC);
 CREATE INDEX IF NOT EXISTS idx_logs_path ON api_logs(path);
 CREATE INDEX IF NOT EXISTS idx_logs_status ON api_logs(status);
+CREATE INDEX IF NOT EXISTS idx_log_chunks_created_at ON api_log_chunks(created_at);
 CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at);
 
 -- Grant permissions
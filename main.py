@@ -1,28 +1,46 @@
 from fastapi import FastAPI, Request, HTTPException, Depends, Form
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-from typing import Optional, Dict, Any, List
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Optional, Dict, Any, List, Literal, Tuple
 import json
 import os
+import re
 import datetime
+import time
+import math
+import hashlib
+import collections
+import collections.abc
+import itertools
+import inspect
+import importlib
 import importlib.util
 import sys
 from io import StringIO
 import traceback
 import uuid
+import decimal
+import tempfile
 import secrets
 import subprocess
 import asyncio
 import threading
+import weakref
 import concurrent.futures
+import contextvars
+import ast
+import multiprocessing
 import psycopg2
-from psycopg2.extras import RealDictCursor
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor, Json, execute_values, execute_batch
 from psycopg2.pool import ThreadedConnectionPool
 import requests
+import httpx
 import smtplib
 from email.message import EmailMessage
 from fastapi import BackgroundTasks
+from starlette.datastructures import UploadFile
 
 
 # Session storage
@@ -115,12 +133,13 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # PostgreSQL Database Configuration (Hub Production via SSH Tunnel)
 # Tunnel: localhost:5433 -> Hub -> Huawei Cloud Internal DB
+# The standard libpq variables (PGHOST, PGPORT, ...) point it at another server, e.g. a local Postgres
 DB_CONFIG = {
-    'dbname': 'beyond',
-    'user': 'odoo',
-    'password': 'PBLBOIq9HR0YVslM',
-    'host': 'localhost',
-    'port': '5433'
+    'dbname': os.environ.get('PGDATABASE', 'beyond'),
+    'user': os.environ.get('PGUSER', 'odoo'),
+    'password': os.environ.get('PGPASSWORD', 'PBLBOIq9HR0YVslM'),
+    'host': os.environ.get('PGHOST', 'localhost'),
+    'port': os.environ.get('PGPORT', '5433')
 }
 
 # Connection pool for PostgreSQL
@@ -138,8 +157,193 @@ def return_db_connection(conn):
     if db_pool:
         db_pool.putconn(conn)
 
-# Store dynamic routes
+# NOTIFY channel carrying {"table", "op", "id"} for every changed apis/sessions row
+CHANGE_CHANNEL = "api_manager_changes"
+
+# Idempotent schema upgrades applied on startup (keep in sync with init_db.sql)
+SCHEMA_MIGRATIONS = [
+    "ALTER TABLE apis ADD COLUMN IF NOT EXISTS settings JSONB DEFAULT '{}'::jsonb",
+    "ALTER TABLE api_logs ADD COLUMN IF NOT EXISTS coalesced_from VARCHAR(255)",
+    "ALTER TABLE api_logs ADD COLUMN IF NOT EXISTS response_bytes BIGINT",
+    """
+    CREATE TABLE IF NOT EXISTS api_log_chunks (
+        log_id VARCHAR(255) NOT NULL,
+        seq INTEGER NOT NULL,
+        content TEXT NOT NULL,
+        created_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (log_id, seq)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_log_chunks_created_at ON api_log_chunks(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_logs_timestamp_id ON api_logs(timestamp DESC, id DESC)",
+    f"""
+    CREATE OR REPLACE FUNCTION notify_row_change() RETURNS trigger AS $$
+    DECLARE
+        row_data JSONB;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            row_data := to_jsonb(OLD);
+        ELSE
+            row_data := to_jsonb(NEW);
+        END IF;
+        PERFORM pg_notify('{CHANGE_CHANNEL}', json_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP, 'id', row_data ->> TG_ARGV[0]
+        )::text);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS apis_notify_change ON apis",
+    "CREATE TRIGGER apis_notify_change AFTER INSERT OR UPDATE OR DELETE ON apis FOR EACH ROW EXECUTE FUNCTION notify_row_change('id')",
+    "DROP TRIGGER IF EXISTS sessions_notify_change ON sessions",
+    "CREATE TRIGGER sessions_notify_change AFTER INSERT OR UPDATE OR DELETE ON sessions FOR EACH ROW EXECUTE FUNCTION notify_row_change('session_id')",
+]
+
+def apply_schema_migrations():
+    """Apply idempotent schema upgrades to an existing database"""
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        # Workers starting together apply the migrations one at a time
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('api_manager_schema_migrations'))")
+        for statement in SCHEMA_MIGRATIONS:
+            cur.execute(statement)
+        conn.commit()
+        cur.close()
+    except Exception as e:
+        print(f"Error applying schema migrations: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn:
+            return_db_connection(conn)
+
+# Dispatch table for dynamic APIs: (METHOD, path) -> handler
+# Every dynamic API is served through dispatch_dynamic_api, so APIs can be
+# added, replaced and removed at runtime without restarting the server.
 dynamic_routes = {}
+# api_id -> (METHOD, path) key currently registered in dynamic_routes / dynamic_route_index
+dynamic_route_keys = {}
+# Literal (METHOD, path) key -> api_id whose handler is in dynamic_routes
+dynamic_route_owners = {}
+dynamic_routes_lock = threading.Lock()
+
+# Path templates: a segment is either literal or a whole "{name}" parameter
+PATH_PARAM_PATTERN = re.compile(r"^\{([A-Za-z_][A-Za-z0-9_]*)\}$")
+
+def is_path_template(path: str) -> bool:
+    return "{" in path
+
+def validate_api_path(path: str) -> Optional[str]:
+    """Return an error message if an API path (or path template) is malformed, None if valid"""
+    if not path.startswith("/"):
+        return "Path must start with /"
+    names = set()
+    for segment in path.split("/")[1:]:
+        if "{" not in segment and "}" not in segment:
+            continue
+        param = PATH_PARAM_PATTERN.match(segment)
+        if not param:
+            return f"Invalid path segment '{segment}' - parameters must be whole segments like {{name}}"
+        if param.group(1) in names:
+            return f"Duplicate path parameter '{param.group(1)}'"
+        names.add(param.group(1))
+    return None
+
+class RouteIndexNode:
+    __slots__ = ("children", "param", "routes")
+    
+    def __init__(self):
+        self.children = {}  # literal segment -> node
+        self.param = None  # node for a {param} segment
+        self.routes = {}  # METHOD -> (api_id, handler, param names)
+
+class RouteIndex:
+    """Segment trie of templated dynamic API paths.
+    
+    Matching walks one node per path segment, so its cost depends on the path
+    length, not on how many APIs are registered. Literal segments win over
+    {param} segments."""
+    
+    def __init__(self):
+        self.root = RouteIndexNode()
+    
+    def add(self, method: str, path: str, handler, api_id: str = None):
+        node = self.root
+        names = []
+        for segment in path.split("/")[1:]:
+            param = PATH_PARAM_PATTERN.match(segment)
+            if param:
+                names.append(param.group(1))
+                if node.param is None:
+                    node.param = RouteIndexNode()
+                node = node.param
+            else:
+                node = node.children.setdefault(segment, RouteIndexNode())
+        node.routes[method] = (api_id, handler, names)
+    
+    def _find(self, path: str) -> List[RouteIndexNode]:
+        """Nodes along a template's path (root first), or [] if it is not indexed"""
+        nodes = [self.root]
+        for segment in path.split("/")[1:]:
+            node = nodes[-1]
+            node = node.param if PATH_PARAM_PATTERN.match(segment) else node.children.get(segment)
+            if node is None:
+                return []
+            nodes.append(node)
+        return nodes
+    
+    def owner(self, method: str, path: str) -> Optional[str]:
+        """api_id registered for this template - {a} and {b} in the same place count as the same route"""
+        nodes = self._find(path)
+        route = nodes[-1].routes.get(method) if nodes else None
+        return route[0] if route else None
+    
+    def remove(self, method: str, path: str):
+        nodes = self._find(path)
+        if not nodes:
+            return
+        nodes[-1].routes.pop(method, None)
+        # Prune branches that no longer lead to any route
+        segments = path.split("/")[1:]
+        for depth in range(len(segments), 0, -1):
+            node = nodes[depth]
+            if node.routes or node.children or node.param is not None:
+                break
+            parent = nodes[depth - 1]
+            if parent.param is node:
+                parent.param = None
+            else:
+                parent.children.pop(segments[depth - 1], None)
+    
+    def match(self, method: str, path: str):
+        """Return (handler, path_params) for a request path, or None"""
+        values = []
+        route = self._match(self.root, path.split("/")[1:], 0, method, values)
+        if route is None:
+            return None
+        return route[1], dict(zip(route[2], values))
+    
+    def _match(self, node: RouteIndexNode, segments: List[str], i: int, method: str, values: List[str]):
+        if i == len(segments):
+            return node.routes.get(method)
+        segment = segments[i]
+        child = node.children.get(segment)
+        if child is not None:
+            route = self._match(child, segments, i + 1, method, values)
+            if route is not None:
+                return route
+        if node.param is not None and segment:
+            values.append(segment)
+            route = self._match(node.param, segments, i + 1, method, values)
+            if route is not None:
+                return route
+            values.pop()
+        return None
+
+# Templated dynamic APIs - literal paths stay in dynamic_routes (one dict lookup)
+dynamic_route_index = RouteIndex()
 
 # Load database (APIs)
 def load_db():
@@ -166,204 +370,941 @@ def save_db(data):
     pass  # Individual operations handle saving
 
 # Load logs
-def load_logs():
-    """Load logs from PostgreSQL"""
+LOG_PAGE_MAX_ROWS = 1000
+# Columns of log listings and of the live stream - headers, bodies and output come from the detail endpoint
+LOG_SUMMARY_COLUMNS = ("id", "timestamp", "method", "path", "status", "status_code", "response_time_ms", "coalesced_from")
+# Filters of load_logs -> their SQL condition, combined with the (timestamp, id) range of the page
+LOG_FILTERS = {
+    "path": "path = %s",
+    "status": "status = %s",
+    "status_code": "status_code = %s",
+    "client_ip": "client_ip = %s",
+    "since": "timestamp >= %s",
+    "until": "timestamp < %s",
+}
+
+def encode_log_cursor(log: Dict[str, Any]) -> str:
+    """Cursor of the page after this entry - entries are ordered by (timestamp, id) descending"""
+    return f"{log['timestamp']}|{log['id']}"
+
+def decode_log_cursor(cursor: str):
+    """(timestamp, id) of a cursor - ValueError if it is malformed"""
+    timestamp, separator, log_id = cursor.partition("|")
+    if not separator or not log_id:
+        raise ValueError("Invalid cursor")
+    return datetime.datetime.fromisoformat(timestamp), log_id
+
+def _log_row(row) -> Dict[str, Any]:
+    """A log row as returned by the API - ISO timestamp, parsed JSONB fields"""
+    log_dict = dict(row)
+    # Convert timestamp to ISO format string if it's a datetime object
+    if isinstance(log_dict.get('timestamp'), datetime.datetime):
+        log_dict['timestamp'] = log_dict['timestamp'].isoformat()
+    # Parse JSONB fields if they're strings
+    for column in ('query_params', 'headers'):
+        if isinstance(log_dict.get(column), str):
+            try:
+                log_dict[column] = json.loads(log_dict[column])
+            except ValueError:
+                log_dict[column] = {}
+    return log_dict
+
+def load_logs(limit: int = 1000, filters: Dict[str, Any] = None, before: str = None):
+    """Load one page of log summaries from PostgreSQL, newest first - see load_log_detail for the rest.
+    
+    filters are pushed into the query (see LOG_FILTERS); before is the next_cursor of the
+    previous page, so every page is one range scan of idx_logs_timestamp_id."""
+    conditions = []
+    params = []
+    for name, value in (filters or {}).items():
+        if value is not None:
+            conditions.append(LOG_FILTERS[name])
+            params.append(value)
+    if before:
+        conditions.append("(timestamp, id) < (%s, %s)")
+        params.extend(decode_log_cursor(before))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
     conn = None
     try:
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT * FROM api_logs ORDER BY timestamp DESC LIMIT 1000")
-        logs = cur.fetchall()
+        # One extra row tells whether there is a next page
+        cur.execute(
+            f"SELECT {', '.join(LOG_SUMMARY_COLUMNS)} FROM api_logs {where} ORDER BY timestamp DESC, id DESC LIMIT %s",
+            params + [limit + 1]
+        )
+        rows = cur.fetchall()
         cur.close()
-        # Convert to list of dicts and handle JSONB fields
-        result_logs = []
-        for log in logs:
-            log_dict = dict(log)
-            # Convert timestamp to ISO format string if it's a datetime object
-            if isinstance(log_dict.get('timestamp'), datetime.datetime):
-                log_dict['timestamp'] = log_dict['timestamp'].isoformat()
-            # Parse JSONB fields if they're strings
-            if isinstance(log_dict.get('query_params'), str):
-                try:
-                    log_dict['query_params'] = json.loads(log_dict['query_params'])
-                except:
-                    log_dict['query_params'] = {}
-            if isinstance(log_dict.get('headers'), str):
-                try:
-                    log_dict['headers'] = json.loads(log_dict['headers'])
-                except:
-                    log_dict['headers'] = {}
-            result_logs.append(log_dict)
-        return {"logs": result_logs}
+        logs = [_log_row(row) for row in rows[:limit]]
+        return {"logs": logs, "next_cursor": encode_log_cursor(logs[-1]) if len(rows) > limit else None}
     except Exception as e:
         print(f"Error loading logs: {e}")
-        return {"logs": []}
+        return {"logs": [], "next_cursor": None}
     finally:
         if conn:
             return_db_connection(conn)
 
-# Save logs (individual log entry) - now handled by individual operations
-def save_logs(data):
-    """Save logs to PostgreSQL - this is now handled by individual insert/update operations"""
-    pass  # Individual operations handle saving
-
-def save_log_entry(log_entry):
-    """Save a single log entry to PostgreSQL"""
+def load_log_detail(log_id: str) -> Optional[Dict[str, Any]]:
+    """Full log entry with its output in prints - output_seq is the last output chunk included"""
     conn = None
     try:
         conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO api_logs (
-                id, timestamp, method, path, query_params, headers, client_ip,
-                status_code, status, response_body, stdout, prints, response_time_ms
-            )
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (id) DO UPDATE SET
-                status_code = EXCLUDED.status_code,
-                status = EXCLUDED.status,
-                response_body = EXCLUDED.response_body,
-                stdout = EXCLUDED.stdout,
-                prints = EXCLUDED.prints,
-                response_time_ms = EXCLUDED.response_time_ms
-        """, (
-            log_entry['id'],
-            datetime.datetime.fromisoformat(log_entry['timestamp']) if isinstance(log_entry['timestamp'], str) else log_entry['timestamp'],
-            log_entry['method'],
-            log_entry['path'],
-            json.dumps(log_entry.get('query_params', {})),
-            json.dumps(log_entry.get('headers', {})),
-            log_entry.get('client_ip'),
-            log_entry.get('status_code'),
-            log_entry.get('status', 'completed'),
-            log_entry.get('response_body', ''),
-            log_entry.get('stdout', ''),
-            log_entry.get('prints', ''),
-            log_entry.get('response_time_ms', 0)
-        ))
-        conn.commit()
-        cur.close()
-        
-        # Keep only last 1000 logs
-        cur = conn.cursor()
-        cur.execute("""
-            DELETE FROM api_logs
-            WHERE id NOT IN (
-                SELECT id FROM (
-                    SELECT id FROM api_logs ORDER BY timestamp DESC LIMIT 1000
-                ) AS keep_logs
-            )
-        """)
-        conn.commit()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute("SELECT * FROM api_logs WHERE id = %s LIMIT 1", (log_id,))
+        row = cur.fetchone()
+        if row is None:
+            cur.close()
+            return None
+        log = _log_row(row)
+        log['output_seq'] = 0
+        live = log_writer.live_output(log_id) if log.get('status') == 'executing' else None
+        if live is not None:
+            # Running here - output straight from memory, the chunk rows may still be queued
+            log['output_seq'], log['prints'] = live
+        elif not log.get('prints') and not log.get('stdout'):
+            # Output of newer entries lives in api_log_chunks
+            cur.execute("SELECT seq, content FROM api_log_chunks WHERE log_id = %s ORDER BY seq", (log_id,))
+            chunks = _mark_output_gaps([(row['seq'], row['content']) for row in cur.fetchall()], 0)
+            if chunks:
+                log['prints'] = "".join(chunk["content"] for chunk in chunks)
+                log['output_seq'] = chunks[-1]["seq"]
         cur.close()
-    except Exception as e:
-        print(f"Error saving log entry: {e}")
-        if conn:
-            conn.rollback()
+        return log
     finally:
         if conn:
             return_db_connection(conn)
 
-def update_log_entry(log_id, updates):
-    """Update a log entry in PostgreSQL"""
+def _mark_output_gaps(rows, after_seq: int) -> List[Dict[str, Any]]:
+    """Chunk dicts for (seq, content) rows in seq order - a chunk following missing ones starts with the gap marker"""
+    chunks = []
+    expected = after_seq + 1
+    for seq, content in rows:
+        if seq != expected:
+            content = LOG_OUTPUT_GAP_MARKER + content
+        chunks.append({"seq": seq, "content": content})
+        expected = seq + 1
+    return chunks
+
+def load_log_chunks(log_id: str, after_seq: int = 0, limit: int = 1000) -> Dict[str, Any]:
+    """Output chunks of one log entry numbered after after_seq, oldest first"""
     conn = None
     try:
         conn = get_db_connection()
         cur = conn.cursor()
-        
-        set_clauses = []
-        params = []
-        for key, value in updates.items():
-            if key == 'query_params' or key == 'headers':
-                set_clauses.append(f"{key} = %s")
-                params.append(json.dumps(value) if isinstance(value, dict) else value)
-            elif key == 'timestamp' and isinstance(value, str):
-                set_clauses.append(f"{key} = %s")
-                params.append(datetime.datetime.fromisoformat(value))
-            else:
-                set_clauses.append(f"{key} = %s")
-                params.append(value)
-        
-        params.append(log_id)
-        cur.execute(f"UPDATE api_logs SET {', '.join(set_clauses)} WHERE id = %s", params)
-        conn.commit()
+        cur.execute("SELECT status FROM api_logs WHERE id = %s LIMIT 1", (log_id,))
+        row = cur.fetchone()
+        cur.execute("""
+            SELECT seq, content FROM api_log_chunks
+            WHERE log_id = %s AND seq > %s
+            ORDER BY seq LIMIT %s
+        """, (log_id, after_seq, limit + 1))
+        rows = cur.fetchall()
         cur.close()
-    except Exception as e:
-        print(f"Error updating log entry: {e}")
-        if conn:
-            conn.rollback()
+        conn.commit()
+        chunks = _mark_output_gaps(rows[:limit], after_seq)
+        return {
+            "log_id": log_id,
+            "status": row[0] if row else None,
+            "chunks": chunks,
+            "last_seq": chunks[-1]["seq"] if chunks else after_seq,
+            "more": len(rows) > limit,
+        }
     finally:
         if conn:
             return_db_connection(conn)
 
+# Save logs (individual log entry) - now handled by individual operations
+def save_logs(data):
+    """Save logs to PostgreSQL - this is now handled by individual insert/update operations"""
+    pass  # Individual operations handle saving
+
+# === ASYNC LOG WRITER ===
+# Request paths only enqueue log writes. One background thread merges the writes
+# to each row and stores them in batches, so request latency excludes log I/O.
+# Execution output is stored as numbered chunks in api_log_chunks, never by
+# rewriting a growing column.
+LOG_COLUMNS = (
+    "id", "timestamp", "method", "path", "query_params", "headers", "client_ip",
+    "status_code", "status", "response_body", "stdout", "prints", "response_time_ms",
+    "coalesced_from", "response_bytes",
+)
+LOG_INSERT_DEFAULTS = {
+    "query_params": {}, "headers": {}, "status": "completed",
+    "response_body": "", "stdout": "", "prints": "", "response_time_ms": 0,
+}
+LOG_QUEUE_MAX_ROWS = int(os.environ.get("LOG_QUEUE_MAX_ROWS", "10000"))
+LOG_FLUSH_INTERVAL_MS = float(os.environ.get("LOG_FLUSH_INTERVAL_MS", "200"))
+LOG_QUEUE_BLOCK_MS = 100  # How long an execution thread waits for room before its log write is dropped
+# Room beyond max_rows kept for final updates and output of entries already queued or written - a full
+# queue refuses new entries first, so the ones it accepted still get their final status and output
+LOG_QUEUE_RESERVE_FRACTION = 0.1
+LOG_OUTPUT_GAP_MARKER = "\n[... output lost - the log queue was full ...]\n"  # Shown where chunks are missing
+LOG_BATCH_ROWS = 500      # A batch this large is written without waiting for the flush interval
+LOG_CHUNKS_PAGE = 1000    # Chunks returned per output tail request
+
+def _log_column_value(column: str, value):
+    """Convert a log field to its database parameter"""
+    if column in ("query_params", "headers") and not isinstance(value, str):
+        return json.dumps(value, default=str)
+    if column == "timestamp" and isinstance(value, str):
+        return datetime.datetime.fromisoformat(value)
+    return value
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+class LogWriter:
+    """Bounded queue of pending api_logs writes, drained in batches by a background thread"""
+    
+    def __init__(self, max_rows: int, flush_interval_ms: float):
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval_ms / 1000
+        self.cond = threading.Condition()
+        self.write_lock = threading.Lock()  # Keeps batches in order when flush() runs outside the thread
+        # log id -> {"insert": row or None, "set": {column: value}, "chunks": [(seq, created_at, text)]}
+        self.pending = {}
+        # log id -> LoggingStringIO of a running execution; its prints are collected every flush interval.
+        # Weak, so the output of a stream that is never consumed does not stay registered.
+        self.live = weakref.WeakValueDictionary()
+        self.thread = None
+        self.stopping = False
+        self.batches = 0
+        self.rows_written = 0
+        self.chunks_written = 0
+        self.merged = 0
+        self.reserve_rows = max(1, int(max_rows * LOG_QUEUE_RESERVE_FRACTION))
+        self.dropped = {"insert": 0, "update": 0, "chunk": 0}
+        self.backpressure = 0
+        self.failed = 0
+        self.last_error = None
+        self.last_flush_ms = 0.0
+    
+    def _ensure_started(self):
+        """Start the writer thread on first use - caller holds self.cond"""
+        if self.thread is None or not self.thread.is_alive():
+            self.stopping = False
+            self.thread = threading.Thread(target=self._run, name="api-log-writer", daemon=True)
+            self.thread.start()
+    
+    def _admit(self, kind: str) -> bool:
+        """Make room for one more pending row - caller holds self.cond.
+        kind is "insert", "update" or "chunk"; only inserts are refused at max_rows, the rest may use the reserve."""
+        limit = self.max_rows if kind == "insert" else self.max_rows + self.reserve_rows
+        if len(self.pending) < limit:
+            return True
+        if not _on_event_loop():
+            # Execution threads wait briefly for the writer; the event loop never blocks
+            self.backpressure += 1
+            self.cond.notify_all()
+            deadline = time.monotonic() + LOG_QUEUE_BLOCK_MS / 1000
+            while len(self.pending) >= limit:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            if len(self.pending) < limit:
+                return True
+        self.dropped[kind] += 1
+        return False
+    
+    def _op(self, log_id: str, kind: str):
+        """Pending writes of one row, created if there is room - caller holds self.cond"""
+        op = self.pending.get(log_id)
+        if op is not None:
+            self.merged += 1
+            return op
+        if not self._admit(kind):
+            return None
+        self._ensure_started()
+        op = self.pending[log_id] = {"insert": None, "set": {}, "chunks": []}
+        if len(self.pending) == 1 or len(self.pending) >= LOG_BATCH_ROWS:
+            # Start a flush interval, or cut it short for a full batch
+            self.cond.notify_all()
+        return op
+    
+    def insert(self, log_entry: Dict[str, Any]):
+        row = dict(LOG_INSERT_DEFAULTS)
+        row.update((column, value) for column, value in log_entry.items() if column in LOG_COLUMNS)
+        with self.cond:
+            op = self._op(row["id"], "insert")
+            if op is None:
+                return
+            if op["insert"] is not None:
+                op["insert"].update(row)
+                return
+            row.update(op["set"])
+            op.update({"insert": row, "set": {}})
+    
+    def update(self, log_id: str, updates: Dict[str, Any]):
+        with self.cond:
+            op = self._op(log_id, "update")
+            if op is None:
+                return
+            if op["insert"] is not None:
+                # Not written yet - the insert carries the final values
+                op["insert"].update(updates)
+                return
+            op["set"].update(updates)
+    
+    def append_chunk(self, log_id: str, seq: int, text: str):
+        """Queue one chunk of execution output - written as a new row, existing output is never rewritten.
+        A dropped chunk leaves a gap in seq, which readers mark with LOG_OUTPUT_GAP_MARKER."""
+        with self.cond:
+            op = self._op(log_id, "chunk")
+            if op is not None:
+                op["chunks"].append((seq, datetime.datetime.now(), text))
+    
+    def watch(self, output: "LoggingStringIO"):
+        """Register a running execution's output - its buffered prints are appended every flush interval"""
+        with self.cond:
+            self.live[output.log_id] = output
+            self._ensure_started()
+            self.cond.notify_all()
+    
+    def unwatch(self, output: "LoggingStringIO"):
+        """The execution finished - append whatever it printed since the last interval"""
+        with self.cond:
+            if self.live.get(output.log_id) is output:
+                del self.live[output.log_id]
+        chunk = output.take_unflushed()
+        if chunk:
+            self.append_chunk(output.log_id, *chunk)
+    
+    def live_output(self, log_id: str):
+        """(seq, text) of the output a running execution handed out as chunks so far, or None when it is
+        not running here. Read from memory - the chunks may still be queued for writing."""
+        output = self.live.get(log_id)
+        return output.flushed_output() if output is not None else None
+    
+    def _collect_live(self):
+        """Turn the prints buffered by running executions into one append per execution"""
+        with self.cond:
+            outputs = list(self.live.values())
+        for output in outputs:
+            chunk = output.take_unflushed()
+            if chunk:
+                self.append_chunk(output.log_id, *chunk)
+    
+    def _take(self) -> Dict[str, Dict]:
+        with self.cond:
+            batch, self.pending = self.pending, {}
+            self.cond.notify_all()  # Wake execution threads waiting for room
+            return batch
+    
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.live and not self.stopping:
+                    self.cond.wait()
+                if self.stopping:
+                    return  # close() writes what is left
+                # Collect writes for one flush interval - an insert and its final update usually merge
+                deadline = time.monotonic() + self.flush_interval
+                while len(self.pending) < LOG_BATCH_ROWS and not self.stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+            self._collect_live()
+            self.flush()
+    
+    def flush(self):
+        """Write everything pending now"""
+        with self.write_lock:
+            batch = self._take()
+            if batch:
+                self._write_batch(batch)
+    
+    def _statements(self, batch: Dict[str, Dict]):
+        """Yield (sql, params list, batched) for the rows and output chunks of a batch"""
+        inserts = [op["insert"] for op in batch.values() if op["insert"] is not None]
+        if inserts:
+            yield (
+                f"""
+                INSERT INTO api_logs ({", ".join(LOG_COLUMNS)})
+                VALUES %s
+                ON CONFLICT DO NOTHING
+                """,
+                [tuple(_log_column_value(column, row.get(column)) for column in LOG_COLUMNS) for row in inserts],
+                True
+            )
+        updates = {}
+        for log_id, op in batch.items():
+            if op["insert"] is not None:
+                continue
+            clauses = []
+            params = []
+            for column, value in op["set"].items():
+                clauses.append(f"{column} = %s")
+                params.append(_log_column_value(column, value))
+            if clauses:
+                params.append(log_id)
+                updates.setdefault(f"UPDATE api_logs SET {', '.join(clauses)} WHERE id = %s", []).append(params)
+        for sql, params_list in updates.items():
+            yield sql, params_list, False
+        chunks = [(log_id, seq, text, created_at) for log_id, op in batch.items() for seq, created_at, text in op["chunks"]]
+        if chunks:
+            yield (
+                """
+                INSERT INTO api_log_chunks (log_id, seq, content, created_at)
+                VALUES %s
+                ON CONFLICT DO NOTHING
+                """,
+                chunks,
+                True
+            )
+        # Delivered on commit - other workers forward the written rows to their log stream clients
+        for payload in log_change_payloads(batch):
+            yield "SELECT pg_notify(%s, %s)", [(LOG_CHANNEL, payload)], False
+    
+    def _write_batch(self, batch: Dict[str, Dict]):
+        start = time.perf_counter()
+        conn = None
+        written = 0
+        chunks_written = 0
+        written_ops = {}
+        try:
+            conn = get_db_connection()
+            cur = conn.cursor()
+            try:
+                for sql, params_list, is_insert in self._statements(batch):
+                    if is_insert:
+                        execute_values(cur, sql, params_list, page_size=LOG_BATCH_ROWS)
+                    else:
+                        execute_batch(cur, sql, params_list, page_size=100)
+                conn.commit()
+                written = len(batch)
+                chunks_written = sum(len(op["chunks"]) for op in batch.values())
+                written_ops = batch
+            except Exception as e:
+                conn.rollback()
+                self.last_error = f"{type(e).__name__}: {str(e).strip()}"
+                # One bad row must not lose the whole batch - retry row by row
+                for log_id, op in batch.items():
+                    try:
+                        for sql, params_list, is_insert in self._statements({log_id: op}):
+                            if is_insert:
+                                execute_values(cur, sql, params_list)
+                            else:
+                                cur.execute(sql, params_list[0])
+                        conn.commit()
+                        written += 1
+                        chunks_written += len(op["chunks"])
+                        written_ops[log_id] = op
+                    except Exception as row_error:
+                        conn.rollback()
+                        self.failed += 1
+                        print(f"Error writing log entry {log_id}: {row_error}")
+            cur.close()
+        except Exception as e:
+            self.failed += len(batch) - written
+            self.last_error = f"{type(e).__name__}: {str(e).strip()}"
+            print(f"Error writing log batch: {e}")
+        finally:
+            if conn:
+                return_db_connection(conn)
+        with self.cond:
+            self.batches += 1
+            self.rows_written += written
+            self.chunks_written += chunks_written
+            self.last_flush_ms = round((time.perf_counter() - start) * 1000, 3)
+        if written_ops:
+            log_broadcaster.publish_batch(written_ops)
+    
+    def close(self, timeout: float = 5.0):
+        """Stop the writer thread and write everything still pending"""
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+            thread = self.thread
+        if thread is not None:
+            thread.join(timeout)
+        self._collect_live()
+        self.flush()
+    
+    def stats(self) -> Dict[str, Any]:
+        with self.cond:
+            return {
+                "pending_rows": len(self.pending),
+                "live_executions": len(self.live),
+                "max_rows": self.max_rows,
+                "flush_interval_ms": self.flush_interval * 1000,
+                "batches": self.batches,
+                "rows_written": self.rows_written,
+                "chunks_written": self.chunks_written,
+                "merged_writes": self.merged,
+                "reserve_rows": self.reserve_rows,
+                "dropped": sum(self.dropped.values()),
+                "dropped_inserts": self.dropped["insert"],
+                # Entries left with status "executing" - their final update was lost
+                "dropped_final_updates": self.dropped["update"],
+                "dropped_chunks": self.dropped["chunk"],
+                "backpressure_waits": self.backpressure,
+                "failed_rows": self.failed,
+                "last_flush_ms": self.last_flush_ms,
+                "last_error": self.last_error,
+            }
+
+log_writer = LogWriter(LOG_QUEUE_MAX_ROWS, LOG_FLUSH_INTERVAL_MS)
+
+def save_log_entry(log_entry):
+    """Queue a new log entry - written by the log writer within LOG_FLUSH_INTERVAL_MS"""
+    log_writer.insert(log_entry)
+
+def update_log_entry(log_id, updates):
+    """Queue an update of a log entry - merged with its insert if that is still pending"""
+    log_writer.update(log_id, updates)
+
+# === LOG RETENTION ===
+# Old log entries are pruned by a periodic task, off the request path. With the
+# optional daily partitioning (partition_api_logs.sql) expired days are dropped whole.
+LOG_RETENTION_DAYS = float(os.environ.get("LOG_RETENTION_DAYS", "7"))                # 0 keeps entries of any age
+LOG_RETENTION_MAX_ROWS = int(os.environ.get("LOG_RETENTION_MAX_ROWS", "1000000"))    # 0 keeps any number of entries
+LOG_RETENTION_INTERVAL_SECONDS = float(os.environ.get("LOG_RETENTION_INTERVAL_SECONDS", "300"))
+LOG_RETENTION_DELETE_BATCH = 10000    # Rows deleted per transaction, so pruning never holds long locks
+LOG_PARTITION_PRECREATE_DAYS = 3      # Daily partitions created ahead of time
+LOG_PARTITION_DROP_LOCK_TIMEOUT_MS = 2000   # Fallback drop gives up (and retries next run) rather than queue queries behind it
+LOG_PARTITION_PATTERN = re.compile(r"^api_logs_p(\d{8})$")
+
+class LogRetention:
+    """Applies the age and row-count policies to api_logs - one worker at a time"""
+    
+    def __init__(self, max_age_days: float, max_rows: int, interval_seconds: float):
+        self.max_age_days = max_age_days
+        self.max_rows = max_rows
+        self.interval = interval_seconds
+        self.task = None
+        self.runs = 0
+        self.rows_deleted = 0
+        self.chunks_deleted = 0
+        self.partitions_dropped = 0
+        self.partitions_created = 0
+        self.partitioned = None
+        self.estimated_rows = None
+        self.count_scans = 0
+        self.last_run = None
+        self.last_run_ms = None
+        self.last_error = None
+    
+    def _partitions(self, cur) -> Dict[datetime.date, str]:
+        """Daily partitions of api_logs by day - empty if the table is not partitioned"""
+        cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = 'api_logs'::regclass")
+        row = cur.fetchone()
+        self.partitioned = bool(row and row[0])
+        if not self.partitioned:
+            return {}
+        cur.execute("""
+            SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'api_logs'::regclass
+        """)
+        partitions = {}
+        for (name,) in cur.fetchall():
+            match = LOG_PARTITION_PATTERN.match(name)
+            if match:
+                partitions[datetime.datetime.strptime(match.group(1), "%Y%m%d").date()] = name
+        return partitions
+    
+    def _create_partitions(self, conn, cur, partitions: Dict[datetime.date, str]):
+        today = datetime.date.today()
+        for offset in range(LOG_PARTITION_PRECREATE_DAYS + 1):
+            day = today + datetime.timedelta(days=offset)
+            if day in partitions:
+                continue
+            name = f"api_logs_p{day:%Y%m%d}"
+            try:
+                cur.execute(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF api_logs FOR VALUES FROM (%s) TO (%s)",
+                    (day, day + datetime.timedelta(days=1))
+                )
+                conn.commit()
+                partitions[day] = name
+                self.partitions_created += 1
+            except Exception as e:
+                # E.g. rows of that day already sit in the default partition
+                conn.rollback()
+                self.last_error = f"Creating partition {name}: {str(e).strip()}"
+    
+    def _estimate_rows(self, cur) -> Optional[int]:
+        """Planner estimate of the row count (summed over partitions) - None if a non-empty table was never analyzed"""
+        cur.execute("""
+            SELECT SUM(GREATEST(c.reltuples, 0)), bool_or(c.reltuples < 0 AND pg_relation_size(c.oid) > 0) FROM pg_class c
+            WHERE c.relkind = 'r' AND (c.oid = 'api_logs'::regclass
+                OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = 'api_logs'::regclass))
+        """)
+        total, unknown = cur.fetchone()
+        if total is None or unknown:
+            return None
+        return int(total)
+    
+    def _cutoff(self, cur) -> Optional[datetime.datetime]:
+        """Entries older than this are expired under the age and row-count policies"""
+        cutoffs = []
+        if self.max_age_days:
+            cutoffs.append(datetime.datetime.now() - datetime.timedelta(days=self.max_age_days))
+        if self.max_rows:
+            self.estimated_rows = self._estimate_rows(cur)
+            if self.estimated_rows is not None and self.estimated_rows <= self.max_rows:
+                # Well within the limit - skip the scan below, which reads max_rows index entries
+                return max(cutoffs) if cutoffs else None
+            self.count_scans += 1
+            # Index scan on idx_logs_timestamp - finds the newest entry beyond the row limit
+            cur.execute("SELECT timestamp FROM api_logs ORDER BY timestamp DESC OFFSET %s LIMIT 1", (self.max_rows,))
+            row = cur.fetchone()
+            if row:
+                # Entries at this timestamp are beyond the limit too
+                cutoffs.append(row[0] + datetime.timedelta(microseconds=1))
+        return max(cutoffs) if cutoffs else None
+    
+    def _drop_partition(self, conn, cur, name: str):
+        """Drop an expired daily partition without blocking queries on api_logs.
+        
+        DETACH ... CONCURRENTLY only takes a SHARE UPDATE EXCLUSIVE lock on the parent, after which the
+        detached table is dropped on its own. Postgres refuses it while a default partition exists (or
+        before version 14) - then the partition is dropped directly, which locks the parent exclusively,
+        so that waits at most LOG_PARTITION_DROP_LOCK_TIMEOUT_MS instead of stalling queries queued behind it."""
+        conn.autocommit = True  # DETACH CONCURRENTLY cannot run inside a transaction block
+        try:
+            try:
+                cur.execute(f"ALTER TABLE api_logs DETACH PARTITION {name} CONCURRENTLY")
+            except psycopg2.Error as e:
+                if "pending detach" in str(e):
+                    # An earlier concurrent detach was interrupted
+                    cur.execute(f"ALTER TABLE api_logs DETACH PARTITION {name} FINALIZE")
+                elif e.pgcode in ("55000", "42601"):
+                    # Default partition exists / server without DETACH CONCURRENTLY
+                    cur.execute("SET lock_timeout = %s", (f"{LOG_PARTITION_DROP_LOCK_TIMEOUT_MS}ms",))
+                    try:
+                        cur.execute(f"DROP TABLE IF EXISTS {name}")
+                    finally:
+                        cur.execute("RESET lock_timeout")
+                    return
+                else:
+                    raise
+            cur.execute(f"DROP TABLE IF EXISTS {name}")
+        finally:
+            conn.autocommit = False
+    
+    def run_once(self):
+        """Prune expired entries now (and keep upcoming daily partitions in place)"""
+        start = time.perf_counter()
+        conn = None
+        locked = False
+        try:
+            conn = get_db_connection()
+            cur = conn.cursor()
+            # Several workers share the table - whoever holds the lock prunes, the others skip this round
+            cur.execute("SELECT pg_try_advisory_lock(hashtext('api_manager_log_retention'))")
+            locked = cur.fetchone()[0]
+            conn.commit()
+            if not locked:
+                return
+            partitions = self._partitions(cur)
+            conn.commit()
+            if self.partitioned:
+                self._create_partitions(conn, cur, partitions)
+            cutoff = self._cutoff(cur)
+            conn.commit()
+            if cutoff is not None:
+                # Whole days before the cutoff are dropped instead of deleted row by row
+                for day, name in sorted(partitions.items()):
+                    if datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time()) <= cutoff:
+                        self._drop_partition(conn, cur, name)
+                        self.partitions_dropped += 1
+                rows_deleted = self.rows_deleted
+                while True:
+                    cur.execute("""
+                        DELETE FROM api_logs WHERE id IN (
+                            SELECT id FROM api_logs WHERE timestamp < %s LIMIT %s
+                        )
+                    """, (cutoff, LOG_RETENTION_DELETE_BATCH))
+                    deleted = cur.rowcount
+                    conn.commit()
+                    self.rows_deleted += deleted
+                    if deleted < LOG_RETENTION_DELETE_BATCH:
+                        break
+                if self.max_rows and self.rows_deleted > rows_deleted:
+                    # Refresh the estimate the next run is gated on (ANALYZE samples a fixed number of rows)
+                    cur.execute("ANALYZE api_logs")
+                    conn.commit()
+                # A chunk is never older than its entry, so this only removes output of expired entries
+                while True:
+                    cur.execute("""
+                        DELETE FROM api_log_chunks WHERE (log_id, seq) IN (
+                            SELECT log_id, seq FROM api_log_chunks WHERE created_at < %s LIMIT %s
+                        )
+                    """, (cutoff, LOG_RETENTION_DELETE_BATCH))
+                    deleted = cur.rowcount
+                    conn.commit()
+                    self.chunks_deleted += deleted
+                    if deleted < LOG_RETENTION_DELETE_BATCH:
+                        break
+            self.last_error = None
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {str(e).strip()}"
+            print(f"Error pruning logs: {self.last_error}")
+            if conn:
+                conn.rollback()
+        finally:
+            if conn:
+                if locked:
+                    try:
+                        cur = conn.cursor()
+                        cur.execute("SELECT pg_advisory_unlock(hashtext('api_manager_log_retention'))")
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                return_db_connection(conn)
+            self.runs += 1
+            self.last_run = datetime.datetime.now().isoformat()
+            self.last_run_ms = round((time.perf_counter() - start) * 1000, 3)
+    
+    async def _run(self):
+        while True:
+            await asyncio.to_thread(self.run_once)
+            await asyncio.sleep(self.interval)
+    
+    def start(self):
+        if self.interval > 0:
+            self.task = asyncio.get_running_loop().create_task(self._run())
+    
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except BaseException:
+                pass
+            self.task = None
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_age_days": self.max_age_days,
+            "max_rows": self.max_rows,
+            "interval_seconds": self.interval,
+            "partitioned": self.partitioned,
+            "estimated_rows": self.estimated_rows,
+            "count_scans": self.count_scans,
+            "runs": self.runs,
+            "rows_deleted": self.rows_deleted,
+            "chunks_deleted": self.chunks_deleted,
+            "partitions_dropped": self.partitions_dropped,
+            "partitions_created": self.partitions_created,
+            "last_run": self.last_run,
+            "last_run_ms": self.last_run_ms,
+            "last_error": self.last_error,
+        }
+
+log_retention = LogRetention(LOG_RETENTION_DAYS, LOG_RETENTION_MAX_ROWS, LOG_RETENTION_INTERVAL_SECONDS)
+
+# === LIVE LOG STREAM ===
+# /api/logs/stream clients subscribe to one in-process broadcaster instead of
+# polling. The log writer publishes each written batch as a delta (changed
+# summary fields and the latest output chunk per entry); batches written by other
+# workers arrive via NOTIFY on LOG_CHANNEL and are fetched once per worker, not
+# once per client.
+LOG_CHANNEL = "api_manager_logs"
+LOG_STREAM_QUEUE_MAX = 100             # Deltas buffered per client - a client this far behind is resynced
+LOG_STREAM_SNAPSHOT_ROWS = 100         # Entries sent on connect and on resync
+LOG_STREAM_KEEPALIVE_SECONDS = 15
+LOG_NOTIFY_MAX_BYTES = 7000            # NOTIFY payloads are limited to 8000 bytes
+WORKER_ID = uuid.uuid4().hex           # Tells this process's own notifications apart
+
+LOG_STREAM_RESYNC = object()           # Queue marker: send a fresh snapshot
+
+def _log_stream_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Summary fields of a row for a stream delta"""
+    fields = {}
+    for column, value in row.items():
+        if column in LOG_SUMMARY_COLUMNS:
+            fields[column] = value.isoformat() if isinstance(value, datetime.datetime) else value
+    return fields
+
+def log_change_payloads(batch: Dict[str, Dict]) -> List[str]:
+    """NOTIFY payloads naming the changed rows and latest output chunks of a written batch, split to fit the size limit"""
+    payloads = []
+    current = {"origin": WORKER_ID, "logs": [], "output": []}
+    size = 0
+    for log_id, op in batch.items():
+        keys = [("logs", log_id)] if op["insert"] is not None or op["set"] else []
+        if op["chunks"]:
+            keys.append(("output", [log_id, max(seq for seq, _, _ in op["chunks"])]))
+        for kind, key in keys:
+            if size > LOG_NOTIFY_MAX_BYTES:
+                payloads.append(json.dumps(current))
+                current = {"origin": WORKER_ID, "logs": [], "output": []}
+                size = 0
+            current[kind].append(key)
+            size += len(log_id) + 16
+    if current["logs"] or current["output"]:
+        payloads.append(json.dumps(current))
+    return payloads
+
+class LogBroadcaster:
+    """Fans log deltas out to the open /api/logs/stream clients through bounded per-client queues"""
+    
+    def __init__(self, queue_max: int):
+        self.queue_max = queue_max
+        self.subscribers = set()
+        self.loop = None
+        self.published = 0
+        self.remote_batches = 0
+        self.resyncs = 0
+    
+    def subscribe(self) -> asyncio.Queue:
+        self.loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(self.queue_max)
+        self.subscribers.add(queue)
+        return queue
+    
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+    
+    def _resync(self, queue: asyncio.Queue):
+        """Replace what a slow client has not read yet with one resync marker"""
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(LOG_STREAM_RESYNC)
+        self.resyncs += 1
+    
+    def _fanout(self, event):
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._resync(queue)
+    
+    def publish_batch(self, batch: Dict[str, Dict]):
+        """Called by the log writer thread after a batch is committed"""
+        if not self.subscribers:
+            return  # Nobody is watching - nothing to build
+        logs = []
+        output = {}
+        for log_id, op in batch.items():
+            if op["insert"] is not None:
+                logs.append(_log_stream_row(op["insert"]))
+            elif op["set"]:
+                row = _log_stream_row(op["set"])
+                if row:
+                    logs.append({"id": log_id, **row})
+            if op["chunks"]:
+                output[log_id] = max(seq for seq, _, _ in op["chunks"])
+        if not logs and not output:
+            return
+        self.published += 1
+        try:
+            self.loop.call_soon_threadsafe(self._fanout, {"type": "delta", "logs": logs, "output": output})
+        except RuntimeError:
+            pass  # Event loop already closed
+    
+    async def apply_remote(self, payloads: List[str]):
+        """Fetch and fan out the rows other workers wrote - skipped while nobody is watching"""
+        if not self.subscribers:
+            return
+        log_ids = set()
+        output = {}
+        for payload in payloads:
+            try:
+                change = json.loads(payload)
+            except ValueError:
+                continue
+            if change.get("origin") == WORKER_ID:
+                continue  # Already published from the batch itself
+            log_ids.update(change.get("logs") or [])
+            for log_id, seq in change.get("output") or []:
+                output[log_id] = max(seq, output.get(log_id, 0))
+        if not log_ids and not output:
+            return
+        logs = []
+        if log_ids:
+            rows = await db_fetch(f"SELECT {', '.join(LOG_SUMMARY_COLUMNS)} FROM api_logs WHERE id = ANY(%s)", (list(log_ids),))
+            logs = [_log_stream_row(row) for row in rows]
+        self.remote_batches += 1
+        self._fanout({"type": "delta", "logs": logs, "output": output})
+    
+    def resync_all(self):
+        """Deltas may have been missed (e.g. the NOTIFY connection dropped) - every client gets a snapshot"""
+        for queue in list(self.subscribers):
+            self._resync(queue)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": len(self.subscribers),
+            "queue_max": self.queue_max,
+            "deltas_published": self.published,
+            "remote_batches": self.remote_batches,
+            "resyncs": self.resyncs,
+        }
+
+log_broadcaster = LogBroadcaster(LOG_STREAM_QUEUE_MAX)
+
+# Logging policies - decided once per route when it is registered
+LOG_POLICY_SKIP = "skip"                # System endpoints, never logged
+LOG_POLICY_HANDLER = "handler"          # Dynamic APIs, the handler writes its own log entry
+LOG_POLICY_MIDDLEWARE = "middleware"    # Everything else, logged by log_requests
+
+# System endpoints, static files and auth pages are not logged
+LOG_EXCLUDED_PREFIXES = (
+    "/api/manage/",           # Management APIs
+    "/api/logs",              # Logs API
+    "/api/background-jobs/",  # Background jobs API
+    "/static/",               # Static files
+    "/docs",                  # OpenAPI docs
+)
+LOG_EXCLUDED_PATHS = {
+    "/",                # Dashboard
+    "/logs",            # Logs page
+    "/login",           # Login page
+    "/logout",          # Logout
+    "/ping",            # Ping endpoint
+    "/redoc",
+    "/openapi.json",
+    "/favicon.ico",
+}
+
+# (METHOD, path) -> logging policy of every registered dynamic API.
+# Maintained by create_dynamic_route/remove_dynamic_route, so the middleware
+# never has to query the apis table to classify a request.
+api_log_index = {}
+
+def resolve_log_policy(method: str, path: str) -> str:
+    """Classify a request for logging in O(1)"""
+    policy = api_log_index.get((method, path))
+    if policy is not None:
+        return policy
+    if path in LOG_EXCLUDED_PATHS or path.startswith(LOG_EXCLUDED_PREFIXES):
+        return LOG_POLICY_SKIP
+    if dynamic_route_index.match(method, path) is not None:
+        return LOG_POLICY_HANDLER
+    return LOG_POLICY_MIDDLEWARE
+
 # Logging middleware
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     start_time = datetime.datetime.now()
     
-    # Process request
-    response = await call_next(request)
-    
     path = request.url.path
     method = request.method
     
-    # Skip logging for system endpoints, static files, and auth pages
-    excluded_paths = [
-        "/api/manage",  # Management APIs
-        "/api/logs",    # Logs API
-        "/static",      # Static files
-        "/",            # Dashboard
-        "/logs",        # Logs page
-        "/login",       # Login page
-        "/logout",      # Logout
-        "/ping",        # Ping endpoint
-    ]
-    
-    # Check if path should be excluded
-    should_exclude = False
-    for excluded in excluded_paths:
-        if path.startswith(excluded):
-            should_exclude = True
-            break
-    
-    if should_exclude:
-        return response
-    
-    # Skip middleware logging for user-created APIs (they log themselves in the handler)
-    # Check if path matches any API in database
-    db = load_db()
-    is_user_api = False
-    
-    for api in db.get("apis", []):
-        api_path = api.get("path", "")
-        api_method = api.get("method", "").upper()
-        # Match path and method exactly
-        if api_path == path and api_method == method.upper():
-            # Skip /ping endpoint
-            if api_path == "/ping":
-                break
-            # Check if it's a user API
-            if api.get("enabled", True):
-                is_user_api = True
-                break
+    # Skip system endpoints and user APIs (they log themselves in the handler)
+    if resolve_log_policy(method, path) != LOG_POLICY_MIDDLEWARE:
+        return await call_next(request)
     
-    # Skip middleware logging for user APIs (they handle their own logging)
-    if is_user_api:
-        return response
+    # Process request
+    response = await call_next(request)
     
     # Read response body
     try:
-        response_body = b""
+        chunks = []
         async for chunk in response.body_iterator:
-            response_body += chunk
+            chunks.append(chunk)
+        response_body = b"".join(chunks)
         
-        # Decode response body for logging
-        try:
-            response_body_text = response_body.decode('utf-8', errors='ignore')[:1000]
-            response_body_json = json.loads(response_body_text) if response_body_text else {}
-        except:
-            response_body_text = response_body.decode('utf-8', errors='ignore')[:1000]
-            response_body_json = {}
+        # Log a preview sliced from the same bytes that are sent
+        response_body_text = response_body[:1000].decode('utf-8', errors='ignore')
         
         # Log the request
         log_entry = {
@@ -382,9 +1323,9 @@ async def log_requests(request: Request, call_next):
         # Save log entry to PostgreSQL
         save_log_entry(log_entry)
         
-        # Return the response with the same body
-        return JSONResponse(
-            content=response_body_json,
+        # Return the response with the same body - no re-encoding
+        return Response(
+            content=response_body,
             status_code=response.status_code,
             headers=dict(response.headers)
         )
@@ -396,12 +1337,59 @@ async def log_requests(request: Request, call_next):
         return response
 
 # API Models
+class RequestKeySettings(BaseModel):
+    """Which request fields identify "the same request" for an API"""
+    model_config = ConfigDict(extra="forbid")
+    
+    key: List[Literal["query_params", "headers", "body"]] = ["query_params"]  # Request fields forming the key
+    headers: List[str] = []  # Header names used when "headers" is part of the key
+
+class CacheSettings(RequestKeySettings):
+    """Response cache of an API - successful responses are reused until they expire"""
+    ttl_seconds: float = Field(..., gt=0)  # How long a cached response stays valid
+    max_entries: int = Field(256, ge=1)  # Least recently used entries are evicted beyond this
+    headers: List[str] = ["authorization"]  # Always part of the key - [] shares responses between all callers
+
+class TokenBucketSettings(BaseModel):
+    """Token bucket - `rate` requests per second on average, bursts of up to `burst`"""
+    model_config = ConfigDict(extra="forbid")
+    
+    rate: float = Field(..., gt=0)
+    burst: Optional[int] = Field(None, ge=1)  # Defaults to the rate rounded up
+
+class RateLimitSettings(BaseModel):
+    """Rate limits of an API - over-limit calls get 429 with Retry-After"""
+    model_config = ConfigDict(extra="forbid")
+    
+    per_api: Optional[TokenBucketSettings] = None  # All callers together
+    per_client: Optional[TokenBucketSettings] = None  # Each client IP separately
+
+class CoalesceSettings(RequestKeySettings):
+    """Single-flight - identical concurrent requests share one execution"""
+    key: List[Literal["query_params", "headers", "body"]] = ["query_params", "headers", "body"]
+    headers: List[str] = ["authorization"]  # Callers with different credentials never share a result
+
+class APISettings(BaseModel):
+    """Per-API runtime settings, stored in the apis.settings JSONB column"""
+    model_config = ConfigDict(extra="forbid")
+    
+    max_concurrency: Optional[int] = Field(None, ge=1)  # Concurrent executions of this API
+    queue_depth: Optional[int] = Field(None, ge=0)  # Requests allowed to wait for a slot
+    execution_mode: Optional[Literal["thread", "process", "async"]] = None  # "process" for CPU-bound code, "async" for async def handler
+    preload_modules: Optional[List[str]] = None  # Modules imported when the API is registered
+    cache: Optional[CacheSettings] = None  # Opt-in response cache
+    coalesce: Optional[CoalesceSettings] = None  # Opt-in coalescing of identical in-flight requests
+    rate_limit: Optional[RateLimitSettings] = None  # Token-bucket limits per API and per client IP
+    timeout_seconds: Optional[float] = Field(None, gt=0)  # Executions running longer get 504
+    stream_format: Optional[Literal["ndjson", "json"]] = None  # How iterator results are streamed (default ndjson)
+
 class APIRequest(BaseModel):
     name: str
     path: str
     method: str = "GET"
     python_code: str
     description: Optional[str] = None
+    settings: Optional[APISettings] = None
 
 class APIUpdate(BaseModel):
     name: Optional[str] = None
@@ -410,66 +1398,64 @@ class APIUpdate(BaseModel):
     python_code: Optional[str] = None
     description: Optional[str] = None
     enabled: Optional[bool] = None
+    settings: Optional[APISettings] = None
+
+def get_api_settings(api_def: Dict) -> Dict[str, Any]:
+    """Return the settings dict of an API definition"""
+    settings = api_def.get("settings") or {}
+    if isinstance(settings, str):
+        try:
+            settings = json.loads(settings)
+        except ValueError:
+            settings = {}
+    return settings
 
 # Custom StringIO that updates logs in real-time
 class LoggingStringIO(StringIO):
     def __init__(self, log_id=None):
         super().__init__()
         self.log_id = log_id
-        self.lock = threading.Lock()
-        self.last_update_time = 0
+        self.lock = threading.Lock()  # write() runs in the execution, take_unflushed() in the log writer
+        self.unflushed = []
+        self.seq = 0  # Sequence number of the last chunk handed to the log writer
+        self.flushed_chars = 0  # Length of the output in chunks 1..seq
+        self.finished = False
+        if log_id:
+            # Prints stay in memory - the log writer appends them to the log entry every flush interval
+            log_writer.watch(self)
     
     def write(self, s):
-        super().write(s)
-        # Update log entry with stdout in real-time
-        if self.log_id and s:  # Only update if we have content
-            try:
-                import time
-                current_time = time.time()
-                # Update more frequently for real-time feel (every 50ms or immediately for non-empty content)
-                should_update = (current_time - self.last_update_time) > 0.05 or len(s.strip()) > 0
-                
-                if should_update:
-                    # Update prints in PostgreSQL directly using atomic append with proper locking
-                    conn = None
-                    try:
-                        with self.lock:  # Use lock to prevent race conditions and ensure ordering
-                            conn = get_db_connection()
-                            cur = conn.cursor()
-                            
-                            # Lock the row and get current prints in one atomic operation
-                            cur.execute("SELECT prints FROM api_logs WHERE id = %s FOR UPDATE", (self.log_id,))
-                            row = cur.fetchone()
-                            current_prints = row[0] if row and row[0] else ""
-                            
-                            # Process string to ensure each print statement is on its own line
-                            processed_s = s
-                            
-                            # If current prints doesn't end with newline and we have new content, add separator
-                            if current_prints and not current_prints.rstrip().endswith('\n') and s.strip():
-                                processed_s = '\n' + s
-                            
-                            # Ensure each non-empty print statement ends with newline for readability
-                            if processed_s.strip() and not processed_s.endswith('\n'):
-                                processed_s = processed_s + '\n'
-                            
-                            # Use PostgreSQL's atomic string concatenation to append (ensures ordering)
-                            cur.execute("UPDATE api_logs SET prints = COALESCE(prints, '') || %s WHERE id = %s", 
-                                      (processed_s, self.log_id))
-                            conn.commit()
-                            cur.close()
-                            self.last_update_time = current_time
-                    except Exception as e:
-                        print(f"Error updating prints in log: {e}")
-                        import traceback
-                        traceback.print_exc()
-                        if conn:
-                            conn.rollback()
-                    finally:
-                        if conn:
-                            return_db_connection(conn)
-            except Exception as e:
-                pass  # Don't fail if logging fails
+        with self.lock:
+            written = super().write(s)
+            if self.log_id and s:
+                self.unflushed.append(s)
+        return written
+    
+    def getvalue(self):
+        with self.lock:
+            return super().getvalue()
+    
+    def take_unflushed(self):
+        """(seq, text) of everything printed since the last call, or None"""
+        with self.lock:
+            if not self.unflushed:
+                return None
+            text = "".join(self.unflushed)
+            self.unflushed.clear()
+            self.seq += 1
+            self.flushed_chars += len(text)
+            return self.seq, text
+    
+    def flushed_output(self):
+        """(seq, text of chunks 1..seq) - a reader continues exactly where chunk seq + 1 starts"""
+        with self.lock:
+            return self.seq, super().getvalue()[:self.flushed_chars]
+    
+    def finish(self):
+        """The execution is done - hand the remaining prints to the log writer as the last chunk"""
+        if self.log_id and not self.finished:
+            self.finished = True
+            log_writer.unwatch(self)
 
 # Global background task queue
 background_task_queue = []
@@ -477,6 +1463,7 @@ background_task_queue = []
 # === BACKGROUND JOB TRACKING FUNCTIONS ===
 def add_progress_log(job_id: str, message: str, log_level: str = "info", step_number: int = None):
     """Add a progress log entry for a background job"""
+    check_cancelled()
     conn = None
     try:
         conn = get_db_connection()
@@ -554,6 +1541,7 @@ def check_job_running(job_type: str) -> bool:
 # Background job helper functions (available in Python code execution context)
 def start_background_job(job_type: str, job_function):
     """Start a background job - available in Python code execution context"""
+    check_cancelled()
     global background_task_queue
     conn = None
     try:
@@ -620,93 +1608,968 @@ def start_background_job(job_type: str, job_function):
     
     return {"status": "started", "job_id": job_id, "message": f"{job_type} started"}
 
-# Execute Python code safely
-def execute_python_code(code: str, request_data: Dict = None, log_id: str = None) -> Dict[str, Any]:
-    """Execute Python code and return result"""
-    output = LoggingStringIO(log_id=log_id)
-    error_output = StringIO()
-    result = None
+# === ONE-TIME INTERPRETER SETUP ===
+def setup_interpreter():
+    """Prepare sys.path once per process (previously redone on every execution)"""
+    # Prioritize venv packages over system packages - avoids protobuf conflicts
+    venv_path = None
+    for p in sys.path:
+        if 'venv' in p and 'site-packages' in p:
+            venv_path = p
+            break
     
-    # Redirect stdout and stderr
-    old_stdout = sys.stdout
-    old_stderr = sys.stderr
+    if venv_path and venv_path != sys.path[0]:
+        sys.path = [venv_path] + [p for p in sys.path if p != venv_path]
     
+    # Remove system dist-packages from path to avoid conflicts
+    sys.path = [p for p in sys.path if '/usr/lib/python3/dist-packages' not in p]
+    importlib.invalidate_caches()
+
+setup_interpreter()
+
+# Per-module import report: module -> {"import_ms", "error", "apis"}
+module_import_report = {}
+module_import_lock = threading.Lock()
+
+def preload_modules(modules: List[str], api_id: str = None) -> Dict[str, Any]:
+    """Import modules ahead of the first request and record how long each import took"""
+    report = {}
+    for module_name in modules or []:
+        with module_import_lock:
+            entry = module_import_report.get(module_name)
+            # Failed imports are retried the next time an API asks for them
+            if entry is None or entry["error"]:
+                already_loaded = module_name in sys.modules
+                start = time.perf_counter()
+                error = None
+                try:
+                    importlib.import_module(module_name)
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                    print(f"Error preloading module {module_name}: {error}")
+                entry = {
+                    "import_ms": round((time.perf_counter() - start) * 1000, 3),
+                    "already_loaded": already_loaded,
+                    "error": error,
+                    "apis": entry["apis"] if entry else []
+                }
+                module_import_report[module_name] = entry
+            if api_id and api_id not in entry["apis"]:
+                entry["apis"].append(api_id)
+        report[module_name] = entry
+    return report
+
+# Compiled code objects for dynamic APIs, keyed by API id.
+# Each entry remembers the updated_at version it was compiled from.
+compiled_code_cache = {}
+compiled_code_lock = threading.Lock()
+
+def api_code_version(api_def: Dict) -> Optional[str]:
+    """Return the version (updated_at) used to key the compiled code cache"""
+    updated_at = api_def.get("updated_at")
+    if isinstance(updated_at, datetime.datetime):
+        return updated_at.isoformat()
+    return str(updated_at) if updated_at else None
+
+# Top-level functions of API code that run once per worker instead of per request
+API_LIFECYCLE_FUNCTIONS = ("setup", "teardown")
+SETUP_RESERVED_NAMES = ("request_data", "result")
+
+def _is_lifecycle_def(node) -> bool:
+    return isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name in API_LIFECYCLE_FUNCTIONS
+
+def _is_setup_module_node(node) -> bool:
+    """Top-level statements setup() may rely on - imports, definitions and literal constants"""
+    if isinstance(node, (ast.Import, ast.ImportFrom, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return True
+    if isinstance(node, (ast.Assign, ast.AnnAssign)) and node.value is not None:
+        try:
+            ast.literal_eval(node.value)
+            return True
+        except ValueError:
+            return False
+    return False
+
+def compile_api_code(code: str, api_id: str = None):
+    """Compile the per-request part of API code (setup()/teardown() excluded) - raises SyntaxError for invalid code"""
+    filename = f"<api {api_id}>" if api_id else "<api>"
+    tree = ast.parse(code, filename)
+    tree.body = [node for node in tree.body if not _is_lifecycle_def(node)]
+    return compile(tree, filename, "exec")
+
+def compile_setup_code(code: str, api_id: str = None):
+    """Compile the setup module of API code - None if the code defines no setup()"""
+    filename = f"<api {api_id} setup>" if api_id else "<api setup>"
+    tree = ast.parse(code, filename)
+    if not any(_is_lifecycle_def(node) and node.name == "setup" for node in tree.body):
+        return None
+    tree.body = [node for node in tree.body if _is_setup_module_node(node)]
+    return compile(tree, filename, "exec")
+
+def format_syntax_error(e: SyntaxError) -> str:
+    """Format a SyntaxError for API responses"""
+    return f"Syntax error in python_code at line {e.lineno}: {e.msg}"
+
+def get_compiled_code(api_def: Dict):
+    """Get the compiled code object for an API, compiling it if the cached version is stale"""
+    api_id = api_def["id"]
+    version = api_code_version(api_def)
+    with compiled_code_lock:
+        entry = compiled_code_cache.get(api_id)
+        if entry and entry["version"] == version:
+            return entry["code"]
+    code_obj = compile_api_code(api_def["python_code"], api_id)
+    with compiled_code_lock:
+        compiled_code_cache[api_id] = {"version": version, "code": code_obj}
+    return code_obj
+
+def invalidate_compiled_code(api_id: str):
+    """Drop the cached code object for an API"""
+    with compiled_code_lock:
+        compiled_code_cache.pop(api_id, None)
+
+def validate_api_code(code: str, settings: Dict = None) -> Optional[str]:
+    """Check API code before it is stored - returns an error message or None"""
     try:
-        sys.stdout = output
-        sys.stderr = error_output
-        
-        # ===== Minimal protobuf cleanup - only reorder paths, don't remove modules =====
-        # Removing protobuf modules causes "Empty" attribute errors intermittently
-        # Instead, just ensure venv packages are prioritized
-        import importlib
-        
-        # Reorder sys.path to prioritize venv packages (less aggressive than removing modules)
-        venv_path = None
-        for p in sys.path:
-            if 'venv' in p and 'site-packages' in p:
-                venv_path = p
-                break
-        
-        if venv_path and venv_path != sys.path[0]:
-            # Move venv site-packages to front if not already there
-            sys.path = [venv_path] + [p for p in sys.path if p != venv_path]
-        
-        # Remove system dist-packages from path to avoid conflicts
-        sys.path = [p for p in sys.path if '/usr/lib/python3/dist-packages' not in p]
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        return format_syntax_error(e)
+    for node in tree.body:
+        if not _is_lifecycle_def(node):
+            continue
+        if isinstance(node, ast.AsyncFunctionDef):
+            return f"{node.name}() must be a regular 'def' function"
+        required = len(node.args.args) - len(node.args.defaults)
+        if node.name == "setup" and required:
+            return "setup() must not take parameters"
+        if node.name == "teardown" and not (node.args.args or node.args.vararg):
+            return "teardown(state) must take the state returned by setup()"
+    if (settings or {}).get("execution_mode") == "async":
+        has_handler = any(
+            isinstance(node, ast.AsyncFunctionDef) and node.name == "handler"
+            for node in tree.body
+        )
+        if not has_handler:
+            return "Async APIs must define 'async def handler(request_data)' at the top level"
+    return None
+
+def build_execution_context(request_data: Dict = None, state: Dict = None) -> Dict[str, Any]:
+    """Create the globals API code runs with - request data, helper functions and the API's setup() state"""
+    context = {
+        "request_data": request_data or {},
+        "json": json,
+        "datetime": datetime,
+        "result": None,
+        "start_background_job": start_background_job,
+        "add_progress_log": add_progress_log,
+        "update_job_status": update_job_status,
+        "check_job_running": check_job_running,
+        "threading": threading,
+        "asyncio": asyncio,
+        "requests": cancellable_requests,
+        "check_cancelled": check_cancelled,
+        "smtplib": smtplib,
+        "EmailMessage": EmailMessage,
+        "psycopg2": psycopg2,
+        "traceback": traceback
+    }
+    if state:
+        context.update(state)
+    return context
+
+# === PER-API SETUP STATE ===
+class APISetupState:
+    """Objects an API's setup() creates once per worker, shared by every call until the API is updated or removed"""
+    
+    def __init__(self, api_id: str, setup_code):
+        self.api_id = api_id
+        self.setup_code = setup_code
+        self.lock = threading.Lock()
+        self.state = None
+        self.namespace = None
+        self.error = None
+        self.setup_ms = None
+        self.users = 0
+        self.retired = False
+        self.on_ready = None  # Called with the state whenever setup() succeeds, e.g. to bind it into a module
+    
+    def _run_setup(self):
+        """Run setup() - caller holds self.lock"""
+        namespace = build_execution_context()
+        start = time.perf_counter()
+        try:
+            exec(self.setup_code, namespace)
+            state = namespace["setup"]()
+            if state is None:
+                state = {}
+            if not isinstance(state, dict):
+                raise TypeError("setup() must return a dict of names to share with every call")
+            reserved = [name for name in SETUP_RESERVED_NAMES if name in state]
+            if reserved:
+                raise ValueError(f"setup() must not return reserved names: {', '.join(reserved)}")
+            self.state, self.namespace, self.error = state, namespace, None
+            if self.on_ready is not None:
+                self.on_ready(state)
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            print(f"Error in setup() of API {self.api_id}: {self.error}")
+        finally:
+            self.setup_ms = round((time.perf_counter() - start) * 1000, 3)
+    
+    def start(self):
+        """Run setup() ahead of the first request - if it fails, the next call retries it"""
+        with self.lock:
+            if self.state is None and not self.retired:
+                self._run_setup()
+    
+    def acquire(self, run_setup: bool = True) -> Optional[Dict[str, Any]]:
+        """Return the state for one call, running setup() first if it has not succeeded yet.
+        With run_setup=False returns None instead of running it (nothing is acquired then)."""
+        with self.lock:
+            if self.state is None:
+                if self.retired:
+                    raise RuntimeError("setup() state was torn down - the API was updated or removed")
+                if not run_setup:
+                    return None
+                self._run_setup()
+                if self.state is None:
+                    raise RuntimeError(f"setup() failed: {self.error}")
+            self.users += 1
+            return self.state
+    
+    def release(self):
+        with self.lock:
+            self.users -= 1
+            tear_down = self.retired and self.users == 0
+        if tear_down:
+            self._teardown()
+    
+    def retire(self):
+        """Tear the state down once the calls still using it have finished"""
+        with self.lock:
+            self.retired = True
+            tear_down = self.users == 0
+        if tear_down:
+            self._teardown()
+    
+    def _teardown(self):
+        with self.lock:
+            state, self.state = self.state, None
+            namespace, self.namespace = self.namespace, None
+        if state is None:
+            return
+        teardown = namespace.get("teardown")
+        if callable(teardown):
+            try:
+                teardown(state)
+            except Exception as e:
+                print(f"Error in teardown() of API {self.api_id}: {type(e).__name__}: {e}")
+    
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "ready": self.state is not None,
+                "names": sorted(self.state) if self.state else [],
+                "setup_ms": self.setup_ms,
+                "error": self.error,
+                "in_use": self.users,
+            }
+
+# === PER-EXECUTION OUTPUT CAPTURE ===
+# Capture buffers of the execution running in the current thread or task.
+# sys.stdout/sys.stderr are replaced once by routers that write to these, so
+# concurrent executions never swap process-global streams.
+execution_stdout = contextvars.ContextVar("execution_stdout", default=None)
+execution_stderr = contextvars.ContextVar("execution_stderr", default=None)
+
+# === EXECUTION TIMEOUTS ===
+# Default timeout of API executions in seconds (0 = none); the timeout_seconds setting overrides it
+API_DEFAULT_TIMEOUT_SECONDS = float(os.environ.get("API_DEFAULT_TIMEOUT_SECONDS", "0"))
+
+class ExecutionCancelled(BaseException):
+    """Raised inside API code once its execution timed out.
+    
+    A BaseException so that `except Exception` in API code does not swallow it."""
+
+class ExecutionControl:
+    """Deadline and cancellation flag of one execution, shared with the code running it"""
+    
+    def __init__(self, timeout: float = None):
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.cancelled = threading.Event()
+        self.on_cancel = None  # Called once on timeout, e.g. to kill a worker process
+        self.lock = threading.Lock()
+        self.state = "running"
+    
+    def claim(self, state: str) -> bool:
+        """Move from running to "finished" or "timeout" - only the first caller wins"""
+        with self.lock:
+            if self.state != "running":
+                return False
+            self.state = state
+            on_cancel = self.on_cancel
+        if state == "timeout":
+            self.cancelled.set()
+            if on_cancel is not None:
+                try:
+                    on_cancel()
+                except Exception as e:
+                    print(f"Error cancelling execution: {e}")
+        return True
+    
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+    
+    def check(self):
+        if self.cancelled.is_set():
+            raise ExecutionCancelled(f"Execution timed out after {self.timeout}s")
+
+# Control of the execution running in the current thread or task
+execution_control = contextvars.ContextVar("execution_control", default=None)
+
+def check_cancelled():
+    """Raise ExecutionCancelled if the current execution timed out - helpers call this, API code may too"""
+    control = execution_control.get()
+    if control is not None:
+        control.check()
+
+def clamp_timeout(timeout, remaining: float):
+    """A `requests` timeout that ends by the deadline - a (connect, read) tuple is clamped per element"""
+    if timeout is None:
+        return remaining
+    if isinstance(timeout, (tuple, list)):
+        return tuple(remaining if part is None else min(part, remaining) for part in timeout)
+    if isinstance(timeout, (int, float)):
+        return min(timeout, remaining)
+    return timeout
+
+class CancellableRequests:
+    """`requests` as seen by API code - calls stop once the execution timed out and never outlive its deadline"""
+    
+    _methods = {"request", "get", "post", "put", "patch", "delete", "head", "options"}
+    
+    def __getattr__(self, name):
+        attr = getattr(requests, name)
+        if name not in self._methods:
+            return attr
         
-        # Invalidate import caches (but don't remove modules)
+        def call(*args, **kwargs):
+            control = execution_control.get()
+            if control is not None:
+                control.check()
+                remaining = control.remaining()
+                if remaining is not None:
+                    kwargs["timeout"] = clamp_timeout(kwargs.get("timeout"), remaining)
+            return attr(*args, **kwargs)
+        return call
+
+cancellable_requests = CancellableRequests()
+
+class ExecutionOutputRouter:
+    """Stand-in for sys.stdout/sys.stderr that writes to the current execution's buffer, if any"""
+    
+    def __init__(self, stream, target: contextvars.ContextVar):
+        self._stream = stream
+        self._target = target
+    
+    def _current(self):
+        buffer = self._target.get()
+        return buffer if buffer is not None else self._stream
+    
+    def write(self, s):
+        # print() is a cancellation point for executions that timed out
+        check_cancelled()
+        return self._current().write(s)
+    
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+    
+    def flush(self):
+        self._current().flush()
+    
+    def __getattr__(self, name):
+        # fileno, encoding, isatty, ... come from the real stream
+        return getattr(self._stream, name)
+
+def install_output_routers():
+    """Route sys.stdout/sys.stderr through the per-execution capture buffers (idempotent)"""
+    if not isinstance(sys.stdout, ExecutionOutputRouter):
+        sys.stdout = ExecutionOutputRouter(sys.stdout, execution_stdout)
+    if not isinstance(sys.stderr, ExecutionOutputRouter):
+        sys.stderr = ExecutionOutputRouter(sys.stderr, execution_stderr)
+
+install_output_routers()
+
+# === ASYNC EXECUTION HELPERS ===
+# Shared HTTP client for async APIs, created on first use
+async_http_client = None
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Return the shared async HTTP client"""
+    global async_http_client
+    if async_http_client is None:
+        async_http_client = httpx.AsyncClient(timeout=httpx.Timeout(300.0, connect=10.0))
+    return async_http_client
+
+class AsyncDBPool:
+    """Small pool of non-blocking psycopg2 connections driven by the event loop"""
+    
+    def __init__(self, size: int):
+        self.size = size
+        self.idle = []
+        self.semaphore = None
+    
+    async def _wait(self, conn):
+        """Poll an async connection until its pending operation completes"""
+        loop = asyncio.get_running_loop()
+        while True:
+            state = conn.poll()
+            if state == psycopg2.extensions.POLL_OK:
+                return
+            fd = conn.fileno()
+            ready = loop.create_future()
+            on_ready = lambda: ready.done() or ready.set_result(None)
+            if state == psycopg2.extensions.POLL_READ:
+                loop.add_reader(fd, on_ready)
+                try:
+                    await ready
+                finally:
+                    loop.remove_reader(fd)
+            elif state == psycopg2.extensions.POLL_WRITE:
+                loop.add_writer(fd, on_ready)
+                try:
+                    await ready
+                finally:
+                    loop.remove_writer(fd)
+            else:
+                raise psycopg2.OperationalError(f"Unexpected poll state: {state}")
+    
+    async def _acquire(self):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.size)
+        await self.semaphore.acquire()
+        if self.idle:
+            return self.idle.pop()
+        try:
+            conn = psycopg2.connect(async_=True, **DB_CONFIG)
+            await self._wait(conn)
+            return conn
+        except BaseException:
+            self.semaphore.release()
+            raise
+    
+    def _release(self, conn, broken: bool = False):
+        if broken or conn.closed:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        else:
+            self.idle.append(conn)
+        self.semaphore.release()
+    
+    async def execute(self, query: str, params=None, fetch: str = "all"):
+        """Run a query (autocommit) - fetch is "all", "one" or None"""
+        conn = await self._acquire()
+        broken = False
+        try:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute(query, params)
+            await self._wait(conn)
+            if fetch is None or cur.description is None:
+                rows = cur.rowcount
+            elif fetch == "one":
+                row = cur.fetchone()
+                rows = dict(row) if row else None
+            else:
+                rows = [dict(row) for row in cur.fetchall()]
+            cur.close()
+            return rows
+        except BaseException:
+            broken = True
+            raise
+        finally:
+            self._release(conn, broken)
+    
+    def close(self):
+        for conn in self.idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self.idle = []
+
+async_db_pool = AsyncDBPool(int(os.environ.get("ASYNC_DB_POOL_SIZE", "10")))
+
+async def db_fetch(query: str, params=None) -> List[Dict]:
+    """Async helper - run a query and return all rows as dicts"""
+    return await async_db_pool.execute(query, params, fetch="all")
+
+async def db_fetchone(query: str, params=None) -> Optional[Dict]:
+    """Async helper - run a query and return the first row as a dict"""
+    return await async_db_pool.execute(query, params, fetch="one")
+
+async def db_execute(query: str, params=None) -> int:
+    """Async helper - run a statement and return the affected row count"""
+    return await async_db_pool.execute(query, params, fetch=None)
+
+def load_async_handler(api_def: Dict, code, state: Dict = None):
+    """Run an async API's module code once and return its handler coroutine function"""
+    namespace = build_execution_context(state=state)
+    namespace.update({
+        "http": get_async_http_client(),
+        "db_fetch": db_fetch,
+        "db_fetchone": db_fetchone,
+        "db_execute": db_execute,
+    })
+    exec(code, namespace)
+    handler = namespace.get("handler")
+    if not (asyncio.iscoroutinefunction(handler) or inspect.isasyncgenfunction(handler)):
+        raise ValueError("Async APIs must define 'async def handler(request_data)'")
+    return handler
+
+async def execute_async_handler(handler, request_data: Dict, setup_state: APISetupState = None, log_id: str = None) -> Dict[str, Any]:
+    """Await an async API handler on the event loop and return the same shape as execute_python_code"""
+    output = LoggingStringIO(log_id=log_id)
+    error_output = StringIO()
+    # Context variables are task-local, so concurrent handlers keep separate output
+    stdout_token = execution_stdout.set(output)
+    stderr_token = execution_stderr.set(error_output)
+    result = None
+    acquired = False
+    try:
+        if setup_state is not None:
+            if setup_state.acquire(run_setup=False) is None:
+                # setup() failed when the API was loaded - retry it off the event loop
+                await asyncio.to_thread(setup_state.acquire)
+            # The names are bound into the handler's module when setup() succeeds (see on_ready)
+            acquired = True
+        if inspect.isasyncgenfunction(handler):
+            # An async generator handler streams whatever it yields
+            result = handler(request_data)
+        else:
+            result = await handler(request_data)
+        if is_stream_result(result):
+            result = ResultStream(result, output)
+        elif result is None:
+            result = {"message": "Code executed but handler returned None", "warning": "Check code execution"}
+    except Exception as exec_error:
+        error_output.write(f"Execution error: {str(exec_error)}\n")
+        error_output.write(traceback.format_exc())
+    finally:
+        if acquired:
+            setup_state.release()
+        execution_stdout.reset(stdout_token)
+        execution_stderr.reset(stderr_token)
+        if not isinstance(result, ResultStream):
+            output.finish()
+    stderr_text = error_output.getvalue()
+    return {
+        "result": result,
+        "stdout": output.getvalue(),
+        "stderr": stderr_text,
+        "success": len(stderr_text) == 0
+    }
+
+# === REQUEST DATA ===
+REQUEST_SPOOL_MAX_MEMORY = 1024 * 1024  # Bodies read with stream() move to a temp file beyond this
+REQUEST_KEY_BODY_MAX_BYTES = 1024 * 1024  # Larger bodies are not hashed into cache/coalescing keys
+BODY_METHODS = ("POST", "PUT", "PATCH")
+FORM_CONTENT_TYPES = ("application/x-www-form-urlencoded", "multipart/form-data")
+
+class RequestData(dict):
+    """request_data of a dynamic API call - the body is only read and parsed when the code asks for it.
+    
+    Code running in a thread uses request_data["body"] or the blocking accessors
+    (read, text, json, form, stream), which hand the I/O to the event loop.
+    Async handlers use the awaitable ones (aread, ajson, aform, astream)."""
+    
+    def __init__(self, request: Request, loop: asyncio.AbstractEventLoop):
+        super().__init__(
+            path=str(request.url.path),
+            method=request.method,
+            path_params=dict(request.path_params),
+            query_params=dict(request.query_params),
+            headers=dict(request.headers),
+        )
+        self._request = request
+        self._loop = loop
+        self._spool = None
+        self._form = None
+    
+    @property
+    def content_type(self) -> str:
+        return self["headers"].get("content-type", "").split(";")[0].strip().lower()
+    
+    @property
+    def has_body(self) -> bool:
+        return self["method"] in BODY_METHODS
+    
+    # "body" behaves like a regular key, filled on first access
+    def __missing__(self, key):
+        if key == "body" and self.has_body:
+            return self._run(self._load_body())
+        raise KeyError(key)
+    
+    def get(self, key, default=None):
+        """Like dict.get - but in an async handler, get("body") before the body was loaded raises
+        RuntimeError rather than returning default, which would look like an empty request"""
+        try:
+            return self[key]
+        except KeyError:
+            return default
+    
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or (key == "body" and self.has_body)
+    
+    def _run(self, coro):
+        """Run a coroutine on the event loop and wait for it - called from the execution thread"""
         try:
-            importlib.invalidate_caches()
-        except:
+            asyncio.get_running_loop()
+        except RuntimeError:
             pass
-        # ===== End minimal cleanup =====
-        
-        # Create execution context with helper functions
-        context = {
-            "request_data": request_data or {},
-            "json": json,
-            "datetime": datetime,
-            "result": None,
-            "start_background_job": start_background_job,
-            "add_progress_log": add_progress_log,
-            "update_job_status": update_job_status,
-            "check_job_running": check_job_running,
-            "threading": threading,
-            "asyncio": asyncio,
-            "requests": requests,
-            "smtplib": smtplib,
-            "EmailMessage": EmailMessage,
-            "psycopg2": psycopg2,
-            "traceback": traceback
-        }
+        else:
+            coro.close()
+            raise RuntimeError("The request body is not loaded yet - async handlers must use "
+                               "await request_data.ajson(), aread(), aform() or astream()")
+        check_cancelled()
+        control = execution_control.get()
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        return future.result(timeout=control.remaining() if control is not None else None)
+    
+    async def _load_body(self):
+        if self.content_type == "multipart/form-data":
+            # Not read into memory - uploaded files are spooled by the form parser
+            body = dict(await self.aform())
+        else:
+            # JSON is tried first whatever the content type, as clients often mislabel it
+            raw = await self.aread()
+            try:
+                body = json.loads(raw) if raw else None
+            except ValueError:
+                if self.content_type in FORM_CONTENT_TYPES:
+                    body = dict(await self.aform())
+                else:
+                    body = None  # Not JSON - the raw bytes stay available via read()
+        self["body"] = body
+        return body
+    
+    async def aread(self) -> bytes:
+        """The whole body as bytes"""
+        if self._spool is not None:
+            self._spool.seek(0)
+            return self._spool.read()
+        return await self._request.body()
+    
+    async def ajson(self):
+        """The body parsed as JSON - raises ValueError if it is not JSON"""
+        body = json.loads(await self.aread())
+        self["body"] = body
+        return body
+    
+    async def aform(self):
+        """Form fields and uploaded files (multipart files are spooled to disk when large)"""
+        if self._form is None:
+            if self.content_type != "multipart/form-data":
+                # Keep the (small) body readable after parsing
+                await self.aread()
+            self._form = await self._request.form()
+        return self._form
+    
+    async def astream(self):
+        """The body as a file object, spooled to disk beyond REQUEST_SPOOL_MAX_MEMORY"""
+        if self._spool is None:
+            spool = tempfile.SpooledTemporaryFile(max_size=REQUEST_SPOOL_MAX_MEMORY)
+            async for chunk in self._request.stream():
+                spool.write(chunk)
+            self._spool = spool
+        self._spool.seek(0)
+        return self._spool
+    
+    def read(self) -> bytes:
+        return self._run(self.aread())
+    
+    def text(self, encoding: str = "utf-8") -> str:
+        return self.read().decode(encoding, errors="replace")
+    
+    def json(self):
+        return self._run(self.ajson())
+    
+    def form(self):
+        return self._run(self.aform())
+    
+    def stream(self):
+        return self._run(self.astream())
+    
+    def materialize(self) -> Dict[str, Any]:
+        """Plain dict with the body loaded - for code running in another process.
         
-        # Execute code with unbuffered output for real-time prints
-        import builtins
-        original_print = builtins.print
+        Uploaded files become {"filename", "content_type", "content"} dicts, as file objects cannot be pickled."""
+        data = dict(self)
+        if self.has_body:
+            body = self["body"]
+            if isinstance(body, dict):
+                body = {
+                    name: {"filename": value.filename, "content_type": value.content_type, "content": value.file.read()}
+                    if isinstance(value, UploadFile) else value
+                    for name, value in body.items()
+                }
+            data["body"] = body
+        return data
+    
+    async def aclose(self):
+        if self._form is not None:
+            await self._form.close()
+        if self._spool is not None:
+            self._spool.close()
+
+# === JSON ENCODING ===
+# Responses are serialized once to bytes - the same buffer is sent and previewed in the log.
+# orjson is used when installed (optional), otherwise the standard library.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _encode_decimal(value: decimal.Decimal):
+    # Same convention as FastAPI: integral decimals become ints, others floats
+    return int(value) if value.as_tuple().exponent >= 0 else float(value)
+
+# Type -> function returning a JSON-serializable value (matched along the MRO).
+# orjson encodes datetime and UUID natively, with the same ISO format.
+JSON_TYPE_ENCODERS = {
+    datetime.datetime: lambda value: value.isoformat(),
+    datetime.date: lambda value: value.isoformat(),
+    datetime.time: lambda value: value.isoformat(),
+    decimal.Decimal: _encode_decimal,
+    uuid.UUID: str,
+    set: list,
+    frozenset: list,
+    bytes: lambda value: value.decode("utf-8", errors="replace"),
+}
+
+def register_json_encoder(value_type: type, encoder):
+    """Teach encode_json how to serialize another type"""
+    JSON_TYPE_ENCODERS[value_type] = encoder
+
+def json_default(value):
+    """Fallback for values JSON cannot encode natively - unknown types become str() as before"""
+    for value_type in type(value).__mro__:
+        encoder = JSON_TYPE_ENCODERS.get(value_type)
+        if encoder is not None:
+            return encoder(value)
+    return str(value)
+
+def encode_json(value) -> bytes:
+    """Serialize a value to compact UTF-8 JSON bytes"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+        except (orjson.JSONEncodeError, TypeError):
+            pass  # e.g. integers beyond 64 bits - the standard library handles those
+    return json.dumps(value, default=json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+# === STREAMING RESULTS ===
+STREAM_BATCH_BYTES = 64 * 1024  # Encoded bytes pulled from a result iterator per step
+STREAM_LOG_PREFIX_BYTES = 1000  # Bytes of a streamed response kept in its log entry
+# Process-mode APIs cannot stream - iterator results larger than this (encoded) fail instead
+PROCESS_STREAM_MAX_BYTES = int(os.environ.get("PROCESS_STREAM_MAX_BYTES", str(64 * 1024 * 1024)))
+
+def is_stream_result(result) -> bool:
+    """Iterators, generators and async iterators are streamed - anything else is sent whole"""
+    return isinstance(result, (collections.abc.Iterator, collections.abc.AsyncIterator))
+
+class ResultStream:
+    """Iterator result of an execution, encoded and pulled one batch at a time.
+    
+    Only one batch is held in memory, and the next one is not produced until the
+    previous one was sent, so memory stays flat for any response size."""
+    
+    def __init__(self, iterator, output=None):
+        self.iterator = iterator
+        self.output = output  # The execution's print buffer - prints made while streaming land there too
+        self.is_async = isinstance(iterator, collections.abc.AsyncIterator)
+        self.error = None  # Raised by the iterator after items of the current batch - re-raised on the next pull
+        self.pulling = None  # Pull running on the execution pool
+    
+    def _pull(self, encode, control: ExecutionControl = None):
+        if self.error is not None:
+            raise self.error
+        chunks = []
+        size = 0
+        stdout_token = execution_stdout.set(self.output)
+        # print() and requests in the iterator stop once the stream timed out
+        control_token = execution_control.set(control)
+        try:
+            for item in self.iterator:
+                chunk = encode(item)
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= STREAM_BATCH_BYTES:
+                    return b"".join(chunks), False
+            return b"".join(chunks), True
+        except Exception as e:
+            if not chunks:
+                raise
+            # Send what was produced before the error first
+            self.error = e
+            return b"".join(chunks), False
+        finally:
+            execution_stdout.reset(stdout_token)
+            execution_control.reset(control_token)
+    
+    async def _pull_async(self, encode):
+        if self.error is not None:
+            raise self.error
+        chunks = []
+        size = 0
+        stdout_token = execution_stdout.set(self.output)
+        try:
+            async for item in self.iterator:
+                chunk = encode(item)
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= STREAM_BATCH_BYTES:
+                    return b"".join(chunks), False
+            return b"".join(chunks), True
+        except Exception as e:
+            if not chunks:
+                raise
+            self.error = e
+            return b"".join(chunks), False
+        finally:
+            execution_stdout.reset(stdout_token)
+    
+    async def _next_batch(self, encode, control: ExecutionControl = None):
+        """Pull one batch within the time the execution has left - raises TimeoutError beyond it"""
+        remaining = control.remaining() if control is not None else None
+        try:
+            if self.is_async:
+                # Cancelling the pull stops the async iterator at its current await
+                return await asyncio.wait_for(self._pull_async(encode), remaining)
+            self.pulling = asyncio.ensure_future(api_execution_pool.run(self._pull, encode, control))
+            return await asyncio.wait_for(asyncio.shield(self.pulling), remaining)
+        except asyncio.TimeoutError:
+            if control is not None:
+                # The thread stops at the iterator's next print, requests call or check_cancelled()
+                control.cancelled.set()
+            raise TimeoutError(f"Execution timed out after {control.timeout}s") from None
+    
+    async def batches(self, encode, control: ExecutionControl = None):
+        """Yield encoded batches - sync iterators are advanced on the execution pool"""
+        try:
+            done = False
+            while not done:
+                batch, done = await self._next_batch(encode, control)
+                if batch:
+                    yield batch
+        finally:
+            await self.close()
+    
+    async def _close_when_idle(self, pulling):
+        try:
+            await pulling
+        except BaseException:
+            pass
+        await api_execution_pool.run(self.iterator.close)
+    
+    async def close(self):
+        """Close the iterator, e.g. when the client disconnected mid-stream"""
+        try:
+            if self.pulling is not None and not self.pulling.done():
+                # A pull that timed out still runs the generator - closing it now would fail
+                asyncio.ensure_future(self._close_when_idle(self.pulling))
+            elif hasattr(self.iterator, "aclose"):
+                await self.iterator.aclose()
+            elif hasattr(self.iterator, "close"):
+                await api_execution_pool.run(self.iterator.close)
+        finally:
+            if isinstance(self.output, LoggingStringIO):
+                self.output.finish()
+
+def encode_ndjson_item(item) -> bytes:
+    return encode_json(item) + b"\n"
+
+def encode_json_array_item(item) -> bytes:
+    # Every item gets a leading comma - the first one is replaced by "[" when sent
+    return b"," + encode_json(item)
+
+# Execute Python code safely
+def collect_stream_result(iterator, control: ExecutionControl = None) -> list:
+    """Items of an iterator result, encoded like a response - for worker processes, which cannot stream.
+    
+    Bounded like a stream: fails past PROCESS_STREAM_MAX_BYTES or the execution's deadline."""
+    items = []
+    size = 0
+    try:
+        for item in iterator:
+            chunk = encode_json(item)
+            size += len(chunk)
+            if size > PROCESS_STREAM_MAX_BYTES:
+                raise ValueError(f"Iterator result exceeds {PROCESS_STREAM_MAX_BYTES} bytes - process mode sends results whole")
+            if control is not None and control.remaining() == 0:
+                raise TimeoutError(f"Execution timed out after {control.timeout}s")
+            items.append(json.loads(chunk))
+    finally:
+        if hasattr(iterator, "close"):
+            iterator.close()
+    return items
+
+def execute_python_code(code, request_data: Dict = None, log_id: str = None, control: ExecutionControl = None, setup_state: APISetupState = None, collect_stream: bool = False) -> Dict[str, Any]:
+    """Execute Python code (source string or compiled code object) and return result
+    
+    With collect_stream, an iterator result is consumed here as a list - while its prints are still captured."""
+    output = LoggingStringIO(log_id=log_id)
+    error_output = StringIO()
+    result = None
+    
+    # Capture output of this execution only (context-local, safe under concurrency)
+    stdout_token = execution_stdout.set(output)
+    stderr_token = execution_stderr.set(error_output)
+    control_token = execution_control.set(control)
+    acquired = False
+    
+    try:
+        # sys.path was prepared once by setup_interpreter - no per-call import work here
         
-        def print_with_flush(*args, **kwargs):
-            """Custom print that flushes immediately"""
-            original_print(*args, **kwargs)
-            if hasattr(sys.stdout, 'flush'):
-                sys.stdout.flush()
+        # Objects built once by the API's setup() - a failed setup is retried here
+        state = None
+        if setup_state is not None:
+            state = setup_state.acquire()
+            acquired = True
         
-        builtins.print = print_with_flush
+        # Create execution context with helper functions
+        context = build_execution_context(request_data, state)
         
+        # Prints reach the LoggingStringIO as they happen - no global print patching needed
         try:
             exec(code, context)
+        except ExecutionCancelled as cancelled:
+            error_output.write(f"Execution cancelled: {cancelled}\n")
         except Exception as exec_error:
             # If execution fails, capture the error
             error_output.write(f"Execution error: {str(exec_error)}\n")
             error_output.write(traceback.format_exc())
             # Don't set result here, let it be handled below
-        finally:
-            # Restore original print
-            builtins.print = original_print
         
         # Get result if set
         result = context.get("result")
+        if is_stream_result(result) and collect_stream:
+            try:
+                result = collect_stream_result(result, control)
+            except Exception as stream_error:
+                result = None
+                error_output.write(f"Execution error: {str(stream_error)}\n")
+                error_output.write(traceback.format_exc())
+        elif is_stream_result(result):
+            # Iterators are consumed while the response is streamed
+            result = ResultStream(result, output)
         # If result is None or not set, provide a default
-        if result is None:
+        elif result is None:
             # Check if result was ever set in context
             if "result" not in context:
                 # Result was never set - code didn't execute result assignment
@@ -721,8 +2584,13 @@ def execute_python_code(code: str, request_data: Dict = None, log_id: str = None
         error_output.write("\n")
         error_output.write(traceback.format_exc())
     finally:
-        sys.stdout = old_stdout
-        sys.stderr = old_stderr
+        if acquired:
+            setup_state.release()
+        execution_stdout.reset(stdout_token)
+        execution_stderr.reset(stderr_token)
+        execution_control.reset(control_token)
+        if not isinstance(result, ResultStream):
+            output.finish()  # A stream's prints keep coming until the response ends
     
     stdout_text = output.getvalue()
     stderr_text = error_output.getvalue()
@@ -734,34 +2602,812 @@ def execute_python_code(code: str, request_data: Dict = None, log_id: str = None
         "success": len(stderr_text) == 0
     }
 
-# Dynamic route handler
-def create_dynamic_route(api_def: Dict):
-    """Create a dynamic FastAPI route"""
+# Shared execution pool for dynamic API code
+API_EXECUTOR_MAX_WORKERS = int(os.environ.get("API_EXECUTOR_MAX_WORKERS", "32"))
+# Global load shedding - new executions are rejected while the pool is this backed up (0 disables)
+LOAD_SHED_MAX_QUEUED = int(os.environ.get("LOAD_SHED_MAX_QUEUED", "0"))
+LOAD_SHED_MAX_WAIT_MS = float(os.environ.get("LOAD_SHED_MAX_WAIT_MS", "0"))
+
+class ExecutionPool:
+    """Application-wide bounded thread pool that tracks queue wait and active/queued counts"""
+    
+    def __init__(self, max_workers: int, shed_max_queued: int = 0, shed_max_wait_ms: float = 0):
+        self.max_workers = max_workers
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="api-exec")
+        self.lock = threading.Lock()
+        self.active = 0
+        self.queued = 0
+        self.completed = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.avg_wait_ms = 0.0  # Exponential moving average of recent queue waits
+        self.shed_max_queued = shed_max_queued
+        self.shed_max_wait_ms = shed_max_wait_ms
+        self.shed = 0
+        self.timed_out_running = 0
+    
+    def should_shed(self) -> bool:
+        """True when new work should be rejected because the pool is backed up"""
+        with self.lock:
+            overloaded = (
+                (self.shed_max_queued and self.queued >= self.shed_max_queued)
+                or (self.shed_max_wait_ms and self.queued and self.avg_wait_ms >= self.shed_max_wait_ms)
+            )
+            if overloaded:
+                self.shed += 1
+            return bool(overloaded)
+    
+    async def run(self, fn, *args):
+        """Run fn(*args) on the pool and await its result"""
+        submitted = time.monotonic()
+        
+        def run_tracked():
+            wait_ms = (time.monotonic() - submitted) * 1000
+            with self.lock:
+                self.queued -= 1
+                self.active += 1
+                self.total_wait_ms += wait_ms
+                self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+                self.avg_wait_ms = self.avg_wait_ms * 0.8 + wait_ms * 0.2
+            try:
+                return fn(*args)
+            finally:
+                with self.lock:
+                    self.active -= 1
+                    self.completed += 1
+        
+        def on_done(future):
+            # A future cancelled while still queued never reaches run_tracked
+            if future.cancelled():
+                with self.lock:
+                    self.queued -= 1
+        
+        with self.lock:
+            self.queued += 1
+        future = self.executor.submit(run_tracked)
+        future.add_done_callback(on_done)
+        return await asyncio.wrap_future(future)
+    
+    def track_timed_out(self, execution: asyncio.Future):
+        """The caller gave up on execution (it timed out) - count its thread until the code actually returns"""
+        with self.lock:
+            self.timed_out_running += 1
+        
+        def on_done(_):
+            with self.lock:
+                self.timed_out_running -= 1
+        execution.add_done_callback(on_done)
+    
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            started = self.completed + self.active
+            return {
+                "max_workers": self.max_workers,
+                "active": self.active,
+                "queued": self.queued,
+                "completed": self.completed,
+                "avg_queue_wait_ms": round(self.total_wait_ms / started, 3) if started else 0.0,
+                "recent_queue_wait_ms": round(self.avg_wait_ms, 3),
+                "max_queue_wait_ms": round(self.max_wait_ms, 3),
+                "shed": self.shed,
+                # Threads still running code whose request already got a 504
+                "timed_out_running": self.timed_out_running,
+            }
+    
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+api_execution_pool = ExecutionPool(API_EXECUTOR_MAX_WORKERS, LOAD_SHED_MAX_QUEUED, LOAD_SHED_MAX_WAIT_MS)
+
+# Worker processes for APIs with execution_mode "process"
+API_PROCESS_WORKERS = int(os.environ.get("API_PROCESS_WORKERS", "4"))
+
+def _make_picklable(exec_result: Dict[str, Any]) -> Dict[str, Any]:
+    """Round-trip the result through JSON so it can be sent back from a worker process"""
+    exec_result = dict(exec_result)
+    # Same encoders as a thread-mode response, so Decimal, bytes, sets, ... come back identically
+    exec_result["result"] = json.loads(encode_json(exec_result.get("result")))
+    return exec_result
+
+def _process_worker_main(conn):
+    """Worker process loop - keeps compiled API code loaded and runs executions on request"""
+    # json, requests and psycopg2 are already imported with this module
+    code_cache = {}  # api_id -> (version, code object, setup state)
+    
+    def unload_api(api_id):
+        entry = code_cache.pop(api_id, None)
+        if entry is not None and entry[2] is not None:
+            entry[2].retire()
+    
+    def load_api(api_id, version, source):
+        # Every worker runs the API's setup() once, when the code is loaded
+        unload_api(api_id)
+        code_obj = compile_api_code(source, api_id)
+        setup_code = compile_setup_code(source, api_id)
+        setup_state = APISetupState(api_id, setup_code) if setup_code is not None else None
+        if setup_state is not None:
+            setup_state.start()
+        code_cache[api_id] = (version, code_obj, setup_state)
+        return code_cache[api_id]
+    
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError, KeyboardInterrupt):
+            break
+        kind = message[0]
+        if kind == "load":
+            _, api_id, version, source, modules = message
+            preload_modules(modules, api_id)
+            try:
+                load_api(api_id, version, source)
+            except SyntaxError:
+                unload_api(api_id)
+        elif kind == "unload":
+            unload_api(message[1])
+        elif kind == "run":
+            _, api_id, version, source, request_data, log_id, timeout, remaining = message
+            entry = code_cache.get(api_id)
+            if entry is None or entry[0] != version:
+                try:
+                    entry = load_api(api_id, version, source)
+                except Exception as e:
+                    conn.send({"result": None, "stdout": "", "stderr": f"Execution error: {str(e)}\n", "success": False})
+                    continue
+            # The caller kills this worker at the deadline - the control lets the code finish cleanly before it
+            control = None
+            if remaining is not None:
+                control = ExecutionControl(remaining)
+                control.timeout = timeout  # Reported in errors - remaining is what was left of it
+            # Iterators cannot cross the process boundary - process mode sends them whole
+            exec_result = execute_python_code(entry[1], request_data, log_id=log_id, control=control, setup_state=entry[2], collect_stream=True)
+            try:
+                conn.send(exec_result)
+            except Exception:
+                try:
+                    conn.send(_make_picklable(exec_result))
+                except Exception as e:
+                    # A result that cannot be encoded fails this execution, not the worker
+                    conn.send({
+                        "result": None,
+                        "stdout": exec_result["stdout"],
+                        "stderr": exec_result["stderr"] + f"Execution error: result cannot be sent from the worker process: {str(e)}\n",
+                        "success": False,
+                    })
+    # Prints of the last executions may still be queued
+    log_writer.close()
+
+class ProcessWorker:
+    """One pre-forked worker process and the pipe used to talk to it"""
+    
+    def __init__(self, ctx, index: int):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_process_worker_main, args=(child_conn,), name=f"api-worker-{index}", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.index = index
+        self.loaded = {}  # api_id -> code version already compiled in the worker
+        self.send_lock = threading.Lock()
+    
+    def send(self, message):
+        with self.send_lock:
+            self.conn.send(message)
+    
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.join(timeout=1)
+        except Exception:
+            pass
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+class ProcessWorkerPool:
+    """Pool of pre-warmed worker processes for CPU-bound APIs (started on first use)"""
+    
+    def __init__(self, size: int):
+        self.size = size
+        self.ctx = multiprocessing.get_context("spawn")
+        self.cond = threading.Condition()
+        self.workers = []
+        self.idle = []
+        self.api_code = {}  # api_id -> (version, source, preload modules) pushed to every worker
+        self.executions = 0
+        self.restarts = 0
+    
+    def ensure_started(self):
+        with self.cond:
+            if self.workers:
+                return
+            for index in range(self.size):
+                worker = ProcessWorker(self.ctx, index)
+                self.workers.append(worker)
+                self.idle.append(worker)
+    
+    def _load_into(self, worker: ProcessWorker, api_id: str, version: str, source: str, modules: List[str]):
+        worker.send(("load", api_id, version, source, modules))
+        worker.loaded[api_id] = version
+    
+    def load(self, api_id: str, version: str, source: str, modules: List[str] = None):
+        """Import modules and compile an API's code in every worker ahead of its first request"""
+        self.ensure_started()
+        with self.cond:
+            self.api_code[api_id] = (version, source, modules or [])
+            workers = list(self.workers)
+        for worker in workers:
+            try:
+                self._load_into(worker, api_id, version, source, modules or [])
+            except Exception as e:
+                print(f"Error loading API {api_id} into {worker.process.name}: {e}")
+    
+    def unload(self, api_id: str):
+        with self.cond:
+            if self.api_code.pop(api_id, None) is None:
+                return
+            workers = list(self.workers)
+        for worker in workers:
+            try:
+                worker.send(("unload", api_id))
+                worker.loaded.pop(api_id, None)
+            except Exception:
+                pass
+    
+    def _replace(self, worker: ProcessWorker) -> ProcessWorker:
+        """Kill a worker and start a fresh one pre-loaded with all process-mode APIs"""
+        worker.kill()
+        replacement = ProcessWorker(self.ctx, worker.index)
+        with self.cond:
+            self.workers = [replacement if w is worker else w for w in self.workers]
+            api_code = dict(self.api_code)
+            self.restarts += 1
+        for api_id, (version, source, modules) in api_code.items():
+            self._load_into(replacement, api_id, version, source, modules)
+        return replacement
+    
+    def run(self, api_id: str, version: str, source: str, request_data: Dict, log_id: str = None, control: ExecutionControl = None) -> Dict[str, Any]:
+        """Run an API in an idle worker process - blocks the calling thread until it finishes"""
+        self.ensure_started()
+        with self.cond:
+            while not self.idle:
+                self.cond.wait()
+            worker = self.idle.pop()
+        try:
+            if control is not None:
+                # On timeout the worker is killed - recv() below then fails and the worker is replaced.
+                # Under the lock claim() reads on_cancel with, so a timeout either sees the callback or is seen here.
+                with control.lock:
+                    control.on_cancel = worker.process.kill
+                    timed_out = control.state == "timeout"
+                if timed_out:
+                    return {"result": None, "stdout": "", "stderr": "Execution cancelled before it started\n", "success": False}
+            with worker.send_lock:
+                send_source = source if worker.loaded.get(api_id) != version else None
+                timeout, remaining = (control.timeout, control.remaining()) if control is not None else (None, None)
+                worker.conn.send(("run", api_id, version, send_source, request_data, log_id, timeout, remaining))
+                worker.loaded[api_id] = version
+            exec_result = worker.conn.recv()
+            with self.cond:
+                self.executions += 1
+            return exec_result
+        except (EOFError, OSError) as e:
+            # The worker died (or was killed on timeout) mid-execution - replace it so the pool stays full
+            worker = self._replace(worker)
+            if control is not None and control.cancelled.is_set():
+                return {"result": None, "stdout": "", "stderr": "Execution cancelled: worker process killed on timeout\n", "success": False}
+            return {"result": None, "stdout": "", "stderr": f"Worker process exited unexpectedly ({type(e).__name__})\n", "success": False}
+        finally:
+            if control is not None:
+                with control.lock:
+                    control.on_cancel = None
+            with self.cond:
+                self.idle.append(worker)
+                self.cond.notify()
+    
+    def stats(self) -> Dict[str, Any]:
+        with self.cond:
+            return {
+                "size": self.size,
+                "started": bool(self.workers),
+                "alive": sum(1 for w in self.workers if w.process.is_alive()),
+                "busy": len(self.workers) - len(self.idle),
+                "executions": self.executions,
+                "restarts": self.restarts,
+                "apis_loaded": len(self.api_code),
+            }
+    
+    def shutdown(self):
+        with self.cond:
+            workers, self.workers, self.idle = self.workers, [], []
+        for worker in workers:
+            worker.kill()
+
+api_process_pool = ProcessWorkerPool(API_PROCESS_WORKERS)
+
+class APIConcurrencyLimiter:
+    """Caps concurrent executions of one API and bounds how many requests may wait for a slot"""
+    
+    def __init__(self, max_concurrency: int = None, queue_depth: int = None):
+        self.max_concurrency = max_concurrency
+        self.queue_depth = queue_depth
+        self.semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self.active = 0
+        self.queued = 0
+        self.rejected = 0
+        self.total_wait_ms = 0.0
+        self.acquired = 0
+        self.timed_out_running = 0
+    
+    async def acquire(self) -> bool:
+        """Wait for an execution slot - returns False if the wait queue is full"""
+        if self.semaphore is None:
+            self.active += 1
+            self.acquired += 1
+            return True
+        if self.semaphore.locked() and self.queue_depth is not None and self.queued >= self.queue_depth:
+            self.rejected += 1
+            return False
+        start = time.monotonic()
+        self.queued += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.queued -= 1
+        self.total_wait_ms += (time.monotonic() - start) * 1000
+        self.active += 1
+        self.acquired += 1
+        return True
+    
+    def release(self):
+        self.active -= 1
+        if self.semaphore is not None:
+            self.semaphore.release()
+    
+    def release_when_done(self, execution: asyncio.Future):
+        """Release the slot once a timed-out execution's thread returns - until then it still runs the API's code"""
+        self.timed_out_running += 1
+        
+        def on_done(_):
+            self.timed_out_running -= 1
+            self.release()
+        execution.add_done_callback(on_done)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self.queue_depth,
+            "active": self.active,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timed_out_running": self.timed_out_running,
+            "avg_queue_wait_ms": round(self.total_wait_ms / self.acquired, 3) if self.acquired else 0.0,
+        }
+
+class TokenBucket:
+    """Refills at `rate` tokens per second up to `burst` tokens"""
+    
+    def __init__(self, rate: float, burst: int = None):
+        self.rate = rate
+        self.burst = burst or max(1, math.ceil(rate))
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+    
+    def take(self, now: float) -> float:
+        """Take one token - returns 0 on success, otherwise seconds until one is available"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+# Per-client buckets kept per API - least recently seen clients are dropped beyond this
+RATE_LIMIT_MAX_CLIENTS = 10000
+
+class APIRateLimiter:
+    """Per-API and per-client-IP token buckets of one API.
+    
+    Only touched from the event loop, so no locking is needed."""
+    
+    def __init__(self, per_api: Dict = None, per_client: Dict = None):
+        self.api_bucket = TokenBucket(per_api["rate"], per_api.get("burst")) if per_api else None
+        self.per_client = per_client
+        self.client_buckets = collections.OrderedDict()  # client ip -> TokenBucket
+        self.allowed = 0
+        self.limited = 0
+    
+    def check(self, client_ip: Optional[str]) -> float:
+        """Take a token for this call - returns 0 if allowed, otherwise the seconds to wait"""
+        now = time.monotonic()
+        client_bucket = None
+        if self.per_client:
+            client_bucket = self.client_buckets.get(client_ip)
+            if client_bucket is None:
+                client_bucket = TokenBucket(self.per_client["rate"], self.per_client.get("burst"))
+                self.client_buckets[client_ip] = client_bucket
+                if len(self.client_buckets) > RATE_LIMIT_MAX_CLIENTS:
+                    self.client_buckets.popitem(last=False)
+            else:
+                self.client_buckets.move_to_end(client_ip)
+            retry_after = client_bucket.take(now)
+            if retry_after:
+                self.limited += 1
+                return retry_after
+        if self.api_bucket is not None:
+            retry_after = self.api_bucket.take(now)
+            if retry_after:
+                # The call is rejected, so the client keeps its token
+                if client_bucket is not None:
+                    client_bucket.tokens += 1
+                self.limited += 1
+                return retry_after
+        self.allowed += 1
+        return 0.0
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "per_api": {"rate": self.api_bucket.rate, "burst": self.api_bucket.burst} if self.api_bucket else None,
+            "per_client": self.per_client,
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "tracked_clients": len(self.client_buckets),
+        }
+
+async def compute_request_key(request: Request, key_fields: List[str], headers: List[str]) -> Optional[str]:
+    """Derive a key from the selected request fields - equal keys mean interchangeable requests.
+    
+    None if the body is part of the key but is not read into memory for it: multipart uploads,
+    bodies over REQUEST_KEY_BODY_MAX_BYTES and bodies of unknown length. Such requests bypass
+    the cache and coalescing instead of being buffered just to be hashed."""
+    # The path is always part of the key - a templated API serves many paths
+    parts = [request.url.path]
+    if "query_params" in key_fields:
+        parts.append(sorted(request.query_params.multi_items()))
+    if "headers" in key_fields:
+        parts.append([request.headers.get(name) for name in headers])
+    if "body" in key_fields and request.method in BODY_METHODS:
+        content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+        try:
+            length = int(request.headers.get("content-length", ""))
+        except ValueError:
+            length = None
+        if content_type == "multipart/form-data" or length is None or length > REQUEST_KEY_BODY_MAX_BYTES:
+            return None
+        # Starlette caches the body, so the handler can still read it afterwards
+        body = await request.body()
+        parts.append(hashlib.sha256(body).hexdigest())
+    return json.dumps(parts)
+
+class APIResponseCache:
+    """TTL + LRU cache of serialized successful responses of one API.
+    
+    Only touched from the event loop, so no locking is needed."""
+    
+    def __init__(self, ttl_seconds: float, max_entries: int = 256, key_fields: List[str] = None, headers: List[str] = None):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        # Responses are per caller unless configured otherwise - headers=[] shares them between callers
+        self.headers = [h.lower() for h in (headers if headers is not None else ["authorization"])]
+        self.key_fields = list(key_fields or ["query_params"])
+        if self.headers and "headers" not in self.key_fields:
+            self.key_fields.append("headers")
+        self.entries = collections.OrderedDict()  # key -> (expires_at, body)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bypassed = 0
+    
+    async def make_key(self, request: Request) -> Optional[str]:
+        """Key of the request - None if it cannot be cached (see compute_request_key)"""
+        key = await compute_request_key(request, self.key_fields, self.headers)
+        if key is None:
+            self.bypassed += 1
+        return key
+    
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self.entries[key]
+        self.misses += 1
+        return None
+    
+    def set(self, key: str, body: bytes):
+        self.entries[key] = (time.monotonic() + self.ttl, body)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+    
+    def clear(self):
+        self.entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "entries": len(self.entries),
+            "evictions": self.evictions,
+            "bypassed": self.bypassed,
+            "ttl_seconds": self.ttl,
+            "max_entries": self.max_entries
+        }
+
+class APIRuntime:
+    """In-memory runtime state of one registered dynamic API"""
+    
+    def __init__(self, api_def: Dict):
+        self.api_id = api_def["id"]
+        self.api_def = api_def
+        self.settings = get_api_settings(api_def)
+        self.limiter = APIConcurrencyLimiter(
+            self.settings.get("max_concurrency"),
+            self.settings.get("queue_depth")
+        )
+        # A new runtime is built on every update, so a changed API starts with an empty cache
+        cache_settings = self.settings.get("cache")
+        self.cache = None
+        if cache_settings and cache_settings.get("ttl_seconds"):
+            self.cache = APIResponseCache(
+                cache_settings["ttl_seconds"],
+                cache_settings.get("max_entries") or 256,
+                cache_settings.get("key"),
+                cache_settings.get("headers")
+            )
+        rate_limit = self.settings.get("rate_limit") or {}
+        self.rate_limiter = None
+        if rate_limit.get("per_api") or rate_limit.get("per_client"):
+            self.rate_limiter = APIRateLimiter(rate_limit.get("per_api"), rate_limit.get("per_client"))
+        # Single-flight: request key -> future resolved with (leader log id, response)
+        coalesce_settings = self.settings.get("coalesce")
+        self.coalesce = None
+        if coalesce_settings is not None:
+            self.coalesce = {
+                "key": coalesce_settings.get("key") or ["query_params", "headers", "body"],
+                "headers": [h.lower() for h in coalesce_settings.get("headers", ["authorization"])]
+            }
+        self.inflight = {}
+        self.coalesced = 0
+        self.timeout = self.settings.get("timeout_seconds") or API_DEFAULT_TIMEOUT_SECONDS or None
+        self.timeouts = 0
+        self.setup_state = None  # APISetupState if the code defines setup() (process mode: kept in each worker)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.api_def["path"],
+            "method": self.api_def["method"].upper(),
+            "concurrency": self.limiter.stats(),
+            "rate_limit": self.rate_limiter.stats() if self.rate_limiter else None,
+            "cache": self.cache.stats() if self.cache else None,
+            "coalesce": {"in_flight": len(self.inflight), "coalesced": self.coalesced} if self.coalesce else None,
+            "timeout_seconds": self.timeout,
+            "timeouts": self.timeouts,
+            "setup": self.setup_state.stats() if self.setup_state else None,
+        }
+
+# api_id -> APIRuntime of every registered dynamic API
+api_runtimes = {}
+
+# api_id -> number of its latest create_dynamic_route/remove_dynamic_route call. Registrations run in
+# threads and may finish out of order - one that was overtaken is discarded instead of swapped in.
+route_generations = {}
+# api_id -> code version of the registration still running for it
+pending_route_versions = {}
+
+def _next_route_generation(api_id: str) -> int:
+    """Caller holds dynamic_routes_lock"""
+    generation = route_generations[api_id] = route_generations.get(api_id, 0) + 1
+    pending_route_versions.pop(api_id, None)
+    return generation
+
+def registered_route_version(api_id: str) -> Tuple[bool, Optional[str]]:
+    """(registered, code version) of the API's in-progress registration, else of its current one"""
+    with dynamic_routes_lock:
+        if api_id in pending_route_versions:
+            return True, pending_route_versions[api_id]
+        runtime = api_runtimes.get(api_id)
+    return runtime is not None, api_code_version(runtime.api_def) if runtime is not None else None
+
+# Dynamic route handler
+def create_dynamic_route(api_def: Dict):
+    """Create (or replace) the handler for a dynamic API in the dispatch table.
+    
+    Blocks while modules are preloaded, worker processes are pre-warmed and setup() runs -
+    from the event loop use register_dynamic_route. The new handler is swapped in only once
+    all of that has finished; requests meanwhile keep using the previous one."""
+    path = api_def["path"]
+    method = api_def["method"].upper()
+    api_id = api_def["id"]
+    with dynamic_routes_lock:
+        generation = _next_route_generation(api_id)
+        pending_route_versions[api_id] = api_code_version(api_def)
+    try:
+        _build_dynamic_route(api_def, generation)
+    finally:
+        with dynamic_routes_lock:
+            if route_generations.get(api_id) == generation:
+                pending_route_versions.pop(api_id, None)
+
+def _build_dynamic_route(api_def: Dict, generation: int):
+    """Body of create_dynamic_route - swaps the handler in unless a later generation was requested"""
     path = api_def["path"]
     method = api_def["method"].upper()
-    code = api_def["python_code"]
     api_id = api_def["id"]
+    # Compile once at registration - requests reuse the cached code object
+    code = get_compiled_code(api_def)
+    runtime = APIRuntime(api_def)
+    execution_mode = runtime.settings.get("execution_mode") or "thread"
+    process_mode = execution_mode == "process"
+    version = api_code_version(api_def)
+    modules = runtime.settings.get("preload_modules") or []
+    preload_modules(modules, api_id)
+    if process_mode:
+        # Pre-warm: every worker process imports the modules and compiles the code before the first request
+        api_process_pool.load(api_id, version, api_def["python_code"], modules)
+    else:
+        api_process_pool.unload(api_id)
+        # setup() runs once here - worker processes run their own copy when the code is loaded
+        setup_code = compile_setup_code(api_def["python_code"], api_id)
+        if setup_code is not None:
+            runtime.setup_state = APISetupState(api_id, setup_code)
+            runtime.setup_state.start()
+    setup_state = runtime.setup_state
+    # Async APIs run their module code once here; requests just await the handler
+    try:
+        async_handler = load_async_handler(api_def, code, setup_state.state if setup_state else None) if execution_mode == "async" else None
+        if async_handler is not None and setup_state is not None:
+            # Names from setup() are globals of the handler's module - a setup() that failed here and
+            # succeeds on a later retry binds them then, not on every call
+            setup_state.on_ready = async_handler.__globals__.update
+    except Exception:
+        if setup_state is not None:
+            setup_state.retire()
+        raise
     
     async def dynamic_handler(request: Request):
-        # Get request data
-        request_data = {
-            "path": str(request.url.path),
-            "method": request.method,
-            "query_params": dict(request.query_params),
-            "headers": dict(request.headers),
-        }
+        # Rate limits are checked first - over-limit calls cost no DB write or thread handoff
+        if runtime.rate_limiter is not None:
+            retry_after = runtime.rate_limiter.check(request.client.host if request.client else None)
+            if retry_after:
+                return JSONResponse(
+                    content={"error": "Rate limit exceeded"},
+                    status_code=429,
+                    headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+                )
         
-        # Get body if POST/PUT/PATCH
-        if request.method in ["POST", "PUT", "PATCH"]:
-            try:
-                body = await request.json()
-                request_data["body"] = body
-            except:
-                request_data["body"] = None
+        # Cache hits are answered straight from memory - no executor, just a summary log row
+        cache = runtime.cache
+        cache_key = None
+        if cache is not None:
+            hit_start = time.perf_counter()
+            cache_key = await cache.make_key(request)
+        if cache_key is not None:
+            cached_body = cache.get(cache_key)
+            if cached_body is not None:
+                save_log_entry({
+                    "id": str(uuid.uuid4()),
+                    "timestamp": datetime.datetime.now().isoformat(),
+                    "method": request.method,
+                    "path": str(request.url.path),
+                    "query_params": dict(request.query_params),
+                    "client_ip": request.client.host if request.client else None,
+                    "status_code": 200,
+                    "status": "cached",
+                    "response_body": cached_body[:1000].decode("utf-8", errors="ignore"),
+                    "response_bytes": len(cached_body),
+                    "response_time_ms": (time.perf_counter() - hit_start) * 1000
+                })
+                return Response(content=cached_body, media_type="application/json", headers={"X-Cache": "HIT"})
+        
+        # Single-flight: join an identical request that is already executing
+        flight = None
+        flight_key = None
+        if runtime.coalesce is not None:
+            flight_key = await compute_request_key(request, runtime.coalesce["key"], runtime.coalesce["headers"])
+        if flight_key is not None:
+            shared = runtime.inflight.get(flight_key)
+            if shared is not None:
+                return await run_coalesced_handler(request, shared)
+            flight = asyncio.get_running_loop().create_future()
+            runtime.inflight[flight_key] = flight
+        
+        log_id = str(uuid.uuid4())
+        try:
+            response = await run_limited_handler(request, log_id)
+        except BaseException:
+            if flight is not None:
+                flight.cancel()
+            raise
+        finally:
+            if flight is not None:
+                runtime.inflight.pop(flight_key, None)
+        if flight is not None:
+            flight.set_result((log_id, response))
+        
+        if cache_key is not None and response.status_code == 200 and not isinstance(response, StreamingResponse):
+            cache.set(cache_key, response.body)
+            response.headers["X-Cache"] = "MISS"
+        return response
+    
+    async def run_limited_handler(request: Request, log_id: str):
+        # Shed new work while the shared execution pool is backed up
+        if api_execution_pool.should_shed():
+            return JSONResponse(
+                content={"error": "Server is overloaded, try again later"},
+                status_code=503,
+                headers={"Retry-After": "1"}
+            )
+        
+        # Wait for a slot of this API - reject fast when its wait queue is full
+        if not await runtime.limiter.acquire():
+            return JSONResponse(
+                content={"error": "API is at capacity, try again later"},
+                status_code=503,
+                headers={"Retry-After": "1"}
+            )
+        timed_out = []
+        try:
+            return await run_dynamic_handler(request, log_id, on_timeout=timed_out.append)
+        finally:
+            if timed_out:
+                # The thread still runs this API's code - the slot stays taken until it returns
+                runtime.limiter.release_when_done(timed_out[0])
+            else:
+                runtime.limiter.release()
+    
+    async def run_coalesced_handler(request: Request, shared: asyncio.Future):
+        start_time = datetime.datetime.now()
+        await asyncio.wait({shared})
+        if shared.cancelled():
+            # The leader never finished - execute this request on its own
+            return await run_limited_handler(request, str(uuid.uuid4()))
+        leader_log_id, response = shared.result()
+        if isinstance(response, StreamingResponse):
+            # A stream can only be sent once - execute this request on its own
+            return await run_limited_handler(request, str(uuid.uuid4()))
+        runtime.coalesced += 1
+        
+        # Every caller keeps its own log entry, pointing at the execution it shared
+        try:
+            save_log_entry({
+                "id": str(uuid.uuid4()),
+                "timestamp": start_time.isoformat(),
+                "method": request.method,
+                "path": str(request.url.path),
+                "query_params": dict(request.query_params),
+                "headers": dict(request.headers),
+                "client_ip": request.client.host if request.client else None,
+                "status_code": response.status_code,
+                "status": "completed" if response.status_code < 400 else "error",
+                "response_body": response.body.decode("utf-8", errors="replace")[:1000],
+                "stdout": "",
+                "prints": "",
+                "response_time_ms": (datetime.datetime.now() - start_time).total_seconds() * 1000,
+                "coalesced_from": leader_log_id
+            })
+        except Exception as e:
+            print(f"Error creating coalesced log entry: {e}")
+        
+        return Response(
+            content=response.body,
+            status_code=response.status_code,
+            media_type="application/json",
+            headers={"X-Coalesced-With": leader_log_id}
+        )
+    
+    async def run_dynamic_handler(request: Request, log_id: str, on_timeout=None):
+        """on_timeout(execution) is called with the still-running execution when a threaded call times out"""
+        # Get request data - the body is read only if the code uses it
+        request_data = RequestData(request, asyncio.get_running_loop())
         
         # Create log entry and return immediately
         start_time = datetime.datetime.now()
-        log_id = str(uuid.uuid4())
         
         # Create initial log entry showing execution started
         try:
@@ -769,9 +3415,9 @@ def create_dynamic_route(api_def: Dict):
                 "id": log_id,
                 "timestamp": start_time.isoformat(),
                 "method": request.method,
-                "path": str(request.url.path),
-                "query_params": dict(request.query_params),
-                "headers": dict(request.headers),
+                "path": request_data["path"],
+                "query_params": request_data["query_params"],
+                "headers": request_data["headers"],
                 "client_ip": request.client.host if request.client else None,
                 "status_code": None,  # Will be updated when complete
                 "status": "executing",  # executing, completed, error
@@ -786,40 +3432,68 @@ def create_dynamic_route(api_def: Dict):
         except Exception as e:
             print(f"Error creating log entry: {e}")
         
-        # Execute code in background thread but wait for result
-        def execute_in_thread():
+        # Update log entry with results (for logging only, not in API response)
+        def encode_response(exec_result):
+            """Serialize the response once - the same bytes are sent and previewed in the log"""
+            if exec_result["success"]:
+                api_result = exec_result.get("result")
+                # If result is None, provide a default message
+                if api_result is None:
+                    api_result = {"message": "API executed successfully but returned no result"}
+                return 200, encode_json({"result": api_result})
+            return 500, encode_json({"error": exec_result["stderr"]})
+        
+        def record_execution(exec_result):
+            if isinstance(exec_result.get("result"), ResultStream):
+                # Streamed results are logged when the stream ends
+                return None
+            status_code, body = encode_response(exec_result)
+            response_time = (datetime.datetime.now() - start_time).total_seconds() * 1000
+            
+            updates = {
+                "status_code": status_code,
+                "status": "completed" if exec_result["success"] else "error",
+                "response_body": body[:1000].decode("utf-8", errors="ignore"),
+                "response_bytes": len(body),
+                "response_time_ms": response_time
+            }
+            update_log_entry(log_id, updates)
+            return status_code, body
+        
+        control = ExecutionControl(runtime.timeout)
+        
+        def timeout_response():
+            runtime.timeouts += 1
+            error = f"Execution timed out after {runtime.timeout}s"
             try:
-                exec_result = execute_python_code(code, request_data, log_id=log_id)
-                response_time = (datetime.datetime.now() - start_time).total_seconds() * 1000
-                
-                # Update log entry with results (for logging only, not in API response)
-                response_body = json.dumps({
-                    "result": exec_result.get("result"),
-                    "error": exec_result.get("stderr") if not exec_result["success"] else None
-                }, default=str)[:1000]
-                
-                # Update log entry in PostgreSQL
                 update_log_entry(log_id, {
-                    "status_code": 200 if exec_result["success"] else 500,
-                    "status": "completed" if exec_result["success"] else "error",
-                    "response_body": response_body,
-                    "stdout": exec_result.get("stdout", ""),
-                    "response_time_ms": response_time
+                    "status_code": 504,
+                    "status": "timeout",
+                    "response_body": json.dumps({"error": error}),
+                    "response_time_ms": (datetime.datetime.now() - start_time).total_seconds() * 1000
                 })
-                
-                # Ensure prints field is set if not already updated
-                conn = get_db_connection()
-                cur = conn.cursor()
-                cur.execute("SELECT prints FROM api_logs WHERE id = %s", (log_id,))
-                row = cur.fetchone()
-                if row and (not row[0] or row[0].strip() == ""):
-                    cur.execute("UPDATE api_logs SET prints = %s WHERE id = %s", 
-                               (exec_result.get("stdout", ""), log_id))
-                    conn.commit()
-                cur.close()
-                return_db_connection(conn)
-                return exec_result, response_time
             except Exception as e:
+                print(f"Error recording timeout: {e}")
+            return JSONResponse(content={"error": error}, status_code=504)
+        
+        # Execute code in background thread but wait for result
+        def execute_in_thread():
+            if control.cancelled.is_set():
+                # Timed out while still queued for a thread
+                return None, None
+            try:
+                if process_mode:
+                    # Worker processes cannot reach this request - send the body along
+                    exec_result = api_process_pool.run(api_id, version, api_def["python_code"], request_data.materialize(), log_id=log_id, control=control)
+                else:
+                    exec_result = execute_python_code(code, request_data, log_id=log_id, control=control, setup_state=setup_state)
+                if not control.claim("finished"):
+                    # Timed out - the log entry already says so
+                    return exec_result, None
+                return exec_result, record_execution(exec_result)
+            except Exception as e:
+                if not control.claim("finished"):
+                    return None, None
                 print(f"Error in background execution: {e}")
                 # Update log with error
                 try:
@@ -830,49 +3504,201 @@ def create_dynamic_route(api_def: Dict):
                     })
                 except:
                     pass
-                return None, 0
+                return None, None
         
-        # Execute in thread pool executor (non-blocking for other requests, but wait for this one)
-        loop = asyncio.get_event_loop()
-        executor = concurrent.futures.ThreadPoolExecutor(max_workers=10)
-        try:
-            exec_result, response_time = await loop.run_in_executor(executor, execute_in_thread)
-        finally:
-            executor.shutdown(wait=False)
+        if async_handler is not None:
+            # Async APIs are awaited directly on the event loop - no thread handoff.
+            # On timeout wait_for cancels the handler, which really stops it.
+            try:
+                exec_result = await asyncio.wait_for(execute_async_handler(async_handler, request_data, setup_state, log_id=log_id), runtime.timeout)
+            except asyncio.TimeoutError:
+                control.claim("timeout")
+                return timeout_response()
+            try:
+                encoded = record_execution(exec_result)
+            except Exception as e:
+                print(f"Error recording async execution: {e}")
+                encoded = None
+        else:
+            # Execute on the shared pool (non-blocking for other requests, but wait for this one)
+            execution = asyncio.ensure_future(api_execution_pool.run(execute_in_thread))
+            try:
+                exec_result, encoded = await asyncio.wait_for(asyncio.shield(execution), runtime.timeout)
+            except asyncio.TimeoutError:
+                # Flag the thread (or kill the worker process) - unless it just finished
+                if control.claim("timeout"):
+                    api_execution_pool.track_timed_out(execution)
+                    if on_timeout is not None:
+                        on_timeout(execution)
+                    return timeout_response()
+                exec_result, encoded = await execution
+        
+        async def stream_response(stream: ResultStream):
+            stream_format = runtime.settings.get("stream_format") or "ndjson"
+            encode = encode_json_array_item if stream_format == "json" else encode_ndjson_item
+            batches = stream.batches(encode, control)
+            
+            def record(status_code: int, status: str, response_body: str, sent: int):
+                update_log_entry(log_id, {
+                    "status_code": status_code,
+                    "status": status,
+                    "response_body": response_body,
+                    "response_bytes": sent,
+                    "response_time_ms": (datetime.datetime.now() - start_time).total_seconds() * 1000
+                })
+            
+            # The first batch is pulled before the headers go out - a stream that fails
+            # or times out right away still gets a proper error status
+            try:
+                first_batch = await batches.__anext__()
+            except StopAsyncIteration:
+                first_batch = None
+            except TimeoutError:
+                return timeout_response()
+            except Exception as e:
+                print(f"Error streaming result: {e}")
+                error_body = json.dumps({"error": f"Stream error: {str(e)}"})
+                record(500, "error", f"{error_body}\n{traceback.format_exc()}"[:STREAM_LOG_PREFIX_BYTES * 2], 0)
+                return Response(content=error_body, status_code=500, media_type="application/json")
+            
+            async def body():
+                # Only a bounded prefix and the byte count are kept for the log
+                prefix = bytearray()
+                sent = 0
+                status = "error"
+                error = None
+                
+                def track(chunk: bytes) -> bytes:
+                    nonlocal sent
+                    sent += len(chunk)
+                    if len(prefix) < STREAM_LOG_PREFIX_BYTES:
+                        prefix.extend(chunk[:STREAM_LOG_PREFIX_BYTES - len(prefix)])
+                    return chunk
+                
+                try:
+                    if stream_format == "json":
+                        if first_batch is None:
+                            yield track(b"[]")
+                        else:
+                            yield track(b"[" + first_batch[1:])
+                            async for batch in batches:
+                                yield track(batch)
+                            yield track(b"]")
+                    elif first_batch is not None:
+                        yield track(first_batch)
+                        async for batch in batches:
+                            yield track(batch)
+                    status = "completed"
+                except Exception as e:
+                    # Headers are already sent - NDJSON clients get a final error line,
+                    # a JSON array is left unterminated
+                    error = f"Stream error: {str(e)}\n{traceback.format_exc()}"
+                    print(f"Error streaming result: {e}")
+                    if isinstance(e, TimeoutError):
+                        runtime.timeouts += 1
+                        status = "timeout"
+                    if stream_format == "ndjson":
+                        yield track(encode_ndjson_item({"error": str(e)}))
+                finally:
+                    if first_batch is not None:
+                        # Closes the iterator when the client went away mid-stream
+                        await batches.aclose()
+                    if status == "error" and error is None:
+                        status = "cancelled"  # Client went away mid-stream
+                    response_body = prefix.decode("utf-8", errors="replace")
+                    if error:
+                        response_body = f"{response_body}\n{error}"[:STREAM_LOG_PREFIX_BYTES * 2]
+                    record(200, status, response_body, sent)
+            
+            media_type = "application/json" if stream_format == "json" else "application/x-ndjson"
+            return StreamingResponse(body(), media_type=media_type)
         
         # Return the actual result when execution completes
-        if exec_result and exec_result["success"]:
-            api_result = exec_result.get("result")
-            # If result is None, provide a default message
-            if api_result is None:
-                api_result = {"message": "API executed successfully but returned no result"}
-            return JSONResponse(content={
-                "result": api_result
-            })
-        elif exec_result:
-            return JSONResponse(
-                content={
-                    "error": exec_result["stderr"]
-                },
-                status_code=500
-            )
+        if exec_result and exec_result["success"] and isinstance(exec_result.get("result"), ResultStream):
+            return await stream_response(exec_result["result"])
+        # Drop spooled uploads - a streamed result may still read them, so those are left to GC
+        await request_data.aclose()
+        if exec_result:
+            # Send the bytes already encoded for the log entry
+            status_code, body = encoded if encoded is not None else encode_response(exec_result)
+            return Response(content=body, status_code=status_code, media_type="application/json")
         else:
             return JSONResponse(
                 content={"error": "Execution failed"},
                 status_code=500
             )
     
-    # Register route based on method
-    if method == "GET":
-        app.get(path)(dynamic_handler)
-    elif method == "POST":
-        app.post(path)(dynamic_handler)
-    elif method == "PUT":
-        app.put(path)(dynamic_handler)
-    elif method == "DELETE":
-        app.delete(path)(dynamic_handler)
-    elif method == "PATCH":
-        app.patch(path)(dynamic_handler)
+    # Swap the handler into the dispatch table - takes effect on the next request
+    key = (method, path)
+    with dynamic_routes_lock:
+        if route_generations.get(api_id) != generation:
+            # A later update or removal of this API was requested meanwhile - it wins
+            superseded = True
+        else:
+            superseded = False
+            old_key = dynamic_route_keys.get(api_id)
+            if old_key and old_key != key:
+                _unregister_route_key(old_key, api_id)
+            if is_path_template(path):
+                dynamic_route_index.add(method, path, dynamic_handler, api_id)
+            else:
+                dynamic_routes[key] = dynamic_handler
+                dynamic_route_owners[key] = api_id
+                api_log_index[key] = LOG_POLICY_SKIP if path in LOG_EXCLUDED_PATHS else LOG_POLICY_HANDLER
+            dynamic_route_keys[api_id] = key
+            old_runtime = api_runtimes.get(api_id)
+            api_runtimes[api_id] = runtime
+        removed = superseded and api_id not in api_runtimes
+    if superseded:
+        if setup_state is not None:
+            setup_state.retire()
+        if removed and process_mode:
+            api_process_pool.unload(api_id)
+        return
+    # The replaced version's setup() state is torn down once its in-flight calls finish
+    if old_runtime is not None and old_runtime.setup_state is not None:
+        old_runtime.setup_state.retire()
+
+def _unregister_route_key(key, api_id: str):
+    """Drop a (METHOD, path) key from the dispatch structures if api_id still owns it - caller holds dynamic_routes_lock"""
+    method, path = key
+    if is_path_template(path):
+        if dynamic_route_index.owner(method, path) == api_id:
+            dynamic_route_index.remove(method, path)
+    elif dynamic_route_owners.get(key) == api_id:
+        del dynamic_route_owners[key]
+        dynamic_routes.pop(key, None)
+        api_log_index.pop(key, None)
+
+def find_route_conflict(method: str, path: str, api_id: str = None) -> Optional[str]:
+    """Return the id of another registered API serving the same template, if any"""
+    if not is_path_template(path):
+        return None
+    owner = dynamic_route_index.owner(method.upper(), path)
+    return owner if owner and owner != api_id else None
+
+def remove_dynamic_route(api_id: str):
+    """Remove an API from the dispatch table"""
+    with dynamic_routes_lock:
+        _next_route_generation(api_id)  # A registration still running for it is discarded
+        key = dynamic_route_keys.pop(api_id, None)
+        runtime = api_runtimes.pop(api_id, None)
+        if key:
+            _unregister_route_key(key, api_id)
+    api_process_pool.unload(api_id)
+    if runtime is not None and runtime.setup_state is not None:
+        runtime.setup_state.retire()
+
+async def register_dynamic_route(api_def: Dict):
+    """create_dynamic_route off the event loop - imports, worker pre-warming and setup() can take seconds"""
+    await asyncio.to_thread(create_dynamic_route, api_def)
+
+async def reload_dynamic_route(api_def: Dict):
+    """Apply the current definition of an API - register it if enabled, remove it otherwise"""
+    if api_def.get("enabled", True):
+        await register_dynamic_route(api_def)
+    else:
+        remove_dynamic_route(api_def["id"])
 
 # Load existing APIs
 def load_apis():
@@ -885,6 +3711,189 @@ def load_apis():
             except Exception as e:
                 print(f"Error loading API {api['id']}: {e}")
 
+# === CHANGE NOTIFICATIONS ===
+# Every worker process (and host) keeps its own sessions and dispatch table.
+# Triggers on apis/sessions NOTIFY CHANGE_CHANNEL, and each worker applies just
+# the changed rows - changes made by one worker reach the others without reloads.
+# The same connection receives LOG_CHANNEL for the live log stream.
+CHANGE_LISTENER_RETRY_SECONDS = 5
+
+async def apply_session_changes(session_ids: List[str] = None):
+    """Refresh the given sessions from the database - all of them if session_ids is None"""
+    global sessions
+    query = "SELECT session_id, username, created_at FROM sessions WHERE (expires_at IS NULL OR expires_at > CURRENT_TIMESTAMP)"
+    if session_ids is None:
+        rows = await db_fetch(query)
+        sessions = {row["session_id"]: {"username": row["username"], "created_at": row["created_at"].isoformat()} for row in rows}
+        return
+    rows = await db_fetch(query + " AND session_id = ANY(%s)", (list(session_ids),))
+    found = {row["session_id"]: row for row in rows}
+    for session_id in session_ids:
+        row = found.get(session_id)
+        if row is None:
+            sessions.pop(session_id, None)
+        else:
+            sessions[session_id] = {"username": row["username"], "created_at": row["created_at"].isoformat()}
+
+async def apply_api_changes(api_ids: List[str] = None) -> int:
+    """Re-register the given APIs from their current rows - all of them if api_ids is None.
+    Returns how many routes changed."""
+    if api_ids is None:
+        rows = await db_fetch("SELECT * FROM apis")
+        api_ids = set(api_runtimes) | {row["id"] for row in rows}
+    else:
+        rows = await db_fetch("SELECT * FROM apis WHERE id = ANY(%s)", (list(api_ids),))
+    found = {row["id"]: row for row in rows}
+    changed = 0
+    for api_id in api_ids:
+        api_def = found.get(api_id)
+        registered, version = registered_route_version(api_id)
+        try:
+            if api_def is None:
+                if registered:
+                    remove_dynamic_route(api_id)
+                    changed += 1
+                invalidate_compiled_code(api_id)
+            elif not api_def.get("enabled", True):
+                if registered:
+                    remove_dynamic_route(api_id)
+                    changed += 1
+            elif not registered or version != api_code_version(api_def):
+                # Every write bumps updated_at - an equal version was already applied or is being
+                # registered (usually by this worker). Setup runs in a thread, not on the listener's loop.
+                await register_dynamic_route(api_def)
+                changed += 1
+        except Exception as e:
+            print(f"Error applying change of API {api_id}: {e}")
+    return changed
+
+class ChangeListener:
+    """LISTENs on CHANGE_CHANNEL and LOG_CHANNEL over a non-blocking connection and applies the changes"""
+    
+    def __init__(self, channels: List[str]):
+        self.channels = channels
+        self.conn = None
+        self.task = None
+        self.connected = None  # Future resolved once the first LISTEN is active
+        self.notifications = 0
+        self.applied = 0
+        self.reconnects = 0
+        self.last_error = None
+    
+    async def start(self):
+        """Start listening - returns once LISTEN is active, so no later change is missed"""
+        loop = asyncio.get_running_loop()
+        self.connected = loop.create_future()
+        self.task = loop.create_task(self._run())
+        await asyncio.wait({self.connected, self.task}, return_when=asyncio.FIRST_COMPLETED)
+    
+    async def _connect(self):
+        conn = psycopg2.connect(async_=True, **DB_CONFIG)
+        await async_db_pool._wait(conn)
+        cur = conn.cursor()
+        cur.execute("; ".join(f"LISTEN {channel}" for channel in self.channels))
+        await async_db_pool._wait(conn)
+        cur.close()
+        return conn
+    
+    async def _wait_readable(self):
+        loop = asyncio.get_running_loop()
+        fd = self.conn.fileno()
+        ready = loop.create_future()
+        loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await ready
+        finally:
+            loop.remove_reader(fd)
+    
+    async def _run(self):
+        resync = False
+        while True:
+            try:
+                self.conn = await self._connect()
+                if resync:
+                    # Notifications sent while disconnected are lost - resync everything once
+                    await apply_session_changes()
+                    self.applied += await apply_api_changes()
+                    log_broadcaster.resync_all()
+                if not self.connected.done():
+                    self.connected.set_result(None)
+                while True:
+                    await self._wait_readable()
+                    self.conn.poll()
+                    changes = list(self.conn.notifies)
+                    self.conn.notifies.clear()
+                    if changes:
+                        await self._apply(changes)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {str(e).strip()}"
+                print(f"Change listener error: {self.last_error} - reconnecting in {CHANGE_LISTENER_RETRY_SECONDS}s")
+                if not self.connected.done():
+                    self.connected.set_result(None)  # Startup goes on without it
+            finally:
+                self._close()
+            resync = True
+            self.reconnects += 1
+            await asyncio.sleep(CHANGE_LISTENER_RETRY_SECONDS)
+    
+    async def _apply(self, notifies):
+        """Apply a batch of notifications - each changed row is fetched once"""
+        changed_ids = {"apis": set(), "sessions": set()}
+        log_payloads = []
+        for notify in notifies:
+            self.notifications += 1
+            if notify.channel == LOG_CHANNEL:
+                log_payloads.append(notify.payload)
+                continue
+            try:
+                change = json.loads(notify.payload)
+            except ValueError:
+                continue
+            if change.get("table") in changed_ids and change.get("id"):
+                changed_ids[change["table"]].add(change["id"])
+        if changed_ids["sessions"]:
+            await apply_session_changes(list(changed_ids["sessions"]))
+        if changed_ids["apis"]:
+            self.applied += await apply_api_changes(list(changed_ids["apis"]))
+        if log_payloads:
+            try:
+                await log_broadcaster.apply_remote(log_payloads)
+            except Exception as e:
+                print(f"Error forwarding log changes: {e}")
+                log_broadcaster.resync_all()
+    
+    def _close(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+            self.conn = None
+    
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except BaseException:
+                pass
+            self.task = None
+        self._close()
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "channels": self.channels,
+            "listening": self.conn is not None and not self.conn.closed,
+            "notifications": self.notifications,
+            "routes_applied": self.applied,
+            "reconnects": self.reconnects,
+            "last_error": self.last_error,
+        }
+
+change_listener = ChangeListener([CHANGE_CHANNEL, LOG_CHANNEL])
+
 # Management endpoints
 
 @app.get("/login", response_class=HTMLResponse)
@@ -938,9 +3947,43 @@ async def list_apis(request: Request, auth: bool = Depends(require_auth)):
     db = load_db()
     return {"apis": db["apis"]}
 
+@app.get("/api/manage/stats")
+async def execution_stats(request: Request, auth: bool = Depends(require_auth)):
+    """Execution pool and per-API concurrency statistics"""
+    return {
+        "executor": api_execution_pool.stats(),
+        "process_pool": api_process_pool.stats(),
+        "change_listener": change_listener.stats(),
+        "log_writer": log_writer.stats(),
+        "log_stream": log_broadcaster.stats(),
+        "log_retention": log_retention.stats(),
+        "apis": {api_id: runtime.stats() for api_id, runtime in list(api_runtimes.items())}
+    }
+
+@app.get("/api/manage/imports")
+async def module_imports(request: Request, auth: bool = Depends(require_auth)):
+    """Per-module import times of modules preloaded for APIs"""
+    with module_import_lock:
+        modules = {name: dict(entry, apis=list(entry["apis"])) for name, entry in module_import_report.items()}
+    return {
+        "modules": modules,
+        "total_import_ms": round(sum(entry["import_ms"] for entry in modules.values()), 3)
+    }
+
 @app.post("/api/manage/create")
 async def create_api(api: APIRequest, request: Request, auth: bool = Depends(require_auth)):
     """Create a new API"""
+    path_error = validate_api_path(api.path)
+    if path_error:
+        raise HTTPException(status_code=400, detail=path_error)
+    if find_route_conflict(api.method, api.path):
+        raise HTTPException(status_code=400, detail="An API with the same path template and method already exists")
+    
+    # Reject code that does not compile before anything is stored
+    code_error = validate_api_code(api.python_code, api.settings.model_dump(exclude_none=True) if api.settings else {})
+    if code_error:
+        raise HTTPException(status_code=400, detail=code_error)
+
     conn = None
     try:
         # Check if path already exists
@@ -955,6 +3998,7 @@ async def create_api(api: APIRequest, request: Request, auth: bool = Depends(req
         # Create API
         api_id = str(uuid.uuid4())
         now = datetime.datetime.now()
+        settings = api.settings.model_dump(exclude_none=True) if api.settings else {}
         api_def = {
             "id": api_id,
             "name": api.name,
@@ -963,17 +4007,18 @@ async def create_api(api: APIRequest, request: Request, auth: bool = Depends(req
             "python_code": api.python_code,
             "description": api.description,
             "enabled": True,
+            "settings": settings,
             "created_at": now.isoformat(),
             "updated_at": now.isoformat()
         }
         
         # Insert into PostgreSQL
         cur.execute("""
-            INSERT INTO apis (id, name, path, method, python_code, description, enabled, created_at, updated_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            INSERT INTO apis (id, name, path, method, python_code, description, enabled, settings, created_at, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         """, (
             api_id, api.name, api.path, api.method.upper(), api.python_code,
-            api.description, True, now, now
+            api.description, True, Json(settings), now, now
         ))
         conn.commit()
         cur.close()
@@ -981,7 +4026,7 @@ async def create_api(api: APIRequest, request: Request, auth: bool = Depends(req
         
         # Register route
         try:
-            create_dynamic_route(api_def)
+            await register_dynamic_route(api_def)
             return {"message": "API created successfully", "api": api_def}
         except Exception as e:
             return JSONResponse(
@@ -1044,9 +4089,34 @@ async def update_api(api_id: str, update: APIUpdate, request: Request, auth: boo
             updates.append("enabled = %s")
             params.append(update.enabled)
             api_def["enabled"] = update.enabled
+        if update.settings is not None:
+            settings = update.settings.model_dump(exclude_none=True)
+            updates.append("settings = %s")
+            params.append(Json(settings))
+            api_def["settings"] = settings
+        
+        # Report path and code errors now instead of on the first request
+        code_error = validate_api_path(api_def["path"])
+        if not code_error and find_route_conflict(api_def["method"], api_def["path"], api_id):
+            code_error = "An API with the same path template and method already exists"
+        if not code_error:
+            cur.execute(
+                "SELECT id FROM apis WHERE path = %s AND method = %s AND id <> %s",
+                (api_def["path"], api_def["method"], api_id)
+            )
+            if cur.fetchone():
+                code_error = "API with this path and method already exists"
+        if not code_error:
+            code_error = validate_api_code(api_def["python_code"], get_api_settings(api_def))
+        if code_error:
+            cur.close()
+            return_db_connection(conn)
+            conn = None
+            raise HTTPException(status_code=400, detail=code_error)
         
+        now = datetime.datetime.now()
         updates.append("updated_at = %s")
-        params.append(datetime.datetime.now())
+        params.append(now)
         params.append(api_id)
         
         # Execute update
@@ -1055,11 +4125,20 @@ async def update_api(api_id: str, update: APIUpdate, request: Request, auth: boo
         cur.close()
         return_db_connection(conn)
         
-        api_def["updated_at"] = datetime.datetime.now().isoformat()
+        api_def["updated_at"] = now.isoformat()
+        
+        # New updated_at means a new code version - drop the stale code object
+        invalidate_compiled_code(api_id)
         
-        # Reload route
-        # Note: FastAPI doesn't support route removal, so we need to restart
-        return {"message": "API updated. Server restart required for changes.", "api": api_def}
+        # Swap the route in place - no restart needed
+        try:
+            await reload_dynamic_route(api_def)
+        except Exception as e:
+            return JSONResponse(
+                content={"error": f"API saved but failed to reload route: {str(e)}"},
+                status_code=500
+            )
+        return {"message": "API updated", "api": api_def}
     except HTTPException:
         raise
     except Exception as e:
@@ -1090,7 +4169,10 @@ async def delete_api(api_id: str, request: Request, auth: bool = Depends(require
         cur.close()
         return_db_connection(conn)
         
-        return {"message": "API deleted. Server restart required."}
+        remove_dynamic_route(api_id)
+        invalidate_compiled_code(api_id)
+        
+        return {"message": "API deleted"}
     except HTTPException:
         raise
     except Exception as e:
@@ -1102,79 +4184,156 @@ async def delete_api(api_id: str, request: Request, auth: bool = Depends(require
 @app.post("/api/manage/{api_id}/toggle")
 async def toggle_api(api_id: str, request: Request, auth: bool = Depends(require_auth)):
     """Enable/disable an API"""
-    db = load_db()
-    
-    api_def = None
-    for api in db["apis"]:
-        if api["id"] == api_id:
-            api_def = api
-            api["enabled"] = not api.get("enabled", True)
-            break
-    
-    if not api_def:
-        raise HTTPException(status_code=404, detail="API not found")
-    
-    save_db(db)
-    return {"message": "API toggled. Server restart required.", "enabled": api_def["enabled"]}
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute("""
+            UPDATE apis SET enabled = NOT COALESCE(enabled, TRUE), updated_at = %s
+            WHERE id = %s
+            RETURNING *
+        """, (datetime.datetime.now(), api_id))
+        api_row = cur.fetchone()
+        if not api_row:
+            conn.rollback()
+            cur.close()
+            return_db_connection(conn)
+            raise HTTPException(status_code=404, detail="API not found")
+        conn.commit()
+        cur.close()
+        return_db_connection(conn)
+        
+        api_def = dict(api_row)
+        invalidate_compiled_code(api_id)
+        await reload_dynamic_route(api_def)
+        return {"message": "API enabled" if api_def["enabled"] else "API disabled", "enabled": api_def["enabled"]}
+    except HTTPException:
+        raise
+    except Exception as e:
+        if conn:
+            conn.rollback()
+            return_db_connection(conn)
+        raise HTTPException(status_code=500, detail=f"Failed to toggle API: {str(e)}")
 
 @app.post("/api/manage/test")
 async def test_code(request: APIRequest, req: Request, auth: bool = Depends(require_auth)):
     """Test Python code execution"""
-    result = execute_python_code(request.python_code)
-    return result
+    try:
+        setup_code = compile_setup_code(request.python_code)
+    except SyntaxError:
+        setup_code = None  # Reported by execute_python_code below
+    # setup() runs for this one test call and is torn down right after
+    setup_state = APISetupState("test", setup_code) if setup_code is not None else None
+    
+    def run_test():
+        try:
+            if setup_state is None:
+                result = execute_python_code(request.python_code)
+            else:
+                result = execute_python_code(compile_api_code(request.python_code), setup_state=setup_state)
+            if isinstance(result["result"], ResultStream):
+                # Show the first items of a streamed result
+                result["result"] = {"stream_preview": list(itertools.islice(result["result"].iterator, 20))}
+        finally:
+            if setup_state is not None:
+                setup_state.retire()
+        return result
+    
+    # The test code, its setup() and teardown() run on the execution pool, not the event loop
+    return await api_execution_pool.run(run_test)
 
 @app.get("/api/logs")
-async def get_logs(limit: int = 100, request: Request = None, auth: bool = Depends(require_auth)):
-    """Get API logs"""
-    logs = load_logs()
-    return {"logs": logs["logs"][:limit]}
+async def get_logs(
+    limit: int = 100,
+    before: Optional[str] = None,
+    path: Optional[str] = None,
+    status: Optional[str] = None,
+    status_code: Optional[int] = None,
+    client_ip: Optional[str] = None,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+    request: Request = None,
+    auth: bool = Depends(require_auth)
+):
+    """Get API logs, newest first - pass next_cursor as before to get the next page"""
+    if before:
+        try:
+            decode_log_cursor(before)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    filters = {
+        "path": path, "status": status, "status_code": status_code,
+        "client_ip": client_ip, "since": since, "until": until,
+    }
+    return await asyncio.to_thread(load_logs, max(1, min(limit, LOG_PAGE_MAX_ROWS)), filters, before)
 
 @app.get("/api/logs/stream")
 async def stream_logs(request: Request, auth: bool = Depends(require_auth)):
-    """Stream logs in real-time using Server-Sent Events"""
-    import asyncio
-    import time
+    """Stream logs in real-time using Server-Sent Events.
+    
+    Sends a snapshot of the latest entry summaries, then deltas as the log writer stores them:
+    {"type": "delta", "logs": [changed summary fields by id], "output": {log_id: last output seq}}.
+    Clients fetch /api/logs/{log_id} and /api/logs/{log_id}/output for what they display.
+    A client that falls behind gets a fresh snapshot instead of the deltas it missed."""
     
     async def event_generator():
-        last_count = 0
-        last_executing_ids = set()
-        while True:
-            # Check if client disconnected
-            if await request.is_disconnected():
-                break
-            
-            logs = load_logs()
-            current_count = len(logs.get("logs", []))
-            
-            # Send update if logs changed
-            if current_count != last_count:
-                yield f"data: {json.dumps({'logs': logs['logs'][:100], 'count': current_count})}\n\n"
-                last_count = current_count
-            
-            # Always send updates for executing logs to show real-time prints
-            executing_logs = [log for log in logs.get("logs", []) if log.get("status") == "executing"]
-            current_executing_ids = {log.get("id") for log in executing_logs}
-            
-            # Send update if there are executing logs (always refresh to show latest prints)
-            if executing_logs:
-                yield f"data: {json.dumps({'executing': executing_logs})}\n\n"
-                last_executing_ids = current_executing_ids
-            elif last_executing_ids:
-                # No longer executing, clear the set
-                last_executing_ids = set()
-            
-            await asyncio.sleep(0.1)  # Check every 100ms for faster real-time updates
+        # Subscribe before the snapshot is read - deltas overlapping it are idempotent
+        queue = log_broadcaster.subscribe()
+        try:
+            resync = True
+            while True:
+                if resync:
+                    logs = await asyncio.to_thread(load_logs, LOG_STREAM_SNAPSHOT_ROWS)
+                    yield f"data: {json.dumps({'type': 'snapshot', 'logs': logs['logs']}, default=str)}\n\n"
+                    resync = False
+                try:
+                    event = await asyncio.wait_for(queue.get(), LOG_STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Idle streams only wake up for this, so dead connections are noticed
+                    yield ": keepalive\n\n"
+                    continue
+                if event is LOG_STREAM_RESYNC:
+                    resync = True
+                    continue
+                yield f"data: {json.dumps(event, default=str)}\n\n"
+        finally:
+            log_broadcaster.unsubscribe(queue)
     
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
+@app.get("/api/logs/{log_id}/output")
+async def get_log_output(log_id: str, after_seq: int = 0, auth: bool = Depends(require_auth)):
+    """Output of a log entry after a sequence number - poll with the returned last_seq to tail it"""
+    try:
+        output = await asyncio.to_thread(load_log_chunks, log_id, after_seq, LOG_CHUNKS_PAGE)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to load log output: {str(e)}")
+    if output["status"] is None and not output["chunks"]:
+        raise HTTPException(status_code=404, detail="Log entry not found")
+    return output
+
+# Defined after /api/logs/stream, which would otherwise match as a log id
+@app.get("/api/logs/{log_id}")
+async def get_log(log_id: str, auth: bool = Depends(require_auth)):
+    """Full log entry - headers, response body and output"""
+    try:
+        log = await asyncio.to_thread(load_log_detail, log_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to load log entry: {str(e)}")
+    if log is None:
+        raise HTTPException(status_code=404, detail="Log entry not found")
+    return log
+
 @app.delete("/api/logs")
 async def clear_logs(request: Request, auth: bool = Depends(require_auth)):
     """Clear all logs"""
     conn = None
     try:
+        # Queued entries are written first, so they are cleared too
+        await asyncio.to_thread(log_writer.flush)
         conn = get_db_connection()
         cur = conn.cursor()
-        cur.execute("TRUNCATE TABLE api_logs")
+        cur.execute("TRUNCATE TABLE api_logs, api_log_chunks")
         conn.commit()
         cur.close()
         return_db_connection(conn)
@@ -1494,6 +4653,14 @@ async def startup_event():
     except Exception as e:
         print(f"Warning: Database connection failed: {e}")
     
+    apply_schema_migrations()
+    
+    # LISTEN before loading sessions and APIs, so changes made by other workers meanwhile are not missed
+    await change_listener.start()
+    
+    # Prune old log entries periodically (and create upcoming daily partitions if api_logs is partitioned)
+    log_retention.start()
+    
     # Original startup code:
     # Load sessions from file
     load_sessions()
@@ -1523,7 +4690,8 @@ async def startup_event():
         if conn:
             return_db_connection(conn)
     
-    load_apis()
+    # Module imports and setup() run in a thread - the listener keeps applying changes meanwhile
+    await asyncio.to_thread(load_apis)
     
     # Add utilization sync API to database if not exists
     conn = None
@@ -1838,7 +5006,7 @@ result = {k: v for k, v in result.items() if v is not None}'''
             print("Utilization Sync API added to database")
             # Register the route immediately after creating it
             try:
-                create_dynamic_route(api_def)
+                await register_dynamic_route(api_def)
                 print("Utilization Sync API route registered")
             except Exception as e:
                 print(f"Error registering Utilization Sync API route: {e}")
@@ -1857,52 +5025,15 @@ result = {k: v for k, v in result.items() if v is not None}'''
         cur.execute("SELECT id FROM apis WHERE path = %s AND method = %s", ("/api/audio/transcribe", "POST"))
         existing_api = cur.fetchone()
         
-        transcription_code = '''import sys
-import os
+        transcription_code = '''import os
 import tempfile
 
 # -----------------------------
-# FIX protobuf conflict - MUST be done before any google imports
-# -----------------------------
-import gc
-import importlib
-
-# Less aggressive cleanup - only remove if there are actual conflicts
-# Don't remove protobuf modules that generativeai needs (like Empty)
-# Just ensure venv packages are prioritized
-venv_path = None
-for p in sys.path:
-    if 'venv' in p and 'site-packages' in p:
-        venv_path = p
-        break
-
-if venv_path:
-    # Move venv site-packages to front
-    sys.path = [venv_path] + [p for p in sys.path if p != venv_path]
-
-# Remove system dist-packages from path to avoid conflicts
-sys.path = [p for p in sys.path if '/usr/lib/python3/dist-packages' not in p]
-
-# Invalidate import caches (but don't remove modules - let them reload naturally)
-importlib.invalidate_caches()
-
-# -----------------------------
-# IMPORT GEMINI SDK (after protobuf fix)
+# IMPORT GEMINI SDK
 # -----------------------------
-# Ensure protobuf is imported first to avoid Empty attribute errors
-# Import protobuf explicitly to ensure it's loaded with all attributes
-try:
-    import google.protobuf
-    import google.protobuf.message
-    # Ensure Empty is available
-    if not hasattr(google.protobuf.message, 'Empty'):
-        # Force reload if Empty is missing
-        import importlib
-        importlib.reload(google.protobuf.message)
-except Exception as e:
-    print(f"DEBUG: Protobuf import check: {e}")
-
-# Now import generativeai
+# sys.path is prepared once at server startup and protobuf/generativeai are
+# preloaded through this API's preload_modules setting, so this is a cheap
+# sys.modules lookup instead of per-request import work
 import google.generativeai as genai
 
 # -----------------------------
@@ -1918,10 +5049,11 @@ Transcribe the audio with maximum accuracy.
 """
 
 # -----------------------------
-# SETUP
+# SETUP (runs once per worker when the API is registered - `model` is shared by every call)
 # -----------------------------
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel("gemini-3-pro-preview")  # Best Arabic model
+def setup():
+    genai.configure(api_key=GEMINI_API_KEY)
+    return {"model": genai.GenerativeModel("gemini-3-pro-preview")}  # Best Arabic model
 
 # -----------------------------
 # GET AUDIO URL FROM REQUEST
@@ -2098,37 +5230,54 @@ else:
     except Exception as e:
         result = {"error": f"Transcription failed: {str(e)}", "status": "error"}'''
             
+        transcription_settings = {
+            "preload_modules": ["google.protobuf", "google.protobuf.message", "google.generativeai"]
+        }
         now = datetime.datetime.now()
         
+        transcription_description = "Transcribe audio files from URLs using Google Gemini API. Supports Arabic and other languages. Supports Bearer token authentication."
         if existing_api:
-            # Update existing API
+            # Update existing API - only when the shipped code or settings differ. Bumping updated_at on
+            # every start would make each worker's listener reload the API (and rerun its setup) on every restart.
             api_id = existing_api[0]
             cur.execute("""
                 UPDATE apis 
-                SET python_code = %s, description = %s, updated_at = %s
+                SET python_code = %s, description = %s, settings = COALESCE(settings, '{}'::jsonb) || %s, updated_at = %s
                 WHERE id = %s
+                  AND (python_code IS DISTINCT FROM %s
+                       OR description IS DISTINCT FROM %s
+                       OR NOT COALESCE(settings, '{}'::jsonb) @> %s)
             """, (
                 transcription_code,
-                "Transcribe audio files from URLs using Google Gemini API. Supports Arabic and other languages. Supports Bearer token authentication.",
+                transcription_description,
+                Json(transcription_settings),
                 now,
-                api_id
+                api_id,
+                transcription_code,
+                transcription_description,
+                Json(transcription_settings)
             ))
+            updated = cur.rowcount > 0
             conn.commit()
-            print("Audio Transcription API updated in database")
-            
-            # Get updated API definition
-            cur.close()
-            cur = conn.cursor(cursor_factory=RealDictCursor)
-            cur.execute("SELECT * FROM apis WHERE id = %s", (api_id,))
-            api_row = cur.fetchone()
-            if api_row:
-                api_def = dict(api_row)
-                # Register the route immediately after updating it
-                try:
-                    create_dynamic_route(api_def)
-                    print("Audio Transcription API route updated")
-                except Exception as e:
-                    print(f"Error updating Audio Transcription API route: {e}")
+            if updated:
+                print("Audio Transcription API updated in database")
+                
+                # Get updated API definition
+                cur.close()
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+                cur.execute("SELECT * FROM apis WHERE id = %s", (api_id,))
+                api_row = cur.fetchone()
+                if api_row:
+                    api_def = dict(api_row)
+                    # Register the route immediately after updating it
+                    try:
+                        await register_dynamic_route(api_def)
+                        print("Audio Transcription API route updated")
+                    except Exception as e:
+                        print(f"Error updating Audio Transcription API route: {e}")
+            else:
+                # load_apis already registered the current version
+                print("Audio Transcription API is up to date")
         else:
             # Create new API
             transcription_id = str(uuid.uuid4())
@@ -2140,23 +5289,24 @@ else:
                 "python_code": transcription_code,
                 "description": "Transcribe audio files from URLs using Google Gemini API. Supports Arabic and other languages. Supports Bearer token authentication. Note: WhatsApp Business API media URLs may require signed requests - ensure your access token has proper permissions.",
                 "enabled": True,
+                "settings": transcription_settings,
                 "created_at": now.isoformat(),
                 "updated_at": now.isoformat()
             }
             cur.execute("""
-                INSERT INTO apis (id, name, path, method, python_code, description, enabled, created_at, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                INSERT INTO apis (id, name, path, method, python_code, description, enabled, settings, created_at, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
             """, (
                 transcription_id, "Audio Transcription", "/api/audio/transcribe", "POST",
                 transcription_code,
-                "Transcribe audio files from URLs using Google Gemini API. Supports Arabic and other languages. Supports Bearer token authentication.",
-                True, now, now
+                transcription_description,
+                True, Json(transcription_settings), now, now
             ))
             conn.commit()
             print("Audio Transcription API added to database")
             # Register the route immediately after creating it
             try:
-                create_dynamic_route(api_def)
+                await register_dynamic_route(api_def)
                 print("Audio Transcription API route registered")
             except Exception as e:
                 print(f"Error registering Audio Transcription API route: {e}")
@@ -2168,7 +5318,38 @@ else:
             return_db_connection(conn)
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release the shared execution pool, worker processes, async clients and setup() state, and flush queued logs"""
+    await change_listener.stop()
+    await log_retention.stop()
+    for runtime in list(api_runtimes.values()):
+        if runtime.setup_state is not None:
+            runtime.setup_state.retire()
+    api_execution_pool.shutdown()
+    api_process_pool.shutdown()
+    # Write log entries still queued
+    log_writer.close()
+    if async_http_client is not None:
+        await async_http_client.aclose()
+    async_db_pool.close()
+
 # Default endpoints
 @app.get("/ping")
 async def ping():
     return {"status": "ok", "service": "API Management System"}
+
+# Catch-all dispatcher for dynamic APIs - must stay the last route registered
+@app.api_route("/{full_path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"], include_in_schema=False)
+async def dispatch_dynamic_api(request: Request, full_path: str):
+    """Route a request to its dynamic API handler via the dispatch table"""
+    handler = dynamic_routes.get((request.method, request.url.path))
+    path_params = {}
+    if handler is None:
+        match = dynamic_route_index.match(request.method, request.url.path)
+        if match is None:
+            raise HTTPException(status_code=404, detail="Not Found")
+        handler, path_params = match
+    # Handlers read template values from request.path_params
+    request.scope["path_params"] = path_params
+    return await handler(request)
@@ -0,0 +1,53 @@
+-- Optional: partition api_logs by day, so log retention drops whole days
+-- instead of deleting rows. Run once, with the server stopped:
+--     psql -f partition_api_logs.sql
+-- The server then creates upcoming daily partitions itself (api_logs_pYYYYMMDD)
+-- and drops the ones older than LOG_RETENTION_DAYS.
+
+BEGIN;
+
+ALTER TABLE api_logs RENAME TO api_logs_unpartitioned;
+ALTER INDEX IF EXISTS api_logs_pkey RENAME TO api_logs_unpartitioned_pkey;
+ALTER INDEX IF EXISTS idx_logs_timestamp RENAME TO idx_logs_unpartitioned_timestamp;
+ALTER INDEX IF EXISTS idx_logs_timestamp_id RENAME TO idx_logs_unpartitioned_timestamp_id;
+ALTER INDEX IF EXISTS idx_logs_path RENAME TO idx_logs_unpartitioned_path;
+ALTER INDEX IF EXISTS idx_logs_status RENAME TO idx_logs_unpartitioned_status;
+
+-- A partitioned table's primary key must include the partition key
+CREATE TABLE api_logs (
+    LIKE api_logs_unpartitioned INCLUDING DEFAULTS,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+CREATE INDEX idx_logs_timestamp ON api_logs(timestamp DESC);
+CREATE INDEX idx_logs_timestamp_id ON api_logs(timestamp DESC, id DESC);
+CREATE INDEX idx_logs_path ON api_logs(path);
+CREATE INDEX idx_logs_status ON api_logs(status);
+
+-- Catches rows of days without a partition, so inserts never fail. While it
+-- exists, expired days cannot be detached concurrently - the server then drops
+-- them directly (with a short lock_timeout). Dropping this partition once the
+-- server keeps upcoming days created makes those drops non-blocking.
+CREATE TABLE api_logs_default PARTITION OF api_logs DEFAULT;
+
+-- One partition per day of existing data, plus the next few days
+DO $$
+DECLARE
+    day DATE;
+BEGIN
+    FOR day IN
+        SELECT DISTINCT timestamp::date FROM api_logs_unpartitioned
+        UNION
+        SELECT generate_series(CURRENT_DATE, CURRENT_DATE + 3, INTERVAL '1 day')::date
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF api_logs FOR VALUES FROM (%L) TO (%L)',
+            'api_logs_p' || to_char(day, 'YYYYMMDD'), day, day + 1
+        );
+    END LOOP;
+END $$;
+
+INSERT INTO api_logs SELECT * FROM api_logs_unpartitioned;
+DROP TABLE api_logs_unpartitioned;
+
+COMMIT;
@@ -2,12 +2,25 @@
 let autoRefreshInterval = null;
 let eventSource = null;
 let logsMap = new Map(); // Track logs by ID
+const LOGS_PAGE_SIZE = 100;
+let displayLimit = LOGS_PAGE_SIZE; // Grows by a page each time older logs are loaded
+let loadingMore = false;
+let noMoreLogs = false;
+let logDetails = new Map(); // Details of expanded logs by ID
+let tailing = new Set(); // Logs whose output tail is being fetched
 
 document.addEventListener("DOMContentLoaded", () => { 
     loadLogs();
     startRealTimeUpdates();
 });
 
+// Infinite scroll - older pages are fetched with the cursor of the last displayed log
+window.addEventListener("scroll", () => {
+    if (window.innerHeight + window.scrollY >= document.body.offsetHeight - 300) {
+        loadMoreLogs();
+    }
+});
+
 function startRealTimeUpdates() {
     // Close existing connection if any
     if (eventSource) {
@@ -20,13 +33,10 @@ function startRealTimeUpdates() {
     eventSource.onmessage = function(event) {
         try {
             const data = JSON.parse(event.data);
-            if (data.logs) {
-                // Update logs display
-                displayLogs(data.logs);
-            }
-            if (data.executing) {
-                // Update executing logs in real-time
-                updateExecutingLogs(data.executing);
+            if (data.type === "snapshot") {
+                setLogs(data.logs);
+            } else if (data.type === "delta") {
+                applyDelta(data);
             }
         } catch (error) {
             console.error("Error parsing SSE data:", error);
@@ -44,77 +54,160 @@ function startRealTimeUpdates() {
     };
 }
 
-function updateExecutingLogs(executingLogs) {
-    executingLogs.forEach(log => {
-        const logElement = document.querySelector(`[data-log-id="${log.id}"]`);
-        if (logElement) {
-            // Update the log item with new data
-            const statusElement = logElement.querySelector('.log-status');
-            if (statusElement) {
-                statusElement.textContent = "Executing...";
-                statusElement.className = "log-status status-executing";
-            }
-            
-            // Update prints/output in real-time (use prints field if available, fallback to stdout)
-            const prints = log.prints || log.stdout || "";
-            
-            // Always update prints section if it exists
-            let printsSection = logElement.querySelector('.log-prints-output');
-            if (printsSection) {
-                printsSection.textContent = prints;
-                // Auto-scroll to bottom to see latest prints
-                printsSection.scrollTop = printsSection.scrollHeight;
-            } else if (prints) {
-                // Create prints section if it doesn't exist and we have prints
-                const detailsDiv = logElement.querySelector('.log-details');
-                if (detailsDiv) {
-                    // Find where to insert (before Response section)
-                    const sections = detailsDiv.querySelectorAll('.log-section');
-                    let insertBefore = null;
-                    sections.forEach(section => {
-                        const title = section.querySelector('.log-section-title');
-                        if (title && title.textContent.includes('Response')) {
-                            insertBefore = section;
-                        }
-                    });
-                    
-                    const printsHTML = `<div class="log-section log-prints-section"><div class="log-section-title">📝 Print Output (Real-time):</div><div class="log-section-content log-prints-output" style="background: #f0f8ff; border-left: 3px solid #3498db; padding: 10px; font-family: monospace; white-space: pre-wrap; max-height: 300px; overflow-y: auto;">${escapeHtml(prints)}</div></div>`;
-                    
-                    if (insertBefore) {
-                        insertBefore.insertAdjacentHTML('beforebegin', printsHTML);
-                    } else {
-                        detailsDiv.insertAdjacentHTML('afterbegin', printsHTML);
-                    }
-                    printsSection = logElement.querySelector('.log-prints-output');
-                    if (printsSection) {
-                        printsSection.scrollTop = printsSection.scrollHeight;
-                    }
-                }
-            }
-            
-            // Show prints badge in header for executing logs
-            if (log.status === "executing" && prints) {
-                let printsBadge = logElement.querySelector('.log-prints-badge');
-                if (!printsBadge) {
-                    const header = logElement.querySelector('.log-header');
-                    if (header) {
-                        const badge = document.createElement('span');
-                        badge.className = 'log-prints-badge';
-                        badge.style.cssText = 'background: #3498db; color: white; padding: 2px 8px; border-radius: 12px; font-size: 11px; margin-left: 10px;';
-                        badge.textContent = '📝 Prints';
-                        header.appendChild(badge);
-                    }
-                }
+function setLogs(logs, nextCursor) {
+    logsMap = new Map(logs.map(log => [log.id, log]));
+    displayLimit = Math.max(LOGS_PAGE_SIZE, logs.length);
+    noMoreLogs = nextCursor === undefined ? logs.length < LOGS_PAGE_SIZE : !nextCursor;
+    displayLogs(logs);
+}
+
+function compareLogs(a, b) {
+    // Same order as the server: (timestamp, id) descending
+    if (a.timestamp !== b.timestamp) return a.timestamp < b.timestamp ? 1 : -1;
+    return a.id < b.id ? 1 : a.id > b.id ? -1 : 0;
+}
+
+function sortedLogs() {
+    return Array.from(logsMap.values()).sort(compareLogs).slice(0, displayLimit);
+}
+
+async function loadMoreLogs() {
+    if (loadingMore || noMoreLogs) return;
+    const logs = sortedLogs();
+    if (logs.length === 0) return;
+    const last = logs[logs.length - 1];
+    loadingMore = true;
+    updateMoreIndicator();
+    try {
+        const cursor = encodeURIComponent(`${last.timestamp}|${last.id}`);
+        const response = await fetch(`/api/logs?limit=${LOGS_PAGE_SIZE}&before=${cursor}`);
+        const data = await response.json();
+        data.logs.forEach(log => {
+            if (!logsMap.has(log.id)) logsMap.set(log.id, log);
+        });
+        displayLimit += data.logs.length;
+        noMoreLogs = !data.next_cursor;
+        displayLogs(sortedLogs());
+    } catch (error) {
+        console.error("Error loading older logs:", error);
+    } finally {
+        loadingMore = false;
+        updateMoreIndicator();
+    }
+}
+
+function updateMoreIndicator() {
+    const more = document.getElementById("logsMore");
+    if (!more) return;
+    if (loadingMore) {
+        more.textContent = "Loading older logs...";
+    } else if (noMoreLogs) {
+        more.textContent = logsMap.size ? "No older logs" : "";
+    } else {
+        more.textContent = "";
+    }
+}
+
+function applyDelta(delta) {
+    // Changed rows carry only their changed summary fields - a new row or a status change re-renders the list
+    let rerender = false;
+    (delta.logs || []).forEach(change => {
+        const log = logsMap.get(change.id);
+        if (!log) {
+            // An update of an entry outside the displayed window has no timestamp - skip it
+            if (change.timestamp === undefined) return;
+            logsMap.set(change.id, Object.assign({}, change));
+            rerender = true;
+        } else {
+            if (change.status !== undefined && change.status !== log.status) {
+                rerender = true;
+                // The final response is only in the detail - refresh it if it is shown
+                if (logDetails.has(change.id)) fetchLogDetail(change.id);
             }
+            Object.assign(log, change);
         }
     });
+    // Output is announced by its latest chunk number - shown output is extended with just the new chunks
+    Object.entries(delta.output || {}).forEach(([logId, seq]) => {
+        const log = logsMap.get(logId);
+        if (!log) return;
+        if (!log.has_output) {
+            log.has_output = true;
+            rerender = rerender || log.status === "executing";
+        }
+        const detail = logDetails.get(logId);
+        if (detail && detail.id && seq > (detail.output_seq || 0)) fetchLogOutput(logId);
+    });
+    if (rerender) {
+        const logs = sortedLogs();
+        if (logs.length < logsMap.size) noMoreLogs = false; // Trimmed entries can be scrolled to again
+        logsMap = new Map(logs.map(log => [log.id, log]));
+        displayLogs(logs);
+    }
+}
+
+async function fetchLogDetail(logId) {
+    try {
+        const response = await fetch(`/api/logs/${encodeURIComponent(logId)}`);
+        if (!response.ok) return;
+        const detail = await response.json();
+        if (!logDetails.has(logId)) return; // Collapsed meanwhile
+        logDetails.set(logId, detail);
+        renderLogDetails(logId);
+        // Output announced while the detail was loading
+        if (detail.status === "executing") fetchLogOutput(logId);
+    } catch (error) {
+        console.error("Error loading log entry:", error);
+    }
+}
+
+async function fetchLogOutput(logId) {
+    // One tail request per entry at a time - the next one continues after the last chunk received
+    if (tailing.has(logId)) return;
+    tailing.add(logId);
+    try {
+        let more = true;
+        while (more) {
+            const detail = logDetails.get(logId);
+            if (!detail || !detail.id) return;
+            const response = await fetch(`/api/logs/${encodeURIComponent(logId)}/output?after_seq=${detail.output_seq || 0}`);
+            if (!response.ok) return;
+            const data = await response.json();
+            data.chunks.forEach(chunk => {
+                if (chunk.seq > (detail.output_seq || 0)) {
+                    detail.prints = (detail.prints || "") + chunk.content;
+                    detail.output_seq = chunk.seq;
+                }
+            });
+            more = data.more;
+        }
+        updatePrintsOutput(logId);
+    } catch (error) {
+        console.error("Error loading log output:", error);
+    } finally {
+        tailing.delete(logId);
+    }
+}
+
+function updatePrintsOutput(logId) {
+    const logElement = document.querySelector(`[data-log-id="${logId}"]`);
+    const detail = logDetails.get(logId);
+    if (!logElement || !detail) return;
+    const printsSection = logElement.querySelector('.log-prints-output');
+    if (printsSection) {
+        printsSection.textContent = detail.prints || detail.stdout || "";
+        // Auto-scroll to bottom to see latest prints
+        printsSection.scrollTop = printsSection.scrollHeight;
+    } else {
+        renderLogDetails(logId);
+    }
 }
 
 async function loadLogs() {
     try {
-        const response = await fetch("/api/logs?limit=100");
+        const response = await fetch(`/api/logs?limit=${LOGS_PAGE_SIZE}`);
         const data = await response.json();
-        displayLogs(data.logs);
+        setLogs(data.logs, data.next_cursor);
     } catch (error) {
         console.error("Error:", error);
     }
@@ -124,6 +217,7 @@ function displayLogs(logs) {
     const logsList = document.getElementById("logsList");
     const emptyLogs = document.getElementById("emptyLogs");
     
+    updateMoreIndicator();
     if (logs.length === 0) {
         logsList.innerHTML = "";
         emptyLogs.style.display = "block";
@@ -132,7 +226,7 @@ function displayLogs(logs) {
     
     emptyLogs.style.display = "none";
     
-    logsList.innerHTML = logs.map((log, index) => {
+    logsList.innerHTML = logs.map(log => {
         const date = new Date(log.timestamp);
         let statusClass = "status-2xx";
         let statusText = log.status_code || "Executing...";
@@ -146,47 +240,72 @@ function displayLogs(logs) {
             statusClass = "status-4xx";
         }
         
-        const prints = log.prints || log.stdout || "";
-        const hasPrints = prints.length > 0;
         const isExecuting = log.status === "executing";
+        const expanded = logDetails.has(log.id);
         
-        return `<div class="log-item" data-log-id="${log.id}">
-            <div class="log-header" onclick="toggleLogDetails(${index})" style="cursor: pointer;">
+        return `<div class="log-item" data-log-id="${escapeHtml(log.id)}">
+            <div class="log-header" onclick="toggleLogDetails(this)" style="cursor: pointer;">
                 <span class="log-method method-${log.method}">${log.method}</span>
                 <span class="log-path">${escapeHtml(log.path)}</span>
                 <span class="log-status ${statusClass}">${statusText}</span>
-                ${isExecuting && hasPrints ? '<span class="log-prints-badge" style="background: #3498db; color: white; padding: 2px 8px; border-radius: 12px; font-size: 11px; margin-left: 10px;">📝 Prints</span>' : ''}
+                ${isExecuting && log.has_output ? '<span class="log-prints-badge" style="background: #3498db; color: white; padding: 2px 8px; border-radius: 12px; font-size: 11px; margin-left: 10px;">📝 Prints</span>' : ''}
+                ${log.status === "cached" ? '<span class="log-cached-badge" title="Answered from the response cache" style="background: #16a085; color: white; padding: 2px 8px; border-radius: 12px; font-size: 11px; margin-left: 10px;">⚡ Cached</span>' : ''}
+                ${log.coalesced_from ? `<span class="log-coalesced-badge" title="Shared execution ${escapeHtml(log.coalesced_from)}" style="background: #8e44ad; color: white; padding: 2px 8px; border-radius: 12px; font-size: 11px; margin-left: 10px;">🔗 Coalesced</span>` : ''}
                 <span class="log-timestamp">${date.toLocaleString()}</span>
-                <span class="log-toggle" id="toggle-${index}">▼</span>
-            </div>
-            <div class="log-details" id="details-${index}" style="display: ${isExecuting ? 'block' : 'none'};">
-                <div class="log-section"><div class="log-section-title">Query:</div><div class="log-section-content">${escapeHtml(JSON.stringify(log.query_params, null, 2))}</div></div>
-                <div class="log-section"><div class="log-section-title">Headers:</div><div class="log-section-content">${escapeHtml(JSON.stringify(log.headers, null, 2))}</div></div>
-                <div class="log-section log-prints-section"><div class="log-section-title">📝 Print Output ${isExecuting ? '(Real-time)' : ''}:</div><div class="log-section-content log-prints-output" style="background: #f0f8ff; border-left: 3px solid #3498db; padding: 10px; font-family: monospace; white-space: pre-wrap; line-height: 1.6; max-height: 300px; overflow-y: auto;">${escapeHtml(prints)}</div></div>
-                <div class="log-section"><div class="log-section-title">Response:</div><div class="log-section-content">${escapeHtml(log.response_body || 'Executing...')}</div></div>
-                <div class="log-section"><div class="log-section-title">IP:</div><div class="log-section-content">${escapeHtml(log.client_ip || "N/A")}</div></div>
-                <div class="log-section"><div class="log-section-title">Time:</div><div class="log-section-content">${log.response_time_ms ? log.response_time_ms.toFixed(2) + ' ms' : 'Executing...'}</div></div>
+                <span class="log-toggle">${expanded ? '▲' : '▼'}</span>
             </div>
+            <div class="log-details" style="display: ${expanded ? 'block' : 'none'};">${expanded ? detailsHtml(log, logDetails.get(log.id)) : ''}</div>
         </div>`;
     }).join("");
+    
+    logsList.querySelectorAll('.log-prints-output').forEach(printsSection => {
+        printsSection.scrollTop = printsSection.scrollHeight;
+    });
 }
 
-function toggleLogDetails(index) {
-    const details = document.getElementById(`details-${index}`);
-    const toggle = document.getElementById(`toggle-${index}`);
+function detailsHtml(log, detail) {
+    if (!detail || !detail.id) {
+        return '<div class="log-section"><div class="log-section-content">Loading...</div></div>';
+    }
+    const isExecuting = log.status === "executing";
+    const prints = detail.prints || detail.stdout || "";
+    return `
+        <div class="log-section"><div class="log-section-title">Query:</div><div class="log-section-content">${escapeHtml(JSON.stringify(detail.query_params, null, 2))}</div></div>
+        <div class="log-section"><div class="log-section-title">Headers:</div><div class="log-section-content">${escapeHtml(JSON.stringify(detail.headers, null, 2))}</div></div>
+        <div class="log-section log-prints-section"><div class="log-section-title">📝 Print Output ${isExecuting ? '(Real-time)' : ''}:</div><div class="log-section-content log-prints-output" style="background: #f0f8ff; border-left: 3px solid #3498db; padding: 10px; font-family: monospace; white-space: pre-wrap; line-height: 1.6; max-height: 300px; overflow-y: auto;">${escapeHtml(prints)}</div></div>
+        <div class="log-section"><div class="log-section-title">Response:</div><div class="log-section-content">${escapeHtml(detail.response_body || 'Executing...')}</div></div>
+        <div class="log-section"><div class="log-section-title">IP:</div><div class="log-section-content">${escapeHtml(detail.client_ip || "N/A")}</div></div>
+        <div class="log-section"><div class="log-section-title">Time:</div><div class="log-section-content">${detail.response_time_ms ? detail.response_time_ms.toFixed(2) + ' ms' : 'Executing...'}</div></div>`;
+}
+
+function renderLogDetails(logId) {
+    const logElement = document.querySelector(`[data-log-id="${logId}"]`);
+    const log = logsMap.get(logId);
+    if (!logElement || !log) return;
+    const details = logElement.querySelector('.log-details');
+    details.innerHTML = detailsHtml(log, logDetails.get(logId));
+    const printsSection = details.querySelector('.log-prints-output');
+    if (printsSection) {
+        printsSection.scrollTop = printsSection.scrollHeight;
+    }
+}
+
+function toggleLogDetails(header) {
+    // Details are fetched when a log is expanded - the list itself only carries summaries
+    const logElement = header.closest('.log-item');
+    const logId = logElement.dataset.logId;
+    const details = logElement.querySelector('.log-details');
+    const toggle = logElement.querySelector('.log-toggle');
     if (details.style.display === "none") {
         details.style.display = "block";
         toggle.textContent = "▲";
-        // Auto-scroll prints section to bottom when expanded
-        const printsSection = details.querySelector('.log-prints-output');
-        if (printsSection) {
-            setTimeout(() => {
-                printsSection.scrollTop = printsSection.scrollHeight;
-            }, 100);
-        }
+        logDetails.set(logId, {});
+        renderLogDetails(logId);
+        fetchLogDetail(logId);
     } else {
         details.style.display = "none";
         toggle.textContent = "▼";
+        logDetails.delete(logId);
     }
 }
 
@@ -115,8 +115,11 @@ async function showApiDetails(apiId) {
         if (detailsApiCreated) detailsApiCreated.textContent = createdDate;
         if (detailsApiUpdated) detailsApiUpdated.textContent = updatedDate;
         
-        // Show code
+        // Show settings and code
+        const detailsApiSettings = document.getElementById("detailsApiSettings");
+        if (detailsApiSettings) detailsApiSettings.textContent = formatSettings(api.settings) || "Defaults";
         if (detailsApiCode) detailsApiCode.textContent = api.python_code || "No code";
+        loadCacheStats(apiId);
         
         // Show details view, hide others
         detailsView.style.display = "block";
@@ -134,6 +137,27 @@ async function showApiDetails(apiId) {
     }
 }
 
+async function loadCacheStats(apiId) {
+    const detailsApiCache = document.getElementById("detailsApiCache");
+    if (!detailsApiCache) return;
+    detailsApiCache.textContent = "";
+    try {
+        const response = await fetch("/api/manage/stats");
+        if (!response.ok) return;
+        const data = await response.json();
+        const runtime = data.apis[apiId];
+        const cache = runtime ? runtime.cache : null;
+        if (!cache) {
+            detailsApiCache.textContent = "Disabled";
+            return;
+        }
+        const hitRate = cache.hit_rate === null ? "-" : `${Math.round(cache.hit_rate * 100)}%`;
+        detailsApiCache.textContent = `${cache.hits} hits / ${cache.misses} misses (${hitRate}), ${cache.entries}/${cache.max_entries} entries, TTL ${cache.ttl_seconds}s`;
+    } catch (error) {
+        console.error("Error loading cache stats:", error);
+    }
+}
+
 function hideDetailsView() {
     document.getElementById("detailsView").style.display = "none";
     currentApiId = null;
@@ -150,6 +174,7 @@ function showEditFromDetails() {
     document.getElementById("editApiPath").value = currentApiData.path;
     document.getElementById("editApiDescription").value = currentApiData.description || "";
     document.getElementById("editApiCode").value = currentApiData.python_code;
+    document.getElementById("editApiSettings").value = formatSettings(currentApiData.settings);
     
     const methodSelect = document.getElementById("editApiMethod");
     methodSelect.innerHTML = ["GET", "POST", "PUT", "DELETE", "PATCH"].map(m => 
@@ -163,14 +188,33 @@ function showEditFromDetails() {
     document.getElementById("emptyState").style.display = "none";
 }
 
+function formatSettings(settings) {
+    if (!settings || Object.keys(settings).length === 0) return "";
+    return JSON.stringify(settings, null, 2);
+}
+
+function parseSettings(elementId) {
+    // Returns undefined for an empty field, throws on invalid JSON
+    const text = document.getElementById(elementId).value.trim();
+    return text ? JSON.parse(text) : undefined;
+}
+
 document.getElementById("createApiForm").addEventListener("submit", async (e) => {
     e.preventDefault();
+    let settings;
+    try {
+        settings = parseSettings("apiSettings");
+    } catch (error) {
+        alert("Settings must be valid JSON: " + error.message);
+        return;
+    }
     const apiData = {
         name: document.getElementById("apiName").value,
         path: document.getElementById("apiPath").value,
         method: document.getElementById("apiMethod").value,
         description: document.getElementById("apiDescription").value,
-        python_code: document.getElementById("apiCode").value
+        python_code: document.getElementById("apiCode").value,
+        settings: settings
     };
     try {
         const response = await fetch("/api/manage/create", {
@@ -180,7 +224,7 @@ document.getElementById("createApiForm").addEventListener("submit", async (e) =>
         });
         const result = await response.json();
         if (response.ok) {
-            alert("API created! Server restart may be required.");
+            alert("API created!");
             hideCreateForm();
             loadAPIs();
         } else {
@@ -205,6 +249,7 @@ async function editAPI(apiId) {
         document.getElementById("editApiMethod").value = api.method;
         document.getElementById("editApiDescription").value = api.description || "";
         document.getElementById("editApiCode").value = api.python_code;
+        document.getElementById("editApiSettings").value = formatSettings(api.settings);
         const methodSelect = document.getElementById("editApiMethod");
         methodSelect.innerHTML = ["GET", "POST", "PUT", "DELETE", "PATCH"].map(m => 
             `<option value="${m}" ${m === api.method ? "selected" : ""}>${m}</option>`
@@ -228,12 +273,20 @@ function hideEditForm() {
 document.getElementById("editApiForm").addEventListener("submit", async (e) => {
     e.preventDefault();
     const apiId = document.getElementById("editApiId").value;
+    let settings;
+    try {
+        settings = parseSettings("editApiSettings") || {};
+    } catch (error) {
+        alert("Settings must be valid JSON: " + error.message);
+        return;
+    }
     const updateData = {
         name: document.getElementById("editApiName").value,
         path: document.getElementById("editApiPath").value,
         method: document.getElementById("editApiMethod").value,
         description: document.getElementById("editApiDescription").value,
-        python_code: document.getElementById("editApiCode").value
+        python_code: document.getElementById("editApiCode").value,
+        settings: settings
     };
     try {
         const response = await fetch(`/api/manage/${apiId}`, {
@@ -243,7 +296,7 @@ document.getElementById("editApiForm").addEventListener("submit", async (e) => {
         });
         const result = await response.json();
         if (response.ok) {
-            alert("API updated! Server restart required.");
+            alert("API updated!");
             hideEditForm();
             loadAPIs();
         } else {
@@ -261,7 +314,7 @@ async function deleteCurrentApi() {
         const response = await fetch(`/api/manage/${currentApiId}`, { method: "DELETE" });
         const result = await response.json();
         if (response.ok) {
-            alert("API deleted! Server restart required.");
+            alert("API deleted!");
             hideEditForm();
             loadAPIs();
         } else {
@@ -0,0 +1,59 @@
+"""
+Shared fixtures. Run from the repository root:
+    python -m pytest -q
+
+Most tests need nothing but the Python dependencies. Tests using the `pg`
+fixture run against the database main.py is configured for (PGHOST, PGPORT,
+PGDATABASE, PGUSER, PGPASSWORD) with init_db.sql applied, and are skipped
+when it cannot be reached.
+"""
+import os
+import sys
+
+import psycopg2
+import pytest
+from starlette.requests import Request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+
+
+@pytest.fixture
+def pg(monkeypatch):
+    """A connection to the test database with the schema migrations applied"""
+    try:
+        conn = psycopg2.connect(connect_timeout=3, **main.DB_CONFIG)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PostgreSQL not reachable: {e}")
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('apis')")
+        if cur.fetchone()[0] is None:
+            conn.close()
+            pytest.skip("apis table missing - apply init_db.sql to the test database first")
+    main.apply_schema_migrations()
+    # The async pool binds to the loop it first runs on - every test runs its own loop
+    monkeypatch.setattr(main, "async_db_pool", main.AsyncDBPool(2))
+    yield conn
+    main.async_db_pool.close()
+    conn.close()
+
+
+@pytest.fixture
+def make_request():
+    """Factory of Starlette requests - make_request(method, path, query, headers, body)"""
+    def make(method="GET", path="/items", query=b"", headers=None, body=b""):
+        scope = {
+            "type": "http",
+            "method": method,
+            "path": path,
+            "query_string": query,
+            "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+        }
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        return Request(scope, receive)
+    return make
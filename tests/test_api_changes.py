@@ -0,0 +1,112 @@
+import asyncio
+import time
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+import main
+
+SLOW_SETUP_CODE = '''import time
+def setup():
+    time.sleep(1)
+    return {"value": VALUE}
+result = {"value": value}
+'''
+
+
+def insert_api(conn, value):
+    api_id = str(uuid.uuid4())
+    with conn.cursor() as cur:
+        cur.execute(
+            "INSERT INTO apis (id, name, path, method, python_code) VALUES (%s, %s, %s, 'GET', %s)",
+            (api_id, f"test-{api_id}", f"/test-changes/{api_id}", SLOW_SETUP_CODE.replace("VALUE", str(value))),
+        )
+    return api_id
+
+
+async def max_loop_lag(task):
+    """Longest stall of the event loop while task runs"""
+    lag = 0.0
+    while not task.done():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lag = max(lag, time.perf_counter() - start - 0.01)
+    return lag
+
+
+def test_apply_api_changes_runs_setup_off_the_loop(pg):
+    api_id = insert_api(pg, 1)
+    try:
+        async def scenario():
+            task = asyncio.ensure_future(main.apply_api_changes([api_id]))
+            lag = await max_loop_lag(task)
+            return lag, await task
+
+        lag, changed = asyncio.run(scenario())
+        assert changed == 1
+        assert lag < 0.5
+        assert main.api_runtimes[api_id].setup_state.state == {"value": 1}
+        # The same version arriving again (e.g. this worker's own NOTIFY) is not re-registered
+        assert asyncio.run(main.apply_api_changes([api_id])) == 0
+    finally:
+        with pg.cursor() as cur:
+            cur.execute("DELETE FROM apis WHERE id = %s", (api_id,))
+        main.remove_dynamic_route(api_id)
+
+
+def test_apply_api_changes_updates_and_removes(pg):
+    api_id = insert_api(pg, 1)
+    try:
+        assert asyncio.run(main.apply_api_changes([api_id])) == 1
+        with pg.cursor() as cur:
+            cur.execute(
+                "UPDATE apis SET python_code = %s, updated_at = updated_at + interval '1 second' WHERE id = %s",
+                (SLOW_SETUP_CODE.replace("VALUE", "2"), api_id),
+            )
+        assert asyncio.run(main.apply_api_changes([api_id])) == 1
+        assert main.api_runtimes[api_id].setup_state.state == {"value": 2}
+        with pg.cursor() as cur:
+            cur.execute("DELETE FROM apis WHERE id = %s", (api_id,))
+        assert asyncio.run(main.apply_api_changes([api_id])) == 1
+        assert api_id not in main.api_runtimes
+    finally:
+        with pg.cursor() as cur:
+            cur.execute("DELETE FROM apis WHERE id = %s", (api_id,))
+        main.remove_dynamic_route(api_id)
+
+
+def test_superseded_registration_is_discarded():
+    api_def = {
+        "id": str(uuid.uuid4()), "path": "/test-changes/superseded", "method": "GET",
+        "python_code": SLOW_SETUP_CODE.replace("VALUE", "1"), "updated_at": "v1", "settings": {},
+    }
+
+    async def scenario():
+        slow = asyncio.ensure_future(main.register_dynamic_route(api_def))
+        await asyncio.sleep(0.2)
+        # Removed while its setup() is still running
+        main.remove_dynamic_route(api_def["id"])
+        await slow
+
+    try:
+        asyncio.run(scenario())
+        assert api_def["id"] not in main.api_runtimes
+        assert ("GET", api_def["path"]) not in main.dynamic_routes
+    finally:
+        main.remove_dynamic_route(api_def["id"])
+
+
+def test_update_cannot_move_onto_another_apis_path(pg, make_request):
+    first, second = insert_api(pg, 1), insert_api(pg, 2)
+    try:
+        update = main.APIUpdate(path=f"/test-changes/{first}")
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(main.update_api(second, update, make_request("PUT"), auth=True))
+        assert error.value.status_code == 400
+        with pg.cursor() as cur:
+            cur.execute("SELECT path FROM apis WHERE id = %s", (second,))
+            assert cur.fetchone()[0] == f"/test-changes/{second}"
+    finally:
+        with pg.cursor() as cur:
+            cur.execute("DELETE FROM apis WHERE id = ANY(%s)", ([first, second],))
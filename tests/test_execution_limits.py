@@ -0,0 +1,102 @@
+import asyncio
+import threading
+
+import main
+
+
+def test_clamp_timeout():
+    assert main.clamp_timeout(None, 2.0) == 2.0
+    assert main.clamp_timeout(5, 2.0) == 2.0
+    assert main.clamp_timeout(1, 2.0) == 1
+    # (connect, read) - each part ends by the deadline
+    assert main.clamp_timeout((3.05, 27), 2.0) == (2.0, 2.0)
+    assert main.clamp_timeout((1, None), 2.0) == (1, 2.0)
+    assert main.clamp_timeout([0.5, 10], 2.0) == (0.5, 2.0)
+
+
+def test_timed_out_execution_keeps_its_slot():
+    async def scenario():
+        limiter = main.APIConcurrencyLimiter(max_concurrency=1)
+        assert await limiter.acquire()
+        execution = asyncio.get_running_loop().create_future()
+        limiter.release_when_done(execution)
+        assert limiter.stats()["timed_out_running"] == 1
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0.01)
+        # The timed-out code is still running - no second execution yet
+        assert not waiter.done()
+        execution.set_result(None)
+        assert await asyncio.wait_for(waiter, 1)
+        assert limiter.stats()["timed_out_running"] == 0
+        assert limiter.stats()["active"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_full_wait_queue_rejects():
+    async def scenario():
+        limiter = main.APIConcurrencyLimiter(max_concurrency=1, queue_depth=0)
+        assert await limiter.acquire()
+        assert not await limiter.acquire()
+        assert limiter.stats()["rejected"] == 1
+        limiter.release()
+        assert await limiter.acquire()
+
+    asyncio.run(scenario())
+
+
+def test_execution_pool_counts_timed_out_threads():
+    async def scenario():
+        pool = main.ExecutionPool(2)
+        try:
+            release = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            started = loop.create_future()
+
+            def slow():
+                loop.call_soon_threadsafe(started.set_result, None)
+                asyncio.run_coroutine_threadsafe(release.wait(), loop).result()
+
+            execution = asyncio.ensure_future(pool.run(slow))
+            await started
+            pool.track_timed_out(execution)
+            assert pool.stats()["timed_out_running"] == 1
+            release.set()
+            await execution
+            assert pool.stats()["timed_out_running"] == 0
+        finally:
+            pool.shutdown()
+
+    asyncio.run(scenario())
+
+
+class IdleWorker:
+    """Stands in for a ProcessWorker - records kills and refuses to run anything"""
+
+    def __init__(self):
+        self.process = self
+        self.killed = 0
+        self.loaded = {}
+        self.send_lock = threading.Lock()
+
+    def kill(self):
+        self.killed += 1
+
+    @property
+    def conn(self):
+        raise AssertionError("nothing may be sent to the worker")
+
+
+def test_timeout_claimed_before_the_callback_is_set_is_not_missed():
+    pool = main.ProcessWorkerPool(1)
+    worker = IdleWorker()
+    pool.workers, pool.idle = [worker], [worker]
+    control = main.ExecutionControl(1)
+    # claim("timeout") has read on_cancel (still None) but not yet set cancelled
+    control.state = "timeout"
+    exec_result = pool.run("api", "v1", "result = 1", {}, control=control)
+    assert not exec_result["success"]
+    assert "cancelled before it started" in exec_result["stderr"]
+    assert control.on_cancel is None
+    assert pool.idle == [worker]
+
@@ -0,0 +1,92 @@
+import asyncio
+import json
+import threading
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+import main
+
+
+@pytest.fixture
+def no_log_writes(monkeypatch):
+    """Executions queue their log writes in a writer that never flushes to the database"""
+    writer = main.LogWriter(max_rows=1000, flush_interval_ms=200)
+    writer._ensure_started = lambda: None
+    monkeypatch.setattr(main, "log_writer", writer)
+    return writer
+
+
+@pytest.fixture
+def api(no_log_writes):
+    api_def = {"id": str(uuid.uuid4()), "method": "GET", "settings": {}}
+    api_def["path"] = f"/test-hot-swap/{api_def['id']}"
+    yield api_def
+    main.remove_dynamic_route(api_def["id"])
+
+
+def deploy(api_def, code, version):
+    main.create_dynamic_route(dict(api_def, python_code=code, updated_at=version))
+
+
+async def call(make_request, path):
+    response = await main.dispatch_dynamic_api(make_request("GET", path), path.lstrip("/"))
+    return json.loads(response.body)
+
+
+def test_update_takes_effect_on_the_next_request(api, make_request):
+    deploy(api, "result = {'version': 1}", "v1")
+    assert asyncio.run(call(make_request, api["path"])) == {"result": {"version": 1}}
+    deploy(api, "result = {'version': 2}", "v2")
+    assert asyncio.run(call(make_request, api["path"])) == {"result": {"version": 2}}
+
+
+def test_in_flight_request_finishes_on_the_old_version(api, make_request):
+    release = threading.Event()
+    main.execution_release = release
+    try:
+        deploy(api, "import main\nmain.execution_release.wait(5)\nresult = {'version': 1}", "v1")
+
+        async def scenario():
+            in_flight = asyncio.ensure_future(call(make_request, api["path"]))
+            await asyncio.sleep(0.1)
+            await asyncio.to_thread(deploy, api, "result = {'version': 2}", "v2")
+            assert await call(make_request, api["path"]) == {"result": {"version": 2}}
+            release.set()
+            return await in_flight
+
+        assert asyncio.run(scenario()) == {"result": {"version": 1}}
+    finally:
+        release.set()
+        del main.execution_release
+
+
+def test_removed_api_is_not_found(api, make_request):
+    deploy(api, "result = 1", "v1")
+    main.remove_dynamic_route(api["id"])
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(call(make_request, api["path"]))
+    assert error.value.status_code == 404
+    assert (api["method"], api["path"]) not in main.api_log_index
+
+
+def test_path_change_unregisters_the_old_path(api, make_request):
+    deploy(api, "result = 'old path'", "v1")
+    old_path = api["path"]
+    api["path"] = old_path + "/moved"
+    deploy(api, "result = 'new path'", "v2")
+    assert ("GET", old_path) not in main.dynamic_routes
+    assert asyncio.run(call(make_request, api["path"])) == {"result": "new path"}
+
+
+def test_key_taken_over_by_another_api_stays_with_its_owner(api, make_request):
+    other = dict(api, id=str(uuid.uuid4()))
+    try:
+        deploy(api, "result = 'first'", "v1")
+        deploy(other, "result = 'second'", "v1")
+        main.remove_dynamic_route(api["id"])
+        assert asyncio.run(call(make_request, api["path"])) == {"result": "second"}
+    finally:
+        main.remove_dynamic_route(other["id"])
+    assert ("GET", api["path"]) not in main.dynamic_routes
@@ -0,0 +1,78 @@
+import datetime
+import decimal
+import json
+import uuid
+
+import pytest
+
+import main
+
+VALUES = {
+    "when": datetime.datetime(2024, 5, 1, 12, 30, 15, 250000),
+    "day": datetime.date(2024, 5, 1),
+    "integral": decimal.Decimal("12"),
+    "fraction": decimal.Decimal("1.5"),
+    "id": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+    "tags": {"a"},
+    "raw": b"bytes",
+}
+
+
+def test_process_results_match_thread_mode_encoding():
+    exec_result = main._make_picklable({"success": True, "result": VALUES})
+    assert exec_result["success"] is True
+    assert exec_result["result"] == json.loads(main.encode_json(VALUES))
+    assert exec_result["result"]["integral"] == 12
+    assert exec_result["result"]["fraction"] == 1.5
+    assert exec_result["result"]["raw"] == "bytes"
+    assert exec_result["result"]["tags"] == ["a"]
+
+
+@pytest.fixture(params=["orjson", "stdlib"])
+def encoder(request, monkeypatch):
+    """encode_json with orjson (when installed) and with the standard library fallback"""
+    if request.param == "stdlib":
+        monkeypatch.setattr(main, "orjson", None)
+    elif main.orjson is None:
+        pytest.skip("orjson not installed")
+    return main.encode_json
+
+
+def test_encodes_known_types_the_same_way_on_both_paths(encoder):
+    assert json.loads(encoder(VALUES)) == {
+        "when": "2024-05-01T12:30:15.250000",
+        "day": "2024-05-01",
+        "integral": 12,
+        "fraction": 1.5,
+        "id": "12345678-1234-5678-1234-567812345678",
+        "tags": ["a"],
+        "raw": "bytes",
+    }
+
+
+def test_output_is_compact_utf8(encoder):
+    assert encoder({"a": [1, 2], "u": "é"}) == '{"a":[1,2],"u":"é"}'.encode("utf-8")
+
+
+def test_non_string_keys_and_big_integers(encoder):
+    assert json.loads(encoder({1: "x", "big": 2 ** 70})) == {"1": "x", "big": 2 ** 70}
+
+
+def test_unknown_types_fall_back_to_str(encoder):
+    class Opaque:
+        def __str__(self):
+            return "opaque"
+
+    assert encoder([Opaque()]) == b'["opaque"]'
+
+
+def test_registered_encoders_apply_to_subclasses(encoder, monkeypatch):
+    class Money:
+        def __init__(self, cents):
+            self.cents = cents
+
+    class Euro(Money):
+        pass
+
+    monkeypatch.setitem(main.JSON_TYPE_ENCODERS, Money, lambda value: {"cents": value.cents})
+    assert json.loads(encoder({"price": Euro(250)})) == {"price": {"cents": 250}}
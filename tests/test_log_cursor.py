@@ -0,0 +1,87 @@
+import asyncio
+import datetime
+
+import pytest
+from fastapi import HTTPException
+
+import main
+
+
+class FakeCursor:
+    def __init__(self, rows, executed):
+        self.rows = rows
+        self.executed = executed
+
+    def execute(self, sql, params):
+        self.executed.append((sql, params))
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def logs_table(monkeypatch):
+    """load_logs against canned rows - records the query it runs instead of hitting the database"""
+    table = {"rows": [], "executed": []}
+
+    class FakeConnection:
+        def cursor(self, cursor_factory=None):
+            return FakeCursor(table["rows"], table["executed"])
+
+    monkeypatch.setattr(main, "get_db_connection", FakeConnection)
+    monkeypatch.setattr(main, "return_db_connection", lambda conn: None)
+    return table
+
+
+def row(minute, log_id):
+    return {"id": log_id, "timestamp": datetime.datetime(2024, 5, 1, 12, minute, 0, 123456)}
+
+
+def test_cursor_round_trip():
+    log = main._log_row(row(30, "6f1c-id"))
+    assert main.encode_log_cursor(log) == "2024-05-01T12:30:00.123456|6f1c-id"
+    assert main.decode_log_cursor(main.encode_log_cursor(log)) == (
+        datetime.datetime(2024, 5, 1, 12, 30, 0, 123456), "6f1c-id"
+    )
+
+
+def test_timezone_aware_timestamps_survive():
+    when = datetime.datetime(2024, 5, 1, 12, 30, tzinfo=datetime.timezone.utc)
+    cursor = main.encode_log_cursor({"timestamp": when.isoformat(), "id": "x"})
+    assert main.decode_log_cursor(cursor) == (when, "x")
+
+
+@pytest.mark.parametrize("cursor", ["", "2024-05-01T12:30:00", "2024-05-01T12:30:00|", "yesterday|abc"])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        main.decode_log_cursor(cursor)
+
+
+def test_endpoint_answers_400_for_a_bad_cursor():
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(main.get_logs(before="not-a-cursor", auth=True))
+    assert error.value.status_code == 400
+
+
+def test_next_cursor_only_when_there_is_another_page(logs_table):
+    logs_table["rows"] = [row(3, "c"), row(2, "b"), row(1, "a")]
+    page = main.load_logs(limit=2)
+    assert [log["id"] for log in page["logs"]] == ["c", "b"]
+    assert page["next_cursor"] == main.encode_log_cursor(page["logs"][-1])
+    # One extra row is fetched to tell whether there is a next page
+    assert logs_table["executed"][-1][1] == [3]
+
+    logs_table["rows"] = [row(1, "a")]
+    assert main.load_logs(limit=2)["next_cursor"] is None
+
+
+def test_cursor_and_filters_become_a_keyset_query(logs_table):
+    before = main.encode_log_cursor(main._log_row(row(2, "b")))
+    main.load_logs(limit=10, filters={"status": "error", "path": None}, before=before)
+    sql, params = logs_table["executed"][-1]
+    assert "WHERE status = %s AND (timestamp, id) < (%s, %s)" in sql
+    assert sql.endswith("ORDER BY timestamp DESC, id DESC LIMIT %s")
+    assert params == ["error", datetime.datetime(2024, 5, 1, 12, 2, 0, 123456), "b", 11]
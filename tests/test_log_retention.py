@@ -0,0 +1,41 @@
+import main
+
+
+def test_row_limit_scan_skipped_within_estimate(pg):
+    with pg.cursor() as cur:
+        cur.execute("ANALYZE api_logs")
+    retention = main.LogRetention(0, 10 ** 9, 0)
+    retention.run_once()
+    assert retention.last_error is None
+    assert retention.estimated_rows is not None
+    assert retention.count_scans == 0
+
+
+def test_row_limit_scan_runs_beyond_estimate(pg):
+    retention = main.LogRetention(0, 10 ** 8, 0)
+    # Estimate over the limit, real count under it - the exact scan decides, nothing is deleted
+    retention._estimate_rows = lambda cur: 10 ** 9
+    retention.run_once()
+    assert retention.last_error is None
+    assert retention.count_scans == 1
+    assert retention.rows_deleted == 0
+
+
+def test_drop_partition_without_blocking(pg):
+    with pg.cursor() as cur:
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = 'api_logs'::regclass")
+        if cur.fetchone()[0] != "p":
+            return
+        cur.execute("DROP TABLE IF EXISTS api_logs_p20000101")
+        cur.execute(
+            "CREATE TABLE api_logs_p20000101 PARTITION OF api_logs FOR VALUES FROM ('2000-01-01') TO ('2000-01-02')"
+        )
+    conn = main.get_db_connection()
+    try:
+        main.LogRetention(0, 0, 0)._drop_partition(conn, conn.cursor(), "api_logs_p20000101")
+        assert conn.autocommit is False
+    finally:
+        main.return_db_connection(conn)
+    with pg.cursor() as cur:
+        cur.execute("SELECT to_regclass('api_logs_p20000101')")
+        assert cur.fetchone()[0] is None
@@ -0,0 +1,82 @@
+import pytest
+
+import main
+
+
+@pytest.fixture
+def writer():
+    """A LogWriter whose batches stay pending - no writer thread, no database"""
+    writer = main.LogWriter(max_rows=10, flush_interval_ms=200)
+    writer._ensure_started = lambda: None
+    return writer
+
+
+def test_insert_and_final_update_merge_into_one_row(writer):
+    writer.insert({"id": "a", "method": "GET", "path": "/x", "status": "executing"})
+    writer.update("a", {"status": "completed", "status_code": 200})
+    writer.append_chunk("a", 1, "hello\n")
+    assert list(writer.pending) == ["a"]
+    op = writer.pending["a"]
+    assert op["insert"]["status"] == "completed"
+    assert op["insert"]["status_code"] == 200
+    assert op["set"] == {}
+    assert [text for _, _, text in op["chunks"]] == ["hello\n"]
+    assert writer.stats()["merged_writes"] == 2
+
+
+def test_update_of_written_row_is_queued_as_set(writer):
+    writer.update("a", {"status": "completed"})
+    writer.update("a", {"status_code": 200})
+    op = writer.pending["a"]
+    assert op["insert"] is None
+    assert op["set"] == {"status": "completed", "status_code": 200}
+
+
+def test_update_before_insert_is_folded_into_the_insert(writer):
+    writer.update("a", {"status": "completed"})
+    writer.insert({"id": "a", "status": "executing"})
+    op = writer.pending["a"]
+    assert op["insert"]["status"] == "completed"
+    assert op["set"] == {}
+
+
+def test_statements_for_a_batch(writer):
+    writer.insert({"id": "a", "status": "completed"})
+    writer.update("b", {"status": "error"})
+    writer.append_chunk("b", 3, "out")
+    statements = list(writer._statements(writer._take()))
+    sqls = [" ".join(sql.split()) for sql, _, _ in statements]
+    assert sqls[0].startswith("INSERT INTO api_logs")
+    assert statements[0][1][0][main.LOG_COLUMNS.index("id")] == "a"
+    assert sqls[1] == "UPDATE api_logs SET status = %s WHERE id = %s"
+    assert statements[1][1] == [["error", "b"]]
+    assert sqls[2].startswith("INSERT INTO api_log_chunks")
+    assert [row[:3] for row in statements[2][1]] == [("b", 3, "out")]
+    assert sqls[3] == "SELECT pg_notify(%s, %s)"
+
+
+def test_full_queue_refuses_new_entries_but_keeps_final_updates(writer):
+    writer.max_rows = 2
+    writer.reserve_rows = 1
+    writer.insert({"id": "a"})
+    writer.insert({"id": "b"})
+    writer.insert({"id": "c"})
+    # Updates and output of accepted entries use the reserve
+    writer.update("written", {"status": "completed"})
+    writer.append_chunk("other", 1, "lost")
+    # Entries already pending merge without needing room
+    writer.update("a", {"status": "completed"})
+    stats = writer.stats()
+    assert set(writer.pending) == {"a", "b", "written"}
+    assert stats["dropped_inserts"] == 1
+    assert stats["dropped_final_updates"] == 0
+    assert stats["dropped_chunks"] == 1
+    assert stats["dropped"] == 2
+
+
+def test_output_gaps_are_marked():
+    chunks = main._mark_output_gaps([(1, "a"), (2, "b"), (4, "d")], 0)
+    assert [chunk["content"] for chunk in chunks] == ["a", "b", main.LOG_OUTPUT_GAP_MARKER + "d"]
+    # Tailing continues after the last seen chunk
+    assert main._mark_output_gaps([(5, "e")], 4) == [{"seq": 5, "content": "e"}]
+    assert main._mark_output_gaps([(6, "f")], 4)[0]["content"].startswith(main.LOG_OUTPUT_GAP_MARKER)
@@ -0,0 +1,106 @@
+import multiprocessing
+import sys
+import threading
+import uuid
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def no_log_writes(monkeypatch):
+    """Executions queue their log writes in a writer that never flushes to the database"""
+    writer = main.LogWriter(max_rows=1000, flush_interval_ms=200)
+    writer._ensure_started = lambda: None
+    monkeypatch.setattr(main, "log_writer", writer)
+    return writer
+
+
+def route_prints(monkeypatch):
+    """pytest swaps sys.stdout around every test phase - route prints to the executions again"""
+    monkeypatch.setattr(sys, "stdout", main.ExecutionOutputRouter(sys.stdout, main.execution_stdout))
+
+
+@pytest.fixture
+def worker(no_log_writes):
+    """_process_worker_main running in a thread - send(message) and recv() its replies"""
+    conn, child_conn = multiprocessing.Pipe()
+    thread = threading.Thread(target=main._process_worker_main, args=(child_conn,), daemon=True)
+    thread.start()
+    yield conn
+    conn.close()
+    thread.join(5)
+
+
+def run(worker, source, request_data=None, timeout=None):
+    worker.send(("run", str(uuid.uuid4()), "v1", source, request_data or {}, None, timeout, timeout))
+    return worker.recv()
+
+
+GENERATOR_CODE = '''def items():
+    for i in range(3):
+        print("item", i)
+        yield {"i": i}
+result = items()
+'''
+
+
+def test_iterator_results_are_collected_with_their_prints(no_log_writes, monkeypatch):
+    route_prints(monkeypatch)
+    exec_result = main.execute_python_code(GENERATOR_CODE, {}, collect_stream=True)
+    assert exec_result["success"]
+    assert exec_result["result"] == [{"i": 0}, {"i": 1}, {"i": 2}]
+    assert exec_result["stdout"] == "item 0\nitem 1\nitem 2\n"
+
+
+def test_error_inside_an_iterator_fails_the_execution(no_log_writes):
+    code = "def items():\n    yield 1\n    raise ValueError('boom')\nresult = items()\n"
+    exec_result = main.execute_python_code(code, {}, collect_stream=True)
+    assert not exec_result["success"]
+    assert exec_result["result"] is None
+    assert "Execution error: boom" in exec_result["stderr"]
+
+
+def test_worker_sends_collected_iterator_results(worker, monkeypatch):
+    route_prints(monkeypatch)
+    exec_result = run(worker, GENERATOR_CODE)
+    assert exec_result["result"] == [{"i": 0}, {"i": 1}, {"i": 2}]
+    assert "item 2" in exec_result["stdout"]
+
+
+def test_result_that_cannot_be_sent_does_not_kill_the_worker(worker, monkeypatch):
+    route_prints(monkeypatch)
+    class Unsendable:
+        pass
+
+    def refuse(value):
+        raise ValueError("no encoding")
+
+    # Local classes cannot be pickled, and this encoder fails too
+    monkeypatch.setitem(main.JSON_TYPE_ENCODERS, Unsendable, refuse)
+    main.Unsendable = Unsendable
+    try:
+        exec_result = run(worker, "import main\nprint('ran')\nresult = {'value': main.Unsendable()}")
+    finally:
+        del main.Unsendable
+    assert not exec_result["success"]
+    assert "cannot be sent from the worker process: no encoding" in exec_result["stderr"]
+    assert exec_result["stdout"] == "ran\n"
+    assert run(worker, "result = {'still': 'serving'}")["result"] == {"still": "serving"}
+
+
+ENDLESS_CODE = "import itertools\nresult = ({'i': i} for i in itertools.count())\n"
+
+
+def test_endless_iterator_fails_at_the_size_limit(no_log_writes, monkeypatch):
+    monkeypatch.setattr(main, "PROCESS_STREAM_MAX_BYTES", 1000)
+    exec_result = main.execute_python_code(ENDLESS_CODE, {}, collect_stream=True)
+    assert not exec_result["success"]
+    assert "exceeds 1000 bytes" in exec_result["stderr"]
+
+
+def test_endless_iterator_fails_at_the_deadline(worker):
+    exec_result = run(worker, ENDLESS_CODE, timeout=0.2)
+    assert not exec_result["success"]
+    assert "timed out after 0.2s" in exec_result["stderr"]
@@ -0,0 +1,79 @@
+import pytest
+
+import main
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(main.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_token_bucket_allows_bursts_then_refills():
+    bucket = main.TokenBucket(rate=2, burst=3)
+    bucket.updated = 0.0
+    assert [bucket.take(0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take(0.0) == pytest.approx(0.5)
+    # Half a second refills one token
+    assert bucket.take(0.5) == 0.0
+    assert bucket.take(0.5) > 0
+    # Never beyond the burst
+    bucket.take(100.0)
+    assert bucket.tokens == pytest.approx(2)
+
+
+def test_token_bucket_burst_defaults_to_the_rate():
+    assert main.TokenBucket(rate=2.5).burst == 3
+    assert main.TokenBucket(rate=0.1).burst == 1
+
+
+def test_clients_are_limited_separately(clock):
+    limiter = main.APIRateLimiter(per_client={"rate": 1, "burst": 1})
+    assert limiter.check("10.0.0.1") == 0.0
+    assert limiter.check("10.0.0.1") > 0
+    assert limiter.check("10.0.0.2") == 0.0
+    clock[0] += 1
+    assert limiter.check("10.0.0.1") == 0.0
+    assert limiter.stats()["limited"] == 1
+    assert limiter.stats()["allowed"] == 3
+
+
+def test_call_rejected_by_the_api_bucket_keeps_the_client_token(clock):
+    limiter = main.APIRateLimiter(per_api={"rate": 1, "burst": 1}, per_client={"rate": 1, "burst": 1})
+    assert limiter.check("10.0.0.1") == 0.0
+    assert limiter.check("10.0.0.2") > 0
+    clock[0] += 1
+    # 10.0.0.2 was turned away by the API bucket, so its own token is still there
+    assert limiter.check("10.0.0.2") == 0.0
+
+
+def test_tracked_clients_are_bounded(monkeypatch):
+    monkeypatch.setattr(main, "RATE_LIMIT_MAX_CLIENTS", 2)
+    limiter = main.APIRateLimiter(per_client={"rate": 1})
+    for ip in ("a", "b", "c"):
+        limiter.check(ip)
+    assert list(limiter.client_buckets) == ["b", "c"]
+
+
+def test_load_shedding_on_queue_length():
+    pool = main.ExecutionPool(1, shed_max_queued=2)
+    try:
+        assert not pool.should_shed()
+        pool.queued = 2
+        assert pool.should_shed()
+        assert pool.stats()["shed"] == 1
+    finally:
+        pool.shutdown()
+
+
+def test_load_shedding_on_recent_queue_wait():
+    pool = main.ExecutionPool(1, shed_max_wait_ms=50)
+    try:
+        pool.avg_wait_ms = 80
+        # Only while work is actually queued
+        assert not pool.should_shed()
+        pool.queued = 1
+        assert pool.should_shed()
+    finally:
+        pool.shutdown()
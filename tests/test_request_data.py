@@ -0,0 +1,92 @@
+import asyncio
+import pickle
+
+import pytest
+
+import main
+
+FIELDS = ["query_params", "headers", "body"]
+
+
+def request_key(request):
+    return asyncio.run(main.compute_request_key(request, FIELDS, ["authorization"]))
+
+
+def test_small_bodies_are_part_of_the_key(make_request):
+    def post(body):
+        return make_request("POST", body=body, headers={"Content-Length": str(len(body))})
+
+    assert request_key(post(b'{"a": 1}')) == request_key(post(b'{"a": 1}'))
+    assert request_key(post(b'{"a": 1}')) != request_key(post(b'{"a": 2}'))
+
+
+def test_get_requests_are_keyed_without_reading_a_body(make_request):
+    assert request_key(make_request("GET", query=b"a=1")) is not None
+
+
+def test_bodies_not_read_for_a_key(make_request):
+    big = str(main.REQUEST_KEY_BODY_MAX_BYTES + 1)
+    assert request_key(make_request("POST", headers={"Content-Length": big})) is None
+    # Chunked - length unknown
+    assert request_key(make_request("POST", body=b"x")) is None
+    multipart = {"Content-Type": "multipart/form-data; boundary=x", "Content-Length": "10"}
+    assert request_key(make_request("POST", headers=multipart, body=b"0123456789")) is None
+
+
+def test_uncacheable_requests_are_counted(make_request):
+    cache = main.APIResponseCache(ttl_seconds=30, key_fields=FIELDS)
+    assert asyncio.run(cache.make_key(make_request("POST", body=b"x"))) is None
+    assert cache.stats()["bypassed"] == 1
+
+
+def test_body_is_loaded_on_first_access_from_a_thread(make_request):
+    async def scenario():
+        request = make_request("POST", body=b'{"a": 1}', headers={"Content-Type": "application/json"})
+        data = main.RequestData(request, asyncio.get_running_loop())
+        assert "body" in data
+        return await asyncio.to_thread(data.get, "body")
+
+    assert asyncio.run(scenario()) == {"a": 1}
+
+
+def test_async_handler_get_body_raises_until_loaded(make_request):
+    async def scenario():
+        request = make_request("POST", body=b'{"a": 1}', headers={"Content-Type": "application/json"})
+        data = main.RequestData(request, asyncio.get_running_loop())
+        with pytest.raises(RuntimeError, match="await request_data.ajson"):
+            data.get("body", {})
+        assert data.get("missing", 1) == 1
+        assert await data.ajson() == {"a": 1}
+        assert data.get("body") == {"a": 1}
+
+    asyncio.run(scenario())
+
+
+def test_get_body_of_a_get_request_is_the_default(make_request):
+    async def scenario():
+        data = main.RequestData(make_request("GET"), asyncio.get_running_loop())
+        return data.get("body", "none")
+
+    assert asyncio.run(scenario()) == "none"
+
+
+def test_materialized_uploads_can_be_sent_to_a_worker_process(make_request):
+    body = (
+        b"--b\r\nContent-Disposition: form-data; name=\"title\"\r\n\r\nReport\r\n"
+        b"--b\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.txt\"\r\n"
+        b"Content-Type: text/plain\r\n\r\nhello\r\n--b--\r\n"
+    )
+
+    async def scenario():
+        request = make_request("POST", body=body, headers={"Content-Type": "multipart/form-data; boundary=b"})
+        data = main.RequestData(request, asyncio.get_running_loop())
+        try:
+            return await asyncio.to_thread(data.materialize)
+        finally:
+            await data.aclose()
+
+    materialized = pickle.loads(pickle.dumps(asyncio.run(scenario())))
+    assert materialized["body"] == {
+        "title": "Report",
+        "file": {"filename": "a.txt", "content_type": "text/plain", "content": b"hello"},
+    }
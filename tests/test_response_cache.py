@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def key(make_request):
+    def make_key(cache, **kwargs):
+        return asyncio.run(cache.make_key(make_request(**kwargs)))
+    return make_key
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(main.time, "monotonic", lambda: now[0])
+    cache = main.APIResponseCache(ttl_seconds=30)
+    cache.set("k", b"body")
+    assert cache.get("k") == b"body"
+    now[0] += 31
+    assert cache.get("k") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = main.APIResponseCache(ttl_seconds=30, max_entries=2)
+    cache.set("a", b"1")
+    cache.set("b", b"2")
+    cache.get("a")
+    cache.set("c", b"3")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1"
+    assert cache.get("c") == b"3"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_default_key_separates_callers(key):
+    cache = main.APIResponseCache(ttl_seconds=30)
+    alice = key(cache, query=b"id=1", headers={"Authorization": "Bearer alice"})
+    bob = key(cache, query=b"id=1", headers={"Authorization": "Bearer bob"})
+    assert alice != bob
+    assert alice == key(cache, query=b"id=1", headers={"Authorization": "Bearer alice", "X-Trace": "x"})
+    assert alice != key(cache, query=b"id=2", headers={"Authorization": "Bearer alice"})
+
+
+def test_empty_header_list_shares_responses(key):
+    cache = main.APIResponseCache(ttl_seconds=30, headers=[])
+    assert key(cache, headers={"Authorization": "a"}) == key(cache, headers={"Authorization": "b"})
+
+
+def test_path_is_part_of_the_key(key):
+    cache = main.APIResponseCache(ttl_seconds=30)
+    assert key(cache, path="/items/1") != key(cache, path="/items/2")
+
+
+def test_saved_default_settings_key_on_authorization(key):
+    # Settings are stored with their defaults filled in - what a new API gets
+    settings = main.CacheSettings(ttl_seconds=30).model_dump()
+    cache = main.APIResponseCache(settings["ttl_seconds"], settings["max_entries"], settings["key"], settings["headers"])
+    assert key(cache, headers={"Authorization": "a"}) != key(cache, headers={"Authorization": "b"})
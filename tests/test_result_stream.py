@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+import pytest
+
+import main
+
+
+async def collect(stream, control=None):
+    return [batch async for batch in stream.batches(main.encode_ndjson_item, control)]
+
+
+def test_items_are_encoded_in_batches():
+    stream = main.ResultStream(iter([{"a": 1}, {"a": 2}]))
+    assert asyncio.run(collect(stream)) == [b'{"a":1}\n{"a":2}\n']
+
+
+def test_error_after_items_is_raised_on_the_next_pull():
+    def gen():
+        yield 1
+        raise ValueError("boom")
+
+    async def scenario():
+        batches = main.ResultStream(gen()).batches(main.encode_ndjson_item)
+        assert await batches.__anext__() == b"1\n"
+        with pytest.raises(ValueError, match="boom"):
+            await batches.__anext__()
+
+    asyncio.run(scenario())
+
+
+def test_slow_sync_pull_times_out_and_is_closed_later():
+    def gen():
+        time.sleep(0.3)
+        yield 1
+        yield 2
+
+    iterator = gen()
+    control = main.ExecutionControl(0.05)
+
+    async def scenario():
+        with pytest.raises(TimeoutError):
+            await collect(main.ResultStream(iterator), control)
+        assert control.cancelled.is_set()
+        # Closed once the thread that was pulling returns
+        await asyncio.sleep(0.5)
+
+    asyncio.run(scenario())
+    assert iterator.gi_frame is None
+
+
+def test_slow_async_pull_times_out():
+    async def gen():
+        await asyncio.sleep(1)
+        yield 1
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(collect(main.ResultStream(gen()), main.ExecutionControl(0.05)))
@@ -0,0 +1,58 @@
+import main
+
+
+def build(*templates):
+    index = main.RouteIndex()
+    for method, path in templates:
+        index.add(method, path, f"{method} {path}", api_id=f"{method} {path}")
+    return index
+
+
+def test_template_values_become_path_params():
+    index = build(("GET", "/api/claims/{claim_id}/lines/{line}"))
+    assert index.match("GET", "/api/claims/42/lines/7") == (
+        "GET /api/claims/{claim_id}/lines/{line}", {"claim_id": "42", "line": "7"}
+    )
+    assert index.match("POST", "/api/claims/42/lines/7") is None
+    assert index.match("GET", "/api/claims/42/lines") is None
+    # A parameter never matches an empty segment
+    assert index.match("GET", "/api/claims//lines/7") is None
+
+
+def test_literal_segment_wins_over_parameter():
+    index = build(("GET", "/items/{item_id}"), ("GET", "/items/special"))
+    assert index.match("GET", "/items/special")[0] == "GET /items/special"
+    assert index.match("GET", "/items/other") == ("GET /items/{item_id}", {"item_id": "other"})
+
+
+def test_falls_back_to_parameter_when_the_literal_branch_dead_ends():
+    index = build(("GET", "/a/b/c"), ("GET", "/a/{x}/d"))
+    assert index.match("GET", "/a/b/d") == ("GET /a/{x}/d", {"x": "b"})
+    assert index.match("GET", "/a/b/c")[0] == "GET /a/b/c"
+
+
+def test_templates_differing_only_in_names_collide():
+    index = build(("GET", "/users/{id}"))
+    assert index.owner("GET", "/users/{user_id}") == "GET /users/{id}"
+    assert index.owner("POST", "/users/{user_id}") is None
+
+
+def test_remove_prunes_empty_branches():
+    index = build(("GET", "/a/{x}/b"), ("GET", "/a/{x}"))
+    index.remove("GET", "/a/{x}/b")
+    assert index.match("GET", "/a/1/b") is None
+    assert index.match("GET", "/a/1")[1] == {"x": "1"}
+    index.remove("GET", "/a/{x}")
+    assert not index.root.children
+
+
+def test_path_validation():
+    assert main.validate_api_path("/items/{item_id}") is None
+    assert main.validate_api_path("items") == "Path must start with /"
+    assert "whole segments" in main.validate_api_path("/items/id-{item_id}")
+    assert "Duplicate" in main.validate_api_path("/a/{x}/b/{x}")
+
+
+def test_literal_paths_are_not_templates():
+    assert main.is_path_template("/items/{item_id}")
+    assert not main.is_path_template("/items/all")
@@ -0,0 +1,49 @@
+import asyncio
+
+import main
+
+SOURCE = '''import os
+def setup():
+    if os.path.exists(FAIL_MARKER):
+        os.remove(FAIL_MARKER)
+        raise RuntimeError("first setup fails")
+    return {"value": "from setup"}
+
+async def handler(request_data):
+    return {"value": value}
+'''
+
+
+def load(source, marker):
+    """Setup state and async handler wired up like create_dynamic_route does"""
+    source = source.replace("FAIL_MARKER", repr(str(marker)))
+    setup_state = main.APISetupState("test", main.compile_setup_code(source))
+    setup_state.start()
+    handler = main.load_async_handler({}, main.compile_api_code(source), setup_state.state)
+    setup_state.on_ready = handler.__globals__.update
+    return setup_state, handler
+
+
+def call(handler, setup_state):
+    return asyncio.run(main.execute_async_handler(handler, {}, setup_state))
+
+
+def test_state_is_bound_once_not_per_call(tmp_path):
+    setup_state, handler = load(SOURCE, tmp_path / "absent")
+    assert call(handler, setup_state)["result"] == {"value": "from setup"}
+    # Calls no longer copy the state into the module on every request
+    handler.__globals__["value"] = "rebound by the module"
+    assert call(handler, setup_state)["result"] == {"value": "rebound by the module"}
+    assert setup_state.users == 0
+    setup_state.retire()
+
+
+def test_state_is_bound_when_a_failed_setup_is_retried(tmp_path):
+    marker = tmp_path / "fail"
+    marker.touch()
+    setup_state, handler = load(SOURCE, marker)
+    assert setup_state.state is None
+    assert "value" not in handler.__globals__
+    assert call(handler, setup_state)["result"] == {"value": "from setup"}
+    assert setup_state.users == 0
+    setup_state.retire()